@@ -0,0 +1,294 @@
+"""Benchmarks for the MCC agent.
+
+Usage:
+    python benchmark.py server [--idle 200] [--clients 8] [--requests 500]
+    python benchmark.py serializer [--samples 2000]
+    python benchmark.py cipher [--megabytes 64]
+    python benchmark.py roundtrip
+"""
+import argparse
+import logging
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+from protocol import (CIPHER_IDS, COMPRESS_THRESHOLD, COMPRESSIONS, ENCODINGS, MessageChannel, client_handshake,
+                      new_stream_key, stream_cipher)
+
+
+def free_port():
+    """Pick a free loopback port for a benchmark server"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def open_connection(port):
+    """Connect to a local agent and return (socket, channel)"""
+    sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+    return sock, client_handshake(sock)
+
+
+def local_agent(port, scratch):
+    """An agent on loopback whose task journal is kept in the `scratch` directory.
+
+    The default journal belongs to the agent installed on this host, and
+    replaying it would run that agent's scheduled tasks.
+    """
+    from server import MCCServer
+
+    return MCCServer(host='127.0.0.1', port=port, task_journal=os.path.join(scratch, 'scheduled_tasks.jsonl'))
+
+
+def run_client(port, requests, latencies):
+    """Send system_info requests back to back and record each round trip"""
+    sock, channel = open_connection(port)
+    try:
+        for request_id in range(requests):
+            started = time.perf_counter()
+            channel.send_message(sock, {'id': request_id, 'type': 'system_info', 'data': {}})
+            channel.recv_message(sock)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        sock.close()
+
+
+def bench_server_mode(mode, idle, clients, requests, idle_seconds, scratch):
+    port = free_port()
+    server = local_agent(port, scratch)
+    # Shutdown noise from the agent would interleave with the results table
+    logging.disable(logging.CRITICAL)
+
+    threads_before = threading.active_count()
+    target = server.start_async if mode == 'async' else server.start
+    threading.Thread(target=target, daemon=True).start()
+    time.sleep(0.5)
+
+    # Idle controllers only hold a connection open
+    idle_connections = [open_connection(port) for _ in range(idle)]
+    time.sleep(0.5)
+
+    # CPU spent by the agent while every connection sits idle
+    cpu_before = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = time.process_time() - cpu_before
+    server_threads = threading.active_count() - threads_before
+
+    latencies = []
+    workers = [threading.Thread(target=run_client, args=(port, requests, latencies))
+               for _ in range(clients)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    for sock, _ in idle_connections:
+        sock.close()
+    server.stop()
+    # Let handler threads notice the shutdown before the next mode is measured
+    time.sleep(2)
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'threads': server_threads,
+        'idle_cpu_ms': idle_cpu * 1000,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000
+    }
+
+
+def bench_server(args):
+    """Compare the threaded and asyncio agents on loopback"""
+    print(f"{args.idle} idle connections, {args.clients} clients x {args.requests} requests")
+    print(f"{'mode':<10}{'threads':>9}{'idle cpu ms':>13}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    with tempfile.TemporaryDirectory(prefix='mcc-bench-') as scratch:
+        for mode in ('threaded', 'async'):
+            result = bench_server_mode(mode, args.idle, args.clients, args.requests, args.idle_seconds, scratch)
+            print(f"{result['mode']:<10}{result['threads']:>9}{result['idle_cpu_ms']:>13.1f}"
+                  f"{result['requests_per_sec']:>10.0f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+
+
+def hardware_sample():
+    """Build a hardware_monitor reply from live psutil data, as the agent does"""
+    import psutil
+
+    disk_usage = {}
+    for partition in psutil.disk_partitions(all=False):
+        try:
+            disk_usage[partition.mountpoint] = dict(psutil.disk_usage(partition.mountpoint)._asdict())
+        except OSError:
+            continue
+
+    return {
+        'id': 1,
+        'status': 'success',
+        'data': {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_usage': dict(psutil.virtual_memory()._asdict()),
+            'disk_usage': disk_usage,
+            'network_io': dict(psutil.net_io_counters()._asdict())
+        }
+    }
+
+
+class PlainCipher:
+    """Identity cipher so serializer cost is measured on its own"""
+
+    overhead = 0
+
+    def encrypt(self, data, associated_data=None):
+        return bytes(data)
+
+    def decrypt(self, data, associated_data=None):
+        return data
+
+
+def bench_serializer(args):
+    """Compare JSON, msgpack and the telemetry struct layout on real psutil samples"""
+    from cryptography.fernet import Fernet
+
+    samples = []
+    for _ in range(50):
+        samples.append(hardware_sample())
+        time.sleep(0.01)
+
+    fernet = Fernet(Fernet.generate_key())
+    configs = [(encoding, telemetry) for encoding in ENCODINGS for telemetry in (False, True)]
+
+    print(f"{args.samples} samples, {len(samples)} distinct psutil payloads")
+    print(f"{'encoding':<20}{'bytes':>8}{'fernet bytes':>14}{'aead bytes':>12}{'encode us':>11}{'decode us':>11}")
+    for encoding, telemetry in configs:
+        sender = MessageChannel(PlainCipher())
+        receiver = MessageChannel(PlainCipher())
+        for channel in (sender, receiver):
+            channel.configure({'encoding': encoding, 'telemetry': telemetry})
+
+        encoded_bytes = fernet_bytes = 0
+        encode_time = decode_time = 0.0
+        for index in range(args.samples):
+            message = samples[index % len(samples)]
+
+            started = time.perf_counter()
+            flags, payload = sender.encode(message, telemetry=True)
+            encode_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            receiver.decode(flags, payload)
+            decode_time += time.perf_counter() - started
+
+            encoded_bytes += len(payload)
+            if index < 200:
+                fernet_bytes += len(fernet.encrypt(payload))
+
+        name = encoding + ('+telemetry' if telemetry else '')
+        print(f"{name:<20}{encoded_bytes / args.samples:>8.0f}"
+              f"{fernet_bytes / min(args.samples, 200):>14.0f}"
+              f"{encoded_bytes / args.samples + 16:>12.0f}"
+              f"{encode_time / args.samples * 1e6:>11.1f}{decode_time / args.samples * 1e6:>11.1f}")
+
+
+def bench_cipher(args):
+    """Throughput of the AEAD session ciphers against the old Fernet path"""
+    from cryptography.fernet import Fernet
+
+    # Payload sizes of an input event, a command channel chunk and a screen frame
+    sizes = [('input event', 6, 100000), ('command chunk', 64 * 1024, None), ('screen frame', 256 * 1024, None)]
+
+    print(f"{'cipher':<20}{'payload':<15}{'overhead B':>11}{'encrypt MB/s':>14}{'decrypt MB/s':>14}")
+    for label, size, rounds in sizes:
+        payload = os.urandom(size)
+        rounds = rounds or max(args.megabytes * 1024 * 1024 // size, 1)
+
+        fernet = Fernet(Fernet.generate_key())
+        ciphers = [('fernet', fernet, fernet)]
+        for name in CIPHER_IDS:
+            # Fresh pair per run, the receiver's frame counter must match the sender's
+            key, salt = new_stream_key(), os.urandom(16)
+            ciphers.append((name, stream_cipher(key, salt, is_server=True, cipher=name),
+                            stream_cipher(key, salt, is_server=False, cipher=name)))
+
+        for name, sender, receiver in ciphers:
+            started = time.perf_counter()
+            tokens = [sender.encrypt(payload) for _ in range(rounds)]
+            encrypt_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for token in tokens:
+                receiver.decrypt(token)
+            decrypt_time = time.perf_counter() - started
+
+            megabytes = size * rounds / (1024 * 1024)
+            print(f"{name:<20}{label:<15}{len(tokens[0]) - size:>11}"
+                  f"{megabytes / encrypt_time:>14.1f}{megabytes / decrypt_time:>14.1f}")
+
+
+def check_roundtrip(args):
+    """Send messages above the compression threshold through every codec and a live agent"""
+    message = {'id': 1, 'type': 'system_info', 'data': {'padding': 'x' * (COMPRESS_THRESHOLD * 64)}}
+    for encoding in ENCODINGS:
+        for compression in COMPRESSIONS:
+            sender = MessageChannel(PlainCipher())
+            receiver = MessageChannel(PlainCipher())
+            for channel in (sender, receiver):
+                channel.configure({'encoding': encoding, 'compression': compression})
+            flags, payload = sender.encode(message)
+            assert sender.stats['compressed_messages'] == 1, f"{encoding}+{compression} did not compress"
+            assert receiver.decode(flags, payload) == message, f"{encoding}+{compression} round trip differs"
+            print(f"{encoding}+{compression}: {len(payload)} bytes, ok")
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(prefix='mcc-bench-') as scratch:
+        for mode in ('threaded', 'async'):
+            port = free_port()
+            server = local_agent(port, scratch)
+            threading.Thread(target=server.start_async if mode == 'async' else server.start, daemon=True).start()
+            time.sleep(0.5)
+
+            sock, channel = open_connection(port)
+            try:
+                assert channel.compression, "agent did not negotiate compression"
+                # The agent has to decompress the large request to answer it
+                channel.send_message(sock, message)
+                assert channel.recv_message(sock).get('status') == 'success'
+                assert channel.stats['compressed_messages'] >= 1
+                print(f"{mode} agent with {channel.compression}: ok")
+            finally:
+                sock.close()
+                server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCC benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    server_parser = subparsers.add_parser('server', help="threaded vs asyncio agent")
+    server_parser.add_argument('--idle', type=int, default=200)
+    server_parser.add_argument('--clients', type=int, default=8)
+    server_parser.add_argument('--requests', type=int, default=500)
+    server_parser.add_argument('--idle-seconds', type=float, default=5.0)
+    server_parser.set_defaults(func=bench_server)
+
+    serializer_parser = subparsers.add_parser('serializer', help="telemetry encodings")
+    serializer_parser.add_argument('--samples', type=int, default=2000)
+    serializer_parser.set_defaults(func=bench_serializer)
+
+    cipher_parser = subparsers.add_parser('cipher', help="AEAD session cipher vs Fernet")
+    cipher_parser.add_argument('--megabytes', type=int, default=64)
+    cipher_parser.set_defaults(func=bench_cipher)
+
+    roundtrip_parser = subparsers.add_parser('roundtrip', help="check compressed messages end to end")
+    roundtrip_parser.set_defaults(func=check_roundtrip)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
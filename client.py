@@ -1,18 +1,33 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import customtkinter as ctk
 import socket
 import json
+import os
+import base64
 import threading
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
 import time
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 import cv2
 import numpy as np
 from PIL import Image, ImageTk
 import struct
+import itertools
+import hashlib
+import bisect
+import re
+import math
+from array import array
+import asyncio
+import queue
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from protocol import STREAM_SALT_SIZE, client_handshake_async, recv_exact, stream_cipher
+
+NAN = float('nan')
 
 
 class ToastNotification:
@@ -91,7 +106,944 @@ class ToastNotification:
             self._show_next_notification()
 
 
+class HostConnection:
+    """State of one agent connection, owned by the FleetManager loop"""
+
+    def __init__(self, connection_id, host, port):
+        self.connection_id = connection_id
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.channel = None
+        self.connected = False
+        self.pending = {}
+        self.request_ids = itertools.count(1)
+        self.task = None
+
+        # Jobs awaited by a fan-out: job id -> future set when the job exits
+        self.job_waiters = {}
+
+        # Last synced software inventory, kept across reconnects so only changes are fetched
+        self.inventory_token = None
+        self.inventory = {}
+        self.inventory_index = None
+
+
+class FleetManager:
+    """Owns every agent connection on a single background asyncio loop.
+
+    Connects and reconnects all hosts without a thread per host, and
+    subscribes each one to pushed telemetry instead of polling it. The GUI
+    talks to it through the thread-safe submit()/add_host()/remove_host()
+    calls and receives results as (kind, connection_id, payload) tuples on
+    the events queue.
+    """
+
+    CONNECT_TIMEOUT = 3.0
+    RECONNECT_DELAYS = (1, 2, 5, 10, 30)
+
+    # Telemetry pushed by every agent; a connection that stays silent for
+    # several intervals is treated as dead
+    TELEMETRY_INTERVAL = 2.0
+    IDLE_TIMEOUT = 3 * TELEMETRY_INTERVAL + 5
+
+    # Agent-side history fetched on every (re)connect to fill the trend charts
+    HISTORY_SECONDS = 3600
+    HISTORY_POINTS = 360
+    HISTORY_METRICS = ['cpu_percent', 'memory_percent']
+
+    # Inventories are collected from every host in the background for the fleet index
+    INVENTORY_INTERVAL = 900
+    INVENTORY_TIMEOUT = 60
+
+    # Hosts a fan-out talks to at once, and how long each host gets by default
+    FAN_OUT_CONCURRENCY = 16
+    FAN_OUT_TIMEOUT = 30.0
+
+    # File transfers: bytes per chunk, chunks in flight, and how often a
+    # transfer resumes after a dropped connection before giving up
+    FILE_CHUNK_SIZE = 1024 * 1024
+    FILE_WINDOW = 4
+    FILE_RETRIES = 5
+    FILE_TIMEOUT = 60.0
+
+    def __init__(self, events):
+        self.events = events
+        self.hosts = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name='mcc-fleet', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Close every connection and stop the loop"""
+        if self.loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._close_all(), self.loop)
+        try:
+            future.result(timeout=2.0)
+        except Exception as e:
+            logging.error(f"Error closing connections: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # Thread-safe API for the GUI
+
+    def add_host(self, connection_id, host, port):
+        self.loop.call_soon_threadsafe(self._add_host, connection_id, host, port)
+
+    def remove_host(self, connection_id):
+        self.loop.call_soon_threadsafe(self._remove_host, connection_id)
+
+    def refresh_inventory(self, connection_id):
+        """Sync a host's software inventory now and post the result, from any thread"""
+        return asyncio.run_coroutine_threadsafe(self._sync_inventory(connection_id, explicit=True), self.loop)
+
+    def submit(self, connection_id, command_type, data, timeout=10.0):
+        """Schedule a command from any thread and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(
+            self.request(connection_id, command_type, data, timeout), self.loop)
+
+    def upload(self, connection_id, local_path, remote_path):
+        """Send a file to a host from any thread, returns a concurrent.futures.Future of the result"""
+        return asyncio.run_coroutine_threadsafe(self.put_file(connection_id, local_path, remote_path), self.loop)
+
+    def download(self, connection_id, remote_path, local_path):
+        """Fetch a file from a host from any thread, returns a concurrent.futures.Future of the result"""
+        return asyncio.run_coroutine_threadsafe(self.get_file(connection_id, remote_path, local_path), self.loop)
+
+    def fan_out(self, fan_out_id, connection_ids, operation, args=(), timeout=None, concurrency=None):
+        """Run an operation on many hosts at once, from any thread.
+
+        `operation` is 'command' (args: command type and data), 'job' (args:
+        a shell command, waits for it to finish), 'file' (args: local and
+        remote path, uploads the file) or 'inventory'. Each host's
+        outcome is posted as a 'fan_out' event of (fan_out_id, ok, output) as
+        soon as it is known, then 'fan_out_done' once every host has answered.
+        """
+        operations = {
+            'command': self._command_outcome,
+            'job': self._job_outcome,
+            'file': self._upload_outcome,
+            'inventory': self._inventory_outcome
+        }
+        return asyncio.run_coroutine_threadsafe(
+            self._fan_out(fan_out_id, list(connection_ids), operations[operation], args,
+                          timeout or self.FAN_OUT_TIMEOUT, concurrency or self.FAN_OUT_CONCURRENCY),
+            self.loop)
+
+    # Loop side
+
+    def _post(self, kind, connection_id, payload=None):
+        self.events.put((kind, connection_id, payload))
+
+    def _add_host(self, connection_id, host, port):
+        if connection_id in self.hosts:
+            return
+        connection = HostConnection(connection_id, host, port)
+        self.hosts[connection_id] = connection
+        connection.task = self.loop.create_task(self._run_host(connection))
+
+    def _remove_host(self, connection_id):
+        connection = self.hosts.pop(connection_id, None)
+        if connection and connection.task:
+            connection.task.cancel()
+
+    async def _close_all(self):
+        for connection_id in list(self.hosts):
+            self._remove_host(connection_id)
+
+    async def request(self, connection_id, command_type, data, timeout=10.0, allow_compression=True):
+        """Send a command over the host's connection and await its response"""
+        connection = self.hosts.get(connection_id)
+        if not connection or not connection.connected:
+            raise ConnectionError(f"{connection_id} is not connected")
+
+        request_id = next(connection.request_ids)
+        future = self.loop.create_future()
+        connection.pending[request_id] = future
+        try:
+            connection.writer.writelines(connection.channel.pack_message({
+                'id': request_id,
+                'type': command_type,
+                'data': data
+            }, allow_compression=allow_compression))
+            await connection.writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            connection.pending.pop(request_id, None)
+
+    async def _run_host(self, connection):
+        """Keep one host connected, reconnecting with backoff until it is removed"""
+        attempt = 0
+        try:
+            while True:
+                try:
+                    await self._connect(connection)
+                    attempt = 0
+                    self._post('status', connection.connection_id, "Connected")
+
+                    setup_task = self.loop.create_task(self._start_session(connection))
+                    inventory_task = self.loop.create_task(self._refresh_inventory(connection))
+                    try:
+                        await self._read_responses(connection)
+                    finally:
+                        setup_task.cancel()
+                        inventory_task.cancel()
+
+                    self._post('status', connection.connection_id, "Disconnected")
+
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    if attempt == 0:
+                        if isinstance(e, asyncio.TimeoutError):
+                            error_msg = "Connection timed out"
+                        elif isinstance(e, ConnectionRefusedError):
+                            error_msg = "Connection refused"
+                        else:
+                            error_msg = f"Connection error: {str(e)}"
+                        self._post('toast', connection.connection_id,
+                                   (f"{error_msg} for {connection.host}:{connection.port}", "error"))
+                    self._post('status', connection.connection_id, "Failed")
+                finally:
+                    self._disconnect(connection)
+
+                delay = self.RECONNECT_DELAYS[min(attempt, len(self.RECONNECT_DELAYS) - 1)]
+                attempt += 1
+                await asyncio.sleep(delay)
+                self._post('status', connection.connection_id, "Reconnecting...")
+
+        except asyncio.CancelledError:
+            self._disconnect(connection)
+
+    async def _connect(self, connection):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(connection.host, connection.port), self.CONNECT_TIMEOUT)
+        connection.reader, connection.writer = reader, writer
+        connection.channel = await asyncio.wait_for(
+            client_handshake_async(reader, writer), self.CONNECT_TIMEOUT)
+        connection.connected = True
+
+    def _disconnect(self, connection):
+        connection.connected = False
+        if connection.writer is not None:
+            connection.writer.close()
+            connection.writer = None
+
+        pending, connection.pending = connection.pending, {}
+        waiters, connection.job_waiters = connection.job_waiters, {}
+        for future in list(pending.values()) + list(waiters.values()):
+            if not future.done():
+                future.set_exception(ConnectionError("Connection lost"))
+
+    async def _read_responses(self, connection):
+        """Route every response to the request waiting for it and post pushed events"""
+        try:
+            while True:
+                message = await asyncio.wait_for(
+                    connection.channel.read_message(connection.reader), self.IDLE_TIMEOUT)
+
+                if message.get('event'):
+                    waiter = self._job_waiter(connection, message)
+                    if waiter is None:
+                        self._post(message['event'], connection.connection_id, message.get('data'))
+                    elif message['event'] == 'job_exit' and not waiter.done():
+                        waiter.set_result(message['data'])
+                    continue
+
+                future = connection.pending.pop(message.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except asyncio.TimeoutError:
+            logging.warning(f"No data from {connection.connection_id} in {self.IDLE_TIMEOUT}s, reconnecting")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except InvalidTag:
+            logging.error(f"Decryption error on {connection.connection_id}")
+
+    @staticmethod
+    def _job_waiter(connection, message):
+        """Future of the fan-out waiting on the job an event is about, if any"""
+        if message['event'] not in ('job_output', 'job_exit') or not connection.job_waiters:
+            return None
+        return connection.job_waiters.get((message.get('data') or {}).get('job'))
+
+    async def _fan_out(self, fan_out_id, connection_ids, operation, args, timeout, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(connection_id):
+            async with semaphore:
+                try:
+                    ok, output = await asyncio.wait_for(operation(connection_id, *args), timeout)
+                except asyncio.TimeoutError:
+                    ok, output = False, f"No response within {timeout:g}s"
+                except Exception as e:
+                    ok, output = False, str(e) or type(e).__name__
+            self._post('fan_out', connection_id, (fan_out_id, ok, output))
+
+        await asyncio.gather(*(run_one(connection_id) for connection_id in connection_ids))
+        self._post('fan_out_done', None, fan_out_id)
+
+    async def _command_outcome(self, connection_id, command_type, data):
+        response = await self.request(connection_id, command_type, data, timeout=None)
+        if response.get('status') != 'success':
+            return False, response.get('message', 'Unknown error')
+        if response.get('data') is None:
+            return True, response.get('message', '')
+        return True, json.dumps(response['data'], sort_keys=True, default=str)
+
+    async def _job_outcome(self, connection_id, command):
+        """Run a shell command as a job and wait for its exit code and output"""
+        response = await self.request(connection_id, 'execute_command', {'command': command, 'stream': False},
+                                      timeout=None)
+        if response.get('status') != 'success':
+            return False, response.get('message', 'Unknown error')
+
+        job_id = response['data']['job']
+        connection = self.hosts[connection_id]
+        connection.job_waiters[job_id] = exited = self.loop.create_future()
+        try:
+            # Following the job makes the agent push its exit to us
+            response = await self.request(connection_id, 'job_tail', {'job': job_id, 'follow': True}, timeout=None)
+            if response.get('status') == 'success' and response['data']['status'] in ('running', 'queued'):
+                await exited
+                response = await self.request(connection_id, 'job_tail', {'job': job_id}, timeout=None)
+        except asyncio.CancelledError:
+            # Timed out, don't leave the command running on the host
+            self.loop.create_task(self._cancel_job(connection_id, job_id))
+            raise
+        finally:
+            connection.job_waiters.pop(job_id, None)
+
+        if response.get('status') != 'success':
+            return False, response.get('message', 'Unknown error')
+        result = response['data']
+        output = ''.join(chunk['text'] for chunk in result['chunks'])
+        if result['return_code']:
+            output += f"\n[exit code {result['return_code']}]"
+        return result['status'] == 'exited' and result['return_code'] == 0, output
+
+    async def _cancel_job(self, connection_id, job_id):
+        try:
+            await self.request(connection_id, 'job_cancel', {'job': job_id})
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+    async def _inventory_outcome(self, connection_id):
+        response = await self._sync_inventory(connection_id)
+        if response.get('status') != 'success':
+            return False, response.get('message', 'Unknown error')
+
+        # Hosts with exactly the same software end up in one group
+        inventory = self.hosts[connection_id].inventory
+        digest = hashlib.sha1(json.dumps(sorted(inventory.items())).encode()).hexdigest()
+        return True, f"{len(inventory)} programs ({digest[:8]})"
+
+    async def _upload_outcome(self, connection_id, local_path, remote_path):
+        response = await self.put_file(connection_id, local_path, remote_path)
+        if response.get('status') != 'success':
+            return False, response.get('message', 'Unknown error')
+        return True, f"{format_bytes(response['data']['size'])} written to {response['data']['path']}"
+
+    async def put_file(self, connection_id, local_path, remote_path):
+        """Upload a file in checksummed chunks, resuming after a dropped connection"""
+        for attempt in range(self.FILE_RETRIES):
+            try:
+                return await self._put_file(connection_id, local_path, remote_path)
+            except ConnectionError as e:
+                if attempt == self.FILE_RETRIES - 1:
+                    raise
+                logging.warning(f"Upload to {connection_id} interrupted ({str(e)}), resuming")
+                await self._wait_connected(connection_id)
+
+    async def get_file(self, connection_id, remote_path, local_path):
+        """Download a file in checksummed chunks, resuming after a dropped connection"""
+        for attempt in range(self.FILE_RETRIES):
+            try:
+                return await self._get_file(connection_id, remote_path, local_path)
+            except ConnectionError as e:
+                if attempt == self.FILE_RETRIES - 1:
+                    raise
+                logging.warning(f"Download from {connection_id} interrupted ({str(e)}), resuming")
+                await self._wait_connected(connection_id)
+
+    async def _wait_connected(self, connection_id):
+        waited = 0
+        while True:
+            connection = self.hosts.get(connection_id)
+            if connection is None:
+                raise ConnectionError(f"{connection_id} was removed")
+            if connection.connected:
+                return
+            if waited >= self.FILE_TIMEOUT:
+                raise ConnectionError(f"{connection_id} did not reconnect")
+            await asyncio.sleep(1)
+            waited += 1
+
+    async def _put_file(self, connection_id, local_path, remote_path):
+        size = os.path.getsize(local_path)
+        response = await self.request(connection_id, 'file_put', {'path': remote_path}, self.FILE_TIMEOUT)
+        if response.get('status') != 'success':
+            return response
+        received = response['data']['received']
+        if received > size:
+            # Left over from a different file
+            await self.request(connection_id, 'file_put', {'path': remote_path, 'restart': True}, self.FILE_TIMEOUT)
+            received = 0
+
+        # Chunks land out of order; with at most FILE_WINDOW in flight, everything
+        # a full window before the end of the part is known to be complete
+        offset = max(received // self.FILE_CHUNK_SIZE - self.FILE_WINDOW, 0) * self.FILE_CHUNK_SIZE
+        binary = self.hosts[connection_id].channel.encoding == 'msgpack'
+        digest = hashlib.sha256()
+        in_flight = deque()
+        try:
+            with open(local_path, 'rb') as source:
+                # What the agent already holds still counts towards the file checksum
+                position = 0
+                while position < offset:
+                    position += len(await self.loop.run_in_executor(
+                        None, self._read_chunk, source, digest, min(self.FILE_CHUNK_SIZE, offset - position)))
+
+                while offset < size:
+                    chunk = await self.loop.run_in_executor(None, self._read_chunk, source, digest,
+                                                            self.FILE_CHUNK_SIZE)
+                    if len(in_flight) >= self.FILE_WINDOW:
+                        self._check_chunk(await in_flight.popleft())
+                    in_flight.append(self.loop.create_task(self.request(connection_id, 'file_put', {
+                        'path': remote_path,
+                        'offset': offset,
+                        'chunk': chunk if binary else base64.b64encode(chunk).decode('ascii'),
+                        'sha256': hashlib.sha256(chunk).hexdigest()
+                    }, self.FILE_TIMEOUT, allow_compression=False)))
+                    offset += len(chunk)
+
+            while in_flight:
+                self._check_chunk(await in_flight.popleft())
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        # The agent hashes the whole file before moving it into place
+        return await self.request(connection_id, 'file_put', {
+            'path': remote_path,
+            'commit': True,
+            'size': size,
+            'sha256': digest.hexdigest()
+        }, self.FILE_TIMEOUT + size / (20 * 1024 * 1024))
+
+    async def _get_file(self, connection_id, remote_path, local_path):
+        part_path = local_path + '.part'
+        # Size and mtime of the file version the part was started from
+        version_path = part_path + '.json'
+        # Chunks are written in order, so the part on disk is always complete
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        binary = self.hosts[connection_id].channel.encoding == 'msgpack'
+
+        def fetch(position):
+            return self.loop.create_task(self.request(connection_id, 'file_get', {
+                'path': remote_path,
+                'offset': position,
+                'length': self.FILE_CHUNK_SIZE,
+                'binary': binary
+            }, self.FILE_TIMEOUT))
+
+        # The first reply tells the size, and the version later chunks must come from
+        first = self._check_chunk(await fetch(offset))
+        size, mtime = first['size'], first['mtime']
+        if offset and self._read_version(version_path) != {'size': size, 'mtime': mtime}:
+            # The part holds another version of the file
+            offset = 0
+            first = self._check_chunk(await fetch(0))
+            size, mtime = first['size'], first['mtime']
+        if not offset:
+            with open(version_path, 'w') as version:
+                json.dump({'size': size, 'mtime': mtime}, version)
+
+        in_flight = deque()
+        position = offset + self.FILE_CHUNK_SIZE
+        try:
+            with open(part_path, 'ab' if offset else 'wb') as target:
+                data = first
+                while True:
+                    chunk = data['chunk'] if binary else base64.b64decode(data['chunk'])
+                    if hashlib.sha256(chunk).hexdigest() != data['sha256']:
+                        raise ValueError(f"Checksum mismatch in chunk at {data['offset']}")
+                    if (data['size'], data['mtime']) != (size, mtime):
+                        raise ValueError(f"{remote_path} changed during the transfer")
+                    await self.loop.run_in_executor(None, target.write, chunk)
+
+                    while position < size and len(in_flight) < self.FILE_WINDOW:
+                        in_flight.append(fetch(position))
+                        position += self.FILE_CHUNK_SIZE
+                    if not in_flight:
+                        break
+                    data = self._check_chunk(await in_flight.popleft())
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        # The agent hashes the whole file, as the chunks may still come from two versions of it
+        remote = self._check_chunk(await self.request(connection_id, 'file_get', {
+            'path': remote_path,
+            'checksum': True
+        }, self.FILE_TIMEOUT + size / (20 * 1024 * 1024)))
+        sha256 = await self.loop.run_in_executor(None, self._file_sha256, part_path)
+        if (remote['size'], remote['mtime'], remote['sha256']) != (size, mtime, sha256):
+            os.remove(part_path)
+            os.remove(version_path)
+            raise ValueError(f"File checksum mismatch for {remote_path}, download discarded")
+
+        os.replace(part_path, local_path)
+        os.remove(version_path)
+        return {'status': 'success', 'data': {'path': local_path, 'size': size}}
+
+    @staticmethod
+    def _read_version(version_path):
+        try:
+            with open(version_path) as version:
+                return json.load(version)
+        except (OSError, ValueError):
+            return None
+
+    def _file_sha256(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            while True:
+                chunk = source.read(self.FILE_CHUNK_SIZE)
+                if not chunk:
+                    return digest.hexdigest()
+                digest.update(chunk)
+
+    @staticmethod
+    def _read_chunk(source, digest, length):
+        chunk = source.read(length)
+        digest.update(chunk)
+        return chunk
+
+    @staticmethod
+    def _check_chunk(response):
+        if response.get('status') != 'success':
+            raise ValueError(response.get('message', 'Unknown error'))
+        return response.get('data')
+
+    async def _start_session(self, connection):
+        """Fetch system info and recent history once, then let the agent push telemetry"""
+        try:
+            response = await self.request(connection.connection_id, 'system_info', {})
+            if response.get('status') == 'success':
+                self._post('system_info', connection.connection_id, response['data'])
+
+            response = await self.request(connection.connection_id, 'metrics_history', {
+                'seconds': self.HISTORY_SECONDS,
+                'points': self.HISTORY_POINTS,
+                'metrics': self.HISTORY_METRICS
+            })
+            if response.get('status') == 'success':
+                self._post('history', connection.connection_id, response['data'])
+
+            response = await self.request(connection.connection_id, 'subscribe', {
+                'interval': self.TELEMETRY_INTERVAL
+            })
+            if response.get('status') != 'success':
+                logging.error(f"Telemetry subscription failed for {connection.connection_id}: "
+                              f"{response.get('message')}")
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logging.warning(f"Session setup failed for {connection.connection_id}: {str(e)}")
+
+    async def _refresh_inventory(self, connection):
+        """Sync the host's software inventory now and every INVENTORY_INTERVAL"""
+        while True:
+            await self._sync_inventory(connection.connection_id)
+            await asyncio.sleep(self.INVENTORY_INTERVAL)
+
+    async def _sync_inventory(self, connection_id, explicit=False):
+        """Bring the local copy of a host's inventory up to date and post the new index.
+
+        The agent is sent the token of the copy we hold, so it usually answers
+        with "unchanged" or a small delta. Unchanged results and errors are
+        only posted for an explicit refresh; either way the outcome is returned.
+        """
+        connection = self.hosts.get(connection_id)
+        if connection is None:
+            return {'status': 'error', 'message': f"{connection_id} is not connected"}
+
+        try:
+            data = {'since': connection.inventory_token} if connection.inventory_token else {}
+            response = await self.request(connection_id, 'software_inventory', data,
+                                          timeout=self.INVENTORY_TIMEOUT)
+            if response.get('status') != 'success':
+                self._post('software_inventory', connection_id, response)
+                return response
+
+            result = response['data']
+            if result.get('unchanged'):
+                update = {
+                    'status': 'success',
+                    'index': connection.inventory_index,
+                    'unchanged': True
+                }
+                if explicit:
+                    self._post('software_inventory', connection_id, update)
+                return update
+
+            if 'delta' in result:
+                delta = result['delta']
+                for name in delta['removed']:
+                    connection.inventory.pop(name, None)
+                for software in delta['added'] + delta['updated']:
+                    connection.inventory[software['name']] = software['version']
+
+                if len(connection.inventory) != result.get('total'):
+                    # Our copy drifted from the agent's, start over with the full list
+                    logging.warning(f"Inventory delta mismatch for {connection_id}, fetching full list")
+                    connection.inventory_token = None
+                    return await self._sync_inventory(connection_id, explicit)
+            else:
+                connection.inventory = {software['name']: software['version'] for software in result['items']}
+            connection.inventory_token = result.get('token')
+
+            items = [{'name': name, 'version': connection.inventory[name]}
+                     for name in sorted(connection.inventory, key=str.lower)]
+            # Indexing thousands of names would stall the loop, build it on a worker thread
+            connection.inventory_index = await self.loop.run_in_executor(None, SoftwareIndex, items)
+            update = {
+                'status': 'success',
+                'index': connection.inventory_index
+            }
+            self._post('software_inventory', connection_id, update)
+            return update
+
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logging.warning(f"Inventory refresh failed for {connection_id}: {str(e)}")
+            failure = {
+                'status': 'error',
+                'message': str(e) or "No response from server"
+            }
+            if explicit:
+                self._post('software_inventory', connection_id, failure)
+            return failure
+
+
+class TimeSeriesStore:
+    """Columnar telemetry history of every host, kept on the Tk thread.
+
+    Each host is a table with one array('d') timestamp column and one
+    array('d') column per metric, so a sample costs a few doubles. Rows
+    older than `retention` seconds are dropped; trimming only moves a start
+    offset and the arrays are compacted once half of them is stale.
+    """
+
+    def __init__(self, retention=3600.0):
+        self.retention = retention
+        self.tables = {}
+
+    def _table(self, host):
+        table = self.tables.get(host)
+        if table is None:
+            table = self.tables[host] = {
+                'timestamps': array('d'),
+                'columns': {},
+                'start': 0,
+                'network': None
+            }
+        return table
+
+    def remove_host(self, host):
+        self.tables.pop(host, None)
+
+    def ingest(self, host, sample):
+        """Add one hardware sample, using the agent's network rates or diffing its totals"""
+        timestamp = sample.get('timestamp') or time.time()
+        table = self._table(host)
+
+        values = {}
+        if isinstance(sample.get('cpu_percent'), (int, float)):
+            values['cpu_percent'] = sample['cpu_percent']
+        memory = sample.get('memory_usage')
+        if isinstance(memory, dict) and isinstance(memory.get('percent'), (int, float)):
+            values['memory_percent'] = memory['percent']
+        for mountpoint, usage in (sample.get('disk_usage') or {}).items():
+            if isinstance(usage, dict) and 'percent' in usage:
+                values[f'disk:{mountpoint}'] = usage['percent']
+
+        network = sample.get('network_io')
+        rates = sample.get('network_rates')
+        if isinstance(rates, dict):
+            # Agents that compute rates themselves save us diffing their counters
+            values['net_sent'] = sum(nic.get('bytes_sent_per_sec', 0) for nic in rates.values())
+            values['net_recv'] = sum(nic.get('bytes_recv_per_sec', 0) for nic in rates.values())
+        elif isinstance(network, dict):
+            previous = table['network']
+            if previous is not None and timestamp > previous[0]:
+                elapsed = timestamp - previous[0]
+                values['net_sent'] = max(network.get('bytes_sent', 0) - previous[1].get('bytes_sent', 0), 0) / elapsed
+                values['net_recv'] = max(network.get('bytes_recv', 0) - previous[1].get('bytes_recv', 0), 0) / elapsed
+            table['network'] = (timestamp, network)
+
+        self._append(table, timestamp, values)
+
+    def ingest_history(self, host, history):
+        """Fill in rows from a metrics_history reply that the table does not cover yet"""
+        table = self._table(host)
+        timestamps = table['timestamps']
+        first = timestamps[table['start']] if len(timestamps) > table['start'] else None
+        last = timestamps[-1] if len(timestamps) else None
+
+        series = history.get('series', {})
+        rows = []
+        for index, timestamp in enumerate(history.get('timestamps', [])):
+            values = {name: buckets['mean'][index] for name, buckets in series.items()
+                      if buckets['mean'][index] is not None}
+            rows.append((timestamp, values))
+
+        older = [row for row in rows if first is not None and row[0] < first]
+        if older:
+            # Rebuild the table with the older rows in front
+            current = self.rows(host)
+            network = table['network']
+            del self.tables[host]
+            table = self._table(host)
+            table['network'] = network
+            for timestamp, values in older + current:
+                self._append(table, timestamp, values)
+
+        for timestamp, values in rows:
+            if last is None or timestamp > last:
+                self._append(table, timestamp, values)
+
+    def rows(self, host):
+        """Every retained row of a host as (timestamp, {metric: value})"""
+        table = self.tables.get(host)
+        if table is None:
+            return []
+        start = table['start']
+        columns = table['columns']
+        return [(timestamp, {name: column[start + index] for name, column in columns.items()
+                             if not math.isnan(column[start + index])})
+                for index, timestamp in enumerate(table['timestamps'][start:])]
+
+    def _append(self, table, timestamp, values):
+        timestamps = table['timestamps']
+        if len(timestamps) > table['start'] and timestamp <= timestamps[-1]:
+            # Same snapshot seen twice, e.g. a pushed sample and a refresh
+            return
+
+        length = len(timestamps)
+        timestamps.append(timestamp)
+        columns = table['columns']
+        for name, column in columns.items():
+            column.append(values.get(name, NAN))
+        for name in values.keys() - columns.keys():
+            column = columns[name] = array('d', [NAN]) * length
+            column.append(values[name])
+
+        self._trim(table)
+
+    def _trim(self, table):
+        timestamps = table['timestamps']
+        cutoff = timestamps[-1] - self.retention
+        start = table['start']
+        while start < len(timestamps) and timestamps[start] < cutoff:
+            start += 1
+
+        if start > len(timestamps) // 2:
+            del timestamps[:start]
+            for column in table['columns'].values():
+                del column[:start]
+            start = 0
+        table['start'] = start
+
+    def series(self, host, metric, seconds=None):
+        """(timestamps, values) of one metric, optionally only the last `seconds`"""
+        table = self.tables.get(host)
+        if table is None or metric not in table['columns']:
+            return [], []
+
+        timestamps = table['timestamps']
+        start = table['start']
+        if seconds is not None and len(timestamps) > start:
+            start = bisect.bisect_left(timestamps, timestamps[-1] - seconds, start)
+
+        column = table['columns'][metric]
+        return timestamps[start:].tolist(), column[start:].tolist()
+
+    def metrics(self, host):
+        table = self.tables.get(host)
+        return sorted(table['columns']) if table else []
+
+
+def version_key(version):
+    """Sort key comparing versions number by number, '10.0' after '9.1'"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version.lower())]
+
+
+class SoftwareIndex:
+    """Inventory of one host with a lowercase n-gram index for substring search.
+
+    Every 1-, 2- and 3-gram of each name and version maps to the set of
+    programs containing it. A search intersects the posting sets of the
+    term's trigrams and only checks those candidates. A search that extends
+    the previous term refines its result instead of going back to the index.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, items):
+        self.items = [item for item in items if isinstance(item, dict)]
+        self.texts = [f"{item.get('name', '')}\n{item.get('version', '')}".lower() for item in self.items]
+        self.grams = {}
+        for position, text in enumerate(self.texts):
+            for size in range(1, self.GRAM_SIZE + 1):
+                for start in range(len(text) - size + 1):
+                    self.grams.setdefault(text[start:start + size], set()).add(position)
+
+        self.ranks = {}
+        self.last_term = None
+        self.last_matches = None
+
+    def search(self, term):
+        """Positions of the programs whose name or version contains term"""
+        term = term.lower()
+        if not term:
+            matches = range(len(self.items))
+        elif self.last_term and term.startswith(self.last_term):
+            # Typing one more character only narrows the previous result
+            matches = [position for position in self.last_matches if term in self.texts[position]]
+        else:
+            size = min(len(term), self.GRAM_SIZE)
+            postings = [self.grams.get(term[start:start + size], set())
+                        for start in range(len(term) - size + 1)]
+            postings.sort(key=len)
+            candidates = set.intersection(*postings)
+            matches = [position for position in candidates if term in self.texts[position]]
+
+        self.last_term, self.last_matches = term, matches
+        return matches
+
+    def sorted_items(self, matches, sort_key='name', descending=False):
+        """Programs at the given positions, in the requested column order"""
+        ranks = self.ranks.get(sort_key)
+        if ranks is None:
+            key = version_key if sort_key == 'version' else str.lower
+            order = sorted(range(len(self.items)), key=lambda position: key(self.items[position].get(sort_key, '')))
+            ranks = self.ranks[sort_key] = [0] * len(order)
+            for rank, position in enumerate(order):
+                ranks[position] = rank
+
+        positions = sorted(matches, key=ranks.__getitem__, reverse=descending)
+        return [self.items[position] for position in positions]
+
+
+class FleetSoftwareIndex:
+    """Inverted index of the software installed across the fleet.
+
+    Maps each program name to {host: version}, so "which machines have X at
+    version Y" is one lookup. A host's entries are replaced whole whenever
+    a new inventory of it arrives.
+    """
+
+    def __init__(self):
+        self.programs = {}
+        self.host_programs = {}
+
+    def update_host(self, host, items):
+        self.remove_host(host)
+        names = set()
+        for item in items:
+            name = item.get('name')
+            if not name:
+                continue
+            self.programs.setdefault(name, {})[host] = item.get('version', 'N/A')
+            names.add(name)
+        self.host_programs[host] = names
+
+    def remove_host(self, host):
+        for name in self.host_programs.pop(host, ()):
+            hosts = self.programs.get(name)
+            if hosts is None:
+                continue
+            hosts.pop(host, None)
+            if not hosts:
+                del self.programs[name]
+
+    def search(self, term=''):
+        """Programs whose name contains term, sorted by name"""
+        term = term.lower()
+        return sorted((name for name in self.programs if term in name.lower()), key=str.lower)
+
+    def versions(self, name):
+        """{version: [hosts]} of one program, most common version first"""
+        versions = {}
+        for host, version in self.programs.get(name, {}).items():
+            versions.setdefault(version, []).append(host)
+        return dict(sorted(versions.items(), key=lambda entry: (-len(entry[1]), version_key(entry[0]))))
+
+
+class FanOutResults:
+    """Outcome of one command sent to many hosts, grouped by identical output.
+
+    Hosts are added as they answer; hosts that answered exactly alike share
+    a group, so a fleet-wide command reads as a few distinct results.
+    """
+
+    def __init__(self, label, view, hosts):
+        self.label = label
+        self.view = view
+        self.total = len(hosts)
+        self.groups = {}
+        self.finished = False
+
+    def add(self, host, ok, output):
+        self.groups.setdefault((ok, output), []).append(host)
+
+    @property
+    def answered(self):
+        return sum(len(hosts) for hosts in self.groups.values())
+
+    def failures(self):
+        """(output, hosts) of every failed group"""
+        return [(output, hosts) for (ok, output), hosts in self.groups.items() if not ok]
+
+    def summary(self):
+        failed = sum(len(hosts) for _, hosts in self.failures())
+        text = f"{self.label}: {self.answered}/{self.total} answered"
+        if failed:
+            text += f", {failed} failed"
+        return text
+
+
 class MCCClient(ctk.CTk):
+    # How often (ms) the GUI drains results posted by background work
+    GUI_EVENT_INTERVAL = 50
+
+    # Rows added to the software tree at a time while scrolling
+    SOFTWARE_PAGE_SIZE = 100
+
+    # Quiet time (ms) after a keystroke before the software list is filtered
+    SEARCH_DEBOUNCE = 150
+
+    # Programs listed at once in the Fleet Software tab
+    FLEET_SOFTWARE_LIMIT = 500
+
+    # Processes tab: refresh period (ms) and how many of the top processes are watched
+    PROCESS_REFRESH = 2000
+    PROCESS_LIMIT = 200
+
+    # Characters of output kept per command job on the client
+    MAX_JOB_OUTPUT = 1024 * 1024
+
+    # Per-host time limit (s) of a command run on, or a file sent to, every computer
+    FAN_OUT_JOB_TIMEOUT = 300
+    FAN_OUT_FILE_TIMEOUT = 3600
+
+    # Time spans selectable for the trend charts, in seconds
+    TREND_WINDOWS = {"5 min": 300, "15 min": 900, "1 hour": 3600}
+
     def __init__(self):
         super().__init__()
 
@@ -103,9 +1055,8 @@ class MCCClient(ctk.CTk):
         self.connections = {}
         self.active_connection = None
 
-        self.last_cpu_percent = None
-        self.last_memory_percent = None
-        self.last_disk_usage = {}
+        # Telemetry of every host, the trend charts are drawn from here
+        self.metrics_store = TimeSeriesStore(retention=FleetManager.HISTORY_SECONDS)
 
         self.title("Multi Computers Control")
         self.geometry("1200x800")
@@ -122,17 +1073,44 @@ class MCCClient(ctk.CTk):
         # Initialize RDP attributes
         self.rdp_active = False
         self.rdp_socket = None
+        self.rdp_cipher = None
         self.rdp_display_thread = None
         self.rdp_connection = None
 
         self.create_gui()
         self.software_loaded_for = None  # Track which connection has loaded software
 
+        # Inventory of each host, searched and sorted locally; rows reach the tree lazily
+        self.software_models = {}
+        self.software_sort = ('name', False)
+        self.software_rows = []
+        self.software_shown = 0
+        self.search_after_id = None
+        self.fleet_software = FleetSoftwareIndex()
+        self.fleet_search_after_id = None
+
+        # Process table of the selected computer, kept current with deltas while its tab is open
+        self.process_view = None
+        self.process_after_id = None
+
+        # Command jobs by (connection_id, job id), their output arrives as events
+        self.jobs = {}
+        self.selected_job = None
+
+        # Commands sent to many computers at once, results arrive host by host
+        self.fan_outs = {}
+        self.fan_out_ids = itertools.count(1)
+        self.command_fan_out = None
+
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
         self.toast = ToastNotification(self)
 
-        self.initialize_monitoring()
+        # All agent connections live on one background loop, results come back through this queue
+        self.gui_events = queue.Queue()
+        self.fleet = FleetManager(self.gui_events)
+        self.fleet.start()
+        self.after(self.GUI_EVENT_INTERVAL, self.process_gui_events)
 
     def create_gui(self):
         """Create the main GUI with connection management"""
@@ -173,6 +1151,9 @@ class MCCClient(ctk.CTk):
 
         self.create_monitoring_tab()
         self.create_software_tab()
+        self.create_fleet_software_tab()
+        self.create_processes_tab()
+        self.create_commands_tab()
         self.create_power_tab()
         self.create_remote_desktop_tab()
 
@@ -213,6 +1194,34 @@ class MCCClient(ctk.CTk):
         self.mem_label = ctk.CTkLabel(self.mem_frame, text="0%")
         self.mem_label.pack(side=tk.LEFT, padx=5)
 
+        # Trend charts drawn from the local metrics store
+        trend_section = ctk.CTkFrame(monitoring_frame)
+        trend_section.pack(fill=tk.X, padx=10, pady=5)
+
+        trend_header = ctk.CTkFrame(trend_section, fg_color="transparent")
+        trend_header.pack(fill=tk.X, pady=(5, 0))
+        ctk.CTkLabel(trend_header, text="Trends:").pack(side=tk.LEFT, padx=5)
+        self.trend_window = ctk.CTkSegmentedButton(
+            trend_header,
+            values=list(self.TREND_WINDOWS),
+            command=lambda _: self.draw_trends()
+        )
+        self.trend_window.set("15 min")
+        self.trend_window.pack(side=tk.RIGHT, padx=5)
+
+        self.trend_canvases = {}
+        for metric, title in (('cpu_percent', "CPU"), ('memory_percent', "Memory"),
+                              ('net_recv', "Network In"), ('net_sent', "Network Out")):
+            row = ctk.CTkFrame(trend_section, fg_color="transparent")
+            row.pack(fill=tk.X, pady=2)
+            ctk.CTkLabel(row, text=title, width=90, anchor="w").pack(side=tk.LEFT, padx=5)
+            canvas = tk.Canvas(row, height=36, bg="#242424", highlightthickness=0, borderwidth=0)
+            canvas.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+            canvas.bind('<Configure>', lambda _: self.draw_trends())
+            summary = ctk.CTkLabel(row, text="", width=170, anchor="e")
+            summary.pack(side=tk.LEFT, padx=5)
+            self.trend_canvases[metric] = (canvas, summary)
+
         # Container frame for disk usage
         self.disk_container = ctk.CTkFrame(monitoring_frame)
         self.disk_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -280,18 +1289,19 @@ class MCCClient(ctk.CTk):
             show="headings"
         )
 
-        # Configure columns
+        # Configure columns, clicking a heading re-sorts the local index
         self.software_tree.heading("Name", text="Software Name",
-                                   command=lambda: self.treeview_sort_column("Name", False))
+                                   command=lambda: self.treeview_sort_column("Name"))
         self.software_tree.heading("Version", text="Version",
-                                   command=lambda: self.treeview_sort_column("Version", False))
+                                   command=lambda: self.treeview_sort_column("Version"))
 
         self.software_tree.column("Name", width=400, minwidth=200)
         self.software_tree.column("Version", width=150, minwidth=100)
 
-        # Create and configure scrollbar
+        # Create and configure scrollbar, more rows are added as the end scrolls into view
         scrollbar = ttk.Scrollbar(tree_container, orient="vertical", command=self.software_tree.yview)
-        self.software_tree.configure(yscrollcommand=scrollbar.set)
+        self.software_scrollbar = scrollbar
+        self.software_tree.configure(yscrollcommand=self.on_software_scroll)
 
         # Pack the tree and scrollbar
         self.software_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -306,6 +1316,135 @@ class MCCClient(ctk.CTk):
         )
         self.refresh_btn.pack(pady=5)
 
+    def create_fleet_software_tab(self):
+        """Create the tab that searches the software of every connected computer at once"""
+        fleet_tab = ctk.CTkFrame(self.notebook)
+        self.notebook.add(fleet_tab, text="Fleet Software")
+
+        top_frame = ctk.CTkFrame(fleet_tab)
+        top_frame.pack(fill=tk.X, padx=10, pady=(5, 0))
+
+        self.fleet_status_label = ctk.CTkLabel(top_frame, text="Inventories are collected in the background")
+        self.fleet_status_label.pack(side=tk.LEFT, padx=5, pady=5)
+
+        ctk.CTkButton(top_frame, text="Refresh All", width=100,
+                      command=self.refresh_fleet_software).pack(side=tk.RIGHT, padx=5)
+
+        self.fleet_search_entry = ctk.CTkEntry(top_frame, placeholder_text="Search all computers...", width=200)
+        self.fleet_search_entry.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.fleet_search_entry.bind('<KeyRelease>', self.on_fleet_search)
+
+        tree_container = ttk.Frame(fleet_tab)
+        tree_container.pack(fill=tk.BOTH, expand=True, padx=15, pady=10)
+
+        # Programs at the top level, one child row per version with the computers running it
+        self.fleet_tree = ttk.Treeview(tree_container, columns=("Computers", "Hosts"), show="tree headings")
+        self.fleet_tree.heading("#0", text="Software / Version")
+        self.fleet_tree.heading("Computers", text="Computers")
+        self.fleet_tree.heading("Hosts", text="Hosts")
+        self.fleet_tree.column("#0", width=350, minwidth=200)
+        self.fleet_tree.column("Computers", width=90, minwidth=70, anchor=tk.CENTER)
+        self.fleet_tree.column("Hosts", width=400, minwidth=150)
+
+        scrollbar = ttk.Scrollbar(tree_container, orient="vertical", command=self.fleet_tree.yview)
+        self.fleet_tree.configure(yscrollcommand=scrollbar.set)
+        self.fleet_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def create_processes_tab(self):
+        """Create the tab listing the busiest processes of the selected computer"""
+        processes_tab = ctk.CTkFrame(self.notebook)
+        self.notebook.add(processes_tab, text="Processes")
+
+        top_frame = ctk.CTkFrame(processes_tab)
+        top_frame.pack(fill=tk.X, padx=10, pady=(5, 0))
+
+        self.process_status_label = ctk.CTkLabel(top_frame, text="Select a computer to view its processes")
+        self.process_status_label.pack(side=tk.LEFT, padx=5, pady=5)
+
+        ctk.CTkButton(top_frame, text="Force Kill", width=90, fg_color="#dc3545",
+                      command=lambda: self.kill_selected_process(force=True)).pack(side=tk.RIGHT, padx=5)
+        ctk.CTkButton(top_frame, text="End Process", width=100,
+                      command=self.kill_selected_process).pack(side=tk.RIGHT, padx=5)
+
+        self.process_sort = ctk.CTkSegmentedButton(
+            top_frame,
+            values=["CPU", "Memory", "IO"],
+            command=lambda _: self.restart_process_view()
+        )
+        self.process_sort.set("CPU")
+        self.process_sort.pack(side=tk.RIGHT, padx=10)
+
+        tree_container = ttk.Frame(processes_tab)
+        tree_container.pack(fill=tk.BOTH, expand=True, padx=15, pady=10)
+
+        columns = ("PID", "Name", "CPU", "Memory", "IO", "User")
+        self.process_tree = ttk.Treeview(tree_container, columns=columns, show="headings")
+        for column, width in zip(columns, (70, 250, 70, 100, 100, 150)):
+            self.process_tree.heading(column, text=column)
+            self.process_tree.column(column, width=width, minwidth=50)
+
+        scrollbar = ttk.Scrollbar(tree_container, orient="vertical", command=self.process_tree.yview)
+        self.process_tree.configure(yscrollcommand=scrollbar.set)
+        self.process_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def create_commands_tab(self):
+        """Create the tab that runs commands on the selected computer and shows their output live"""
+        commands_tab = ctk.CTkFrame(self.notebook)
+        self.notebook.add(commands_tab, text="Commands")
+
+        top_frame = ctk.CTkFrame(commands_tab)
+        top_frame.pack(fill=tk.X, padx=10, pady=(5, 0))
+
+        self.command_entry = ctk.CTkEntry(top_frame, placeholder_text="Command to run...")
+        self.command_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5, pady=5)
+        self.command_entry.bind('<Return>', lambda _: self.run_command())
+
+        ctk.CTkButton(top_frame, text="Run", width=80, command=self.run_command).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(top_frame, text="Run on All", width=100,
+                      command=self.run_command_on_all).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(top_frame, text="Cancel", width=80, fg_color="#dc3545",
+                      command=self.cancel_selected_job).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(top_frame, text="Reload Output", width=120,
+                      command=self.tail_selected_job).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(top_frame, text="Send File", width=90,
+                      command=self.send_file).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(top_frame, text="Send File to All", width=120,
+                      command=lambda: self.send_file(to_all=True)).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(top_frame, text="Fetch File", width=90,
+                      command=self.fetch_file).pack(side=tk.LEFT, padx=5)
+
+        body = ctk.CTkFrame(commands_tab)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Jobs of the selected computer
+        self.job_tree = ttk.Treeview(body, columns=("Command", "Status"), show="tree headings", height=6)
+        self.job_tree.heading("#0", text="Job")
+        self.job_tree.heading("Command", text="Command")
+        self.job_tree.heading("Status", text="Status")
+        self.job_tree.column("#0", width=60, minwidth=50)
+        self.job_tree.column("Command", width=450, minwidth=150)
+        self.job_tree.column("Status", width=120, minwidth=80)
+        self.job_tree.pack(fill=tk.X, padx=5, pady=5)
+        self.job_tree.bind('<<TreeviewSelect>>', self.on_job_select)
+
+        # Last command run on every computer, one row per distinct result
+        self.fan_out_tree = ttk.Treeview(body, columns=("Computers", "Result"), show="tree headings", height=4)
+        self.fan_out_tree.heading("#0", text="Outcome")
+        self.fan_out_tree.heading("Computers", text="Computers")
+        self.fan_out_tree.heading("Result", text="Result")
+        self.fan_out_tree.column("#0", width=80, minwidth=60)
+        self.fan_out_tree.column("Computers", width=250, minwidth=100)
+        self.fan_out_tree.column("Result", width=300, minwidth=100)
+        self.fan_out_tree.pack(fill=tk.X, padx=5, pady=5)
+        self.fan_out_tree.bind('<<TreeviewSelect>>', self.on_fan_out_select)
+
+        self.job_output = ctk.CTkTextbox(body, font=("Consolas", 12), wrap="none")
+        self.job_output.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.job_output.tag_config('stderr', foreground="#ff6b6b")
+        self.job_output.tag_config('note', foreground="#9e9e9e")
+
     def create_power_tab(self):
         """Create enhanced power management tab"""
         power_frame = ctk.CTkFrame(self.notebook)
@@ -548,79 +1687,23 @@ class MCCClient(ctk.CTk):
 
         # Store connection info first (even before successful connection)
         self.connections[connection_id] = {
-            'socket': None,
-            'cipher_suite': None,
             'host': host,
             'port': port,
             'system_info': None,
-            'connection_active': False,
-            'reconnect_thread': None
+            'last_sample': None,
+            'connection_active': False
         }
 
         # Add to computer list with 'Connecting' status
         self.computer_list.insert('', 'end', connection_id, text=host, values=('Connecting...',))
 
-        # Start connection in a separate thread to avoid UI freezing
-        connect_thread = threading.Thread(
-            target=self.connect_to_server,
-            args=(connection_id,)
-        )
-        connect_thread.daemon = True
-        connect_thread.start()
+        # The fleet manager connects, subscribes and reconnects in the background
+        self.fleet.add_host(connection_id, host, port)
 
         # Clear input fields
         self.host_entry.delete(0, tk.END)
         self.port_entry.delete(0, tk.END)
 
-    def connect_to_server(self, connection_id):
-        """Connect to server with timeout handling"""
-        connection = self.connections.get(connection_id)
-        if not connection:
-            return
-
-        host, port = connection['host'], connection['port']
-
-        try:
-            # Create socket with timeout
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.settimeout(3.0)  # 3-second timeout
-
-            # Attempt connection
-            client_socket.connect((host, port))
-
-            # Get encryption key
-            key = client_socket.recv(44)  # Fernet key length
-            cipher_suite = Fernet(key)
-
-            # Update connection info
-            self.connections[connection_id]['socket'] = client_socket
-            self.connections[connection_id]['cipher_suite'] = cipher_suite
-            self.connections[connection_id]['connection_active'] = True
-
-            # Update UI from the main thread
-            self.after(0, lambda: self.computer_list.set(connection_id, "status", "Connected"))
-
-            # Start monitoring thread
-            monitor_thread = threading.Thread(
-                target=self.monitor_connection,
-                args=(connection_id,)
-            )
-            monitor_thread.daemon = True
-            monitor_thread.start()
-
-        except (socket.timeout, ConnectionRefusedError) as e:
-            # Handle timeouts and connection refusals
-            error_msg = "Connection timed out" if isinstance(e, socket.timeout) else "Connection refused"
-
-            # Update UI from the main thread
-            self.after(0, lambda: self.computer_list.set(connection_id, "status", "Failed"))
-            self.after(0, lambda: self.toast.show_toast(f"{error_msg} for {host}:{port}", "error"))
-
-        except Exception as e:
-            # Handle other errors
-            self.after(0, lambda: self.computer_list.set(connection_id, "status", "Error"))
-            self.after(0, lambda: self.toast.show_toast(f"Connection error: {str(e)}", "error"))
-
     def remove_connection(self):
         """Remove selected connection"""
         selected = self.computer_list.selection()
@@ -630,10 +1713,12 @@ class MCCClient(ctk.CTk):
 
         connection_id = selected[0]
         if connection_id in self.connections:
-            try:
-                self.connections[connection_id]['socket'].close()
-            except:
-                pass
+            self.fleet.remove_host(connection_id)
+            self.metrics_store.remove_host(connection_id)
+            self.software_models.pop(connection_id, None)
+            self.fleet_software.remove_host(connection_id)
+            for key in [key for key in self.jobs if key[0] == connection_id]:
+                del self.jobs[key]
             del self.connections[connection_id]
             self.computer_list.delete(connection_id)
 
@@ -652,78 +1737,151 @@ class MCCClient(ctk.CTk):
                 # If software tab is active, load software for new connection
                 if self.active_tab == "Software":
                     self.auto_load_software()
-                # Refresh monitoring for new connection
-                self.refresh_monitoring()
+                if self.active_tab == "Processes":
+                    self.restart_process_view()
+                self.show_jobs()
+                # Everything shown comes from pushed samples, switching hosts needs no round trip
+                last_sample = self.connections.get(self.active_connection, {}).get('last_sample')
+                if last_sample:
+                    self.update_hardware_info(last_sample)
+                self.draw_trends()
         else:
             self.active_connection = None
 
-    def monitor_connection(self, connection_id):
-        """Monitor individual connection"""
+    def process_gui_events(self):
+        """Apply results posted by the fleet manager and background threads on the Tk thread"""
+        try:
+            while True:
+                kind, connection_id, payload = self.gui_events.get_nowait()
+                try:
+                    self.handle_gui_event(kind, connection_id, payload)
+                except Exception as e:
+                    logging.error(f"Error handling {kind} event: {str(e)}")
+        except queue.Empty:
+            pass
+
+        if self.running:
+            self.after(self.GUI_EVENT_INTERVAL, self.process_gui_events)
+
+    def handle_gui_event(self, kind, connection_id, payload):
+        """Dispatch a single background result to the widgets it affects"""
+        if kind == 'toast':
+            message, category = payload
+            self.toast.show_toast(message, category)
+            return
+
+        if kind == 'fan_out_done':
+            results = self.fan_outs.pop(payload, None)
+            if results is not None:
+                results.finished = True
+                self.show_fan_out(results)
+            return
+
         connection = self.connections.get(connection_id)
-        if not connection:
+        if connection is None:
+            # Host was removed while the event was queued
             return
 
-        while connection_id in self.connections:
-            try:
-                # Get system info
-                response = self.send_command(connection_id, 'system_info', {})
-                if response and response.get('status') == 'success':
-                    self.connections[connection_id]['system_info'] = response['data']
+        if kind == 'status':
+            connection['connection_active'] = (payload == "Connected")
+            if self.computer_list.exists(connection_id):
+                self.computer_list.set(connection_id, "status", payload)
 
-                # Update status in computer list
-                self.computer_list.set(connection_id, "status", "Connected")
+        elif kind == 'system_info':
+            connection['system_info'] = payload
 
-            except Exception as e:
-                print(f"Monitoring error for {connection_id}: {str(e)}")
-                self.computer_list.set(connection_id, "status", "Error")
-                break
+        elif kind in ('hardware', 'telemetry'):
+            connection['last_sample'] = payload
+            self.metrics_store.ingest(connection_id, payload)
+            if connection_id == self.active_connection:
+                self.update_hardware_info(payload)
+                self.draw_trends()
 
-            time.sleep(5)  # Check every 5 seconds
+        elif kind == 'job_started':
+            self.on_job_started(connection_id, payload)
 
-    def send_command(self, connection_id, command_type, data):
-        """Send command with improved large data handling"""
-        connection = self.connections.get(connection_id)
-        if not connection:
-            print(f"No connection found for ID: {connection_id}")
-            return None
+        elif kind == 'job_output':
+            self.on_job_output(connection_id, payload)
 
-        try:
-            # Prepare command
-            command = {
-                'type': command_type,
-                'data': data
-            }
-            print(f"Sending command: {command_type}")
+        elif kind == 'job_exit':
+            self.on_job_exit(connection_id, payload)
 
-            # Convert to JSON and check size
-            json_data = json.dumps(command)
+        elif kind == 'job_tail':
+            self.on_job_tail(connection_id, payload)
 
-            # Regular command sending
-            encrypted_data = connection['cipher_suite'].encrypt(json_data.encode())
-            connection['socket'].send(encrypted_data)
-            print("Command sent successfully")
+        elif kind == 'processes':
+            self.apply_process_update(*payload)
 
-            # Receive response
-            print("Waiting for response...")
-            encrypted_response = connection['socket'].recv(16384)
-            if not encrypted_response:
-                print("Received empty response from server")
-                return None
-            print(f"Received encrypted response of length: {len(encrypted_response)}")
+        elif kind == 'software_inventory':
+            self.load_software_inventory(connection_id, payload)
 
-            # Decrypt response
-            try:
-                decrypted_response = connection['cipher_suite'].decrypt(encrypted_response).decode()
-                print("Response decrypted successfully")
-                return json.loads(decrypted_response)
-            except Exception as e:
-                print(f"Decryption error: {str(e)}")
-                return None
+        elif kind == 'history':
+            self.metrics_store.ingest_history(connection_id, payload)
+            if connection_id == self.active_connection:
+                self.draw_trends()
+
+        elif kind == 'transfer':
+            self.on_transfer(connection_id, payload)
 
+        elif kind == 'fan_out':
+            fan_out_id, ok, output = payload
+            results = self.fan_outs.get(fan_out_id)
+            if results is not None:
+                results.add(connection['host'], ok, output)
+                self.show_fan_out(results)
+
+    def send_command(self, connection_id, command_type, data, timeout=10.0):
+        """Send a command through the fleet manager and wait for its response"""
+        if connection_id not in self.connections:
+            print(f"No connection found for ID: {connection_id}")
+            return None
+
+        try:
+            print(f"Sending command: {command_type}")
+            future = self.fleet.submit(connection_id, command_type, data, timeout)
+            return future.result(timeout=timeout + 1)
+
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            print(f"Timed out waiting for {command_type} response")
+            return None
         except Exception as e:
             print(f"Send command error: {str(e)}")
             return None
 
+    def start_fan_out(self, label, view, operation, *args, timeout=None):
+        """Run an operation on every computer; progress is shown in the `view` tab as hosts answer"""
+        connection_ids = list(self.connections)
+        fan_out_id = next(self.fan_out_ids)
+        results = FanOutResults(label, view, connection_ids)
+        self.fan_outs[fan_out_id] = results
+        self.fleet.fan_out(fan_out_id, connection_ids, operation, args, timeout)
+        self.show_fan_out(results)
+        return results
+
+    def show_fan_out(self, results):
+        if results.view == 'power':
+            failures = results.failures()
+            if not results.finished:
+                self.update_power_status(results.summary(), "white")
+            elif failures:
+                self.update_power_status("; ".join(f"{results.label} failed for: {', '.join(hosts)} ({output})"
+                                                   for output, hosts in failures), "red")
+            else:
+                self.update_power_status(f"{results.label} initiated for all computers", "green")
+
+        elif results.view == 'commands':
+            if results is self.command_fan_out:
+                self.show_command_fan_out()
+
+        elif results.view == 'inventory':
+            if results.finished and self.active_tab == "Fleet Software":
+                self.show_fleet_software()
+            else:
+                self.fleet_status_label.configure(text=results.summary())
+            if results.finished and results.failures():
+                failed = sum(len(hosts) for _, hosts in results.failures())
+                self.toast.show_toast(f"Inventory refresh failed on {failed} computer(s)", "warning")
+
     def update_hardware_info(self, data):
         """Update hardware monitoring displays with widget validation and value preservation"""
         if not self.monitoring_active:
@@ -765,6 +1923,55 @@ class MCCClient(ctk.CTk):
         except Exception as e:
             print(f"Error updating hardware info: {str(e)}")
 
+    def draw_trends(self):
+        """Redraw the trend charts of the active host from the metrics store"""
+        if not self.monitoring_active or not hasattr(self, 'trend_canvases'):
+            return
+
+        seconds = self.TREND_WINDOWS.get(self.trend_window.get(), 900)
+        for metric, (canvas, summary) in self.trend_canvases.items():
+            if self.active_connection:
+                timestamps, values = self.metrics_store.series(self.active_connection, metric, seconds)
+            else:
+                timestamps, values = [], []
+            points = [(timestamp, value) for timestamp, value in zip(timestamps, values)
+                      if not math.isnan(value)]
+
+            is_rate = metric.startswith('net_')
+            self.draw_sparkline(canvas, points, seconds, None if is_rate else 100.0)
+
+            if not points:
+                summary.configure(text="")
+                continue
+            latest = points[-1][1]
+            peak = max(value for _, value in points)
+            if is_rate:
+                summary.configure(text=f"{format_bytes(latest)}/s (max {format_bytes(peak)}/s)")
+            else:
+                summary.configure(text=f"{latest:.1f}% (max {peak:.1f}%)")
+
+    def draw_sparkline(self, canvas, points, seconds, maximum=None):
+        """Draw (timestamp, value) points as a line over the last `seconds`"""
+        canvas.delete('all')
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        if len(points) < 2 or width < 2 or height < 2:
+            return
+
+        # More samples than pixels only cost drawing time
+        stride = max(len(points) // width, 1)
+        points = points[::stride]
+
+        end = points[-1][0]
+        start = end - seconds
+        top = maximum or max(value for _, value in points) or 1.0
+
+        coordinates = []
+        for timestamp, value in points:
+            coordinates.append((timestamp - start) / seconds * (width - 1))
+            coordinates.append(height - 2 - min(value / top, 1.0) * (height - 4))
+        canvas.create_line(*coordinates, fill="#1f6aa5", width=2)
+
     def update_disk_info(self, disk_usage):
         """Separate method for updating disk information with reduced flicker"""
         try:
@@ -947,101 +2154,21 @@ class MCCClient(ctk.CTk):
             logging.error(f"Error updating power status: {str(e)}")
 
     def on_search(self, event=None):
-        """Handle software search with case-insensitive matching"""
-        if not self.active_connection:
-            self.update_software_status("Please select a computer first")
-            return
-
-        search_term = self.search_entry.get().strip().lower()  # Convert search term to lowercase
-
-        # Clear the tree
-        for item in self.software_tree.get_children():
-            self.software_tree.delete(item)
-
-        try:
-            response = self.send_command(
-                self.active_connection,
-                'software_inventory',
-                {'search': ''}  # Get all software
-            )
-
-            if response and response.get('status') == 'success':
-                software_list = response.get('data', [])
-
-                # Filter software list based on search term - case insensitive
-                filtered_list = []
-                for software in software_list:
-                    if isinstance(software, dict):
-                        name = software.get('name', '').lower()  # Convert name to lowercase
-                        version = software.get('version', '').lower()  # Convert version to lowercase
-                        if search_term in name or search_term in version:
-                            filtered_list.append(software)
-
-                # Update the tree with filtered results
-                for software in filtered_list:
-                    self.software_tree.insert('', 'end', values=(
-                        software.get('name', 'Unknown'),
-                        software.get('version', 'N/A')
-                    ))
-
-                # Update status
-                status = f"Found {len(filtered_list)} software items"
-                if search_term:
-                    status += f" matching '{self.search_entry.get().strip()}'"  # Show original search term
-                self.update_software_status(status)
-
-        except Exception as e:
-            self.update_software_status(f"Error during search: {str(e)}")
+        """Filter the software list once the user pauses typing"""
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(self.SEARCH_DEBOUNCE, self.show_software)
 
     def clear_search(self):
-        """Clear search and refresh list"""
+        """Clear search and show the whole list"""
         self.search_entry.delete(0, tk.END)
-        self.refresh_software_list()  # Refresh with no search term
-
-    def treeview_sort_column(self, col, reverse):
-        """Sort treeview column"""
-        l = [(self.software_tree.set(k, col), k) for k in self.software_tree.get_children('')]
-        l.sort(reverse=reverse)
-
-        # Rearrange items in sorted positions
-        for index, (val, k) in enumerate(l):
-            self.software_tree.move(k, '', index)
-
-        # Reverse sort next time
-        self.software_tree.heading(col, command=lambda: self.treeview_sort_column(col, not reverse))
-
-    def refresh_monitoring(self):
-        """Refresh monitoring data with improved error handling and value preservation"""
-        if not self.active_connection:
-            return
-
-        try:
-            response = self.send_command(self.active_connection, 'hardware_monitor', {})
-
-            # Early return if no response - don't reset values
-            if not response:
-                print("No response from server")
-                return
+        self.show_software()
 
-            # Validate response format
-            if not isinstance(response, dict):
-                print("Invalid response format from server")
-                return
-
-            if response.get('status') != 'success':
-                print(f"Error from server: {response.get('message', 'Unknown error')}")
-                return
-
-            data = response.get('data')
-            if not isinstance(data, dict):
-                print("Invalid data format from server")
-                return
-
-            # Update hardware info with validation
-            self.update_hardware_info(data)
-
-        except Exception as e:
-            print(f"Refresh monitoring error: {str(e)}")
+    def treeview_sort_column(self, col):
+        """Sort by a column, clicking the same column again reverses the order"""
+        sort_key, descending = self.software_sort
+        self.software_sort = (col.lower(), sort_key == col.lower() and not descending)
+        self.show_software()
 
     def power_action_with_confirmation(self, action, confirm_msg):
         """Execute power action with confirmation for single or multiple computers"""
@@ -1052,21 +2179,10 @@ class MCCClient(ctk.CTk):
                     return
 
                 if messagebox.askyesno("Confirm Action", f"{confirm_msg} (All Computers)"):
-                    failed_computers = []
-                    for conn_id in list(self.connections.keys()):  # Create a copy of keys
-                        try:
-                            response = self.send_command(conn_id, 'power_management', {
-                                'action': action
-                            })
-                            if not response or response.get('status') != 'success':
-                                failed_computers.append(self.connections[conn_id]['host'])
-                        except Exception as e:
-                            failed_computers.append(self.connections[conn_id]['host'])
-
-                    if failed_computers:
-                        self.update_power_status(f"Action failed for: {', '.join(failed_computers)}", "red")
-                    else:
-                        self.update_power_status(f"{action.capitalize()} initiated for all computers", "green")
+                    # Every computer is asked at once, the status fills in as they answer
+                    self.start_fan_out(action.capitalize(), 'power', 'command', 'power_management', {
+                        'action': action
+                    })
             else:
                 # Single computer mode
                 if not self.active_connection:
@@ -1108,37 +2224,27 @@ class MCCClient(ctk.CTk):
 
                 # If the time has already passed today, schedule for tomorrow
                 if target_time <= current_time:
-                    target_time = target_time.replace(day=current_time.day + 1)
+                    target_time += timedelta(days=1)
 
                 seconds_until_shutdown = int((target_time - current_time).total_seconds())
 
+                # The agent's task scheduler keeps it across agent restarts; a delay
+                # rather than a timestamp keeps clock differences out of it
+                task = {
+                    'name': f"Shutdown at {time_str}",
+                    'delay': seconds_until_shutdown,
+                    'command': {'type': 'power_management', 'data': {'action': 'shutdown'}}
+                }
+
                 if self.power_mode.get() == "all":
                     if messagebox.askyesno("Confirm Action", "Schedule shutdown for all computers?"):
-                        failed_computers = []
-                        for conn_id in list(self.connections.keys()):
-                            try:
-                                response = self.send_command(conn_id, 'power_management', {
-                                    'action': 'shutdown',
-                                    'seconds': seconds_until_shutdown
-                                })
-                                if not response or response.get('status') != 'success':
-                                    failed_computers.append(self.connections[conn_id]['host'])
-                            except Exception:
-                                failed_computers.append(self.connections[conn_id]['host'])
-
-                        if failed_computers:
-                            self.update_power_status(f"Scheduling failed for: {', '.join(failed_computers)}", "red")
-                        else:
-                            self.update_power_status("Shutdown scheduled for all computers", "green")
+                        self.start_fan_out("Scheduled shutdown", 'power', 'command', 'schedule_task', task)
                 else:
                     if not self.active_connection:
                         self.update_power_status("Please select a computer first", "red")
                         return
 
-                    response = self.send_command(self.active_connection, 'power_management', {
-                        'action': 'shutdown',
-                        'seconds': seconds_until_shutdown
-                    })
+                    response = self.send_command(self.active_connection, 'schedule_task', task)
 
                     if response and response.get('status') == 'success':
                         self.update_power_status("Shutdown scheduled successfully", "green")
@@ -1151,98 +2257,496 @@ class MCCClient(ctk.CTk):
             self.update_power_status(f"Error: {str(e)}", "red")
             logging.error(f"Schedule shutdown error: {str(e)}")
 
-    def refresh_software_list(self, search_term=""):
-        """Refresh software list"""
-        if not self.active_connection:
-            self.update_software_status("Please select a computer first")
+    def on_fleet_search(self, event=None):
+        """Filter the fleet software view once the user pauses typing"""
+        if self.fleet_search_after_id is not None:
+            self.after_cancel(self.fleet_search_after_id)
+        self.fleet_search_after_id = self.after(self.SEARCH_DEBOUNCE, self.show_fleet_software)
+
+    def show_fleet_software(self):
+        """Fill the fleet software tree from the inverted index"""
+        self.fleet_search_after_id = None
+        for item in self.fleet_tree.get_children():
+            self.fleet_tree.delete(item)
+
+        search_term = self.fleet_search_entry.get().strip()
+        names = self.fleet_software.search(search_term)
+        for name in names[:self.FLEET_SOFTWARE_LIMIT]:
+            versions = self.fleet_software.versions(name)
+            parent = self.fleet_tree.insert('', 'end', text=name, values=(
+                sum(len(hosts) for hosts in versions.values()),
+                f"{len(versions)} version{'s' if len(versions) != 1 else ''}"
+            ))
+            for version, hosts in versions.items():
+                self.fleet_tree.insert(parent, 'end', text=version, values=(len(hosts), ", ".join(sorted(hosts))))
+
+        status = f"{len(names)} programs on {len(self.fleet_software.host_programs)} computers"
+        if len(names) > self.FLEET_SOFTWARE_LIMIT:
+            status += f", showing the first {self.FLEET_SOFTWARE_LIMIT}"
+        self.fleet_status_label.configure(text=status)
+
+    def restart_process_view(self):
+        """Drop the current process table and fetch a full one for the selected computer"""
+        for item in self.process_tree.get_children():
+            self.process_tree.delete(item)
+        self.process_view = None
+        if self.process_after_id is not None:
+            self.after_cancel(self.process_after_id)
+            self.process_after_id = None
+        self.poll_processes()
+
+    def poll_processes(self):
+        """Ask for the changes since our generation and schedule the next poll while the tab is open"""
+        self.process_after_id = None
+        if self.active_tab != "Processes":
             return
+        self.process_after_id = self.after(self.PROCESS_REFRESH, self.poll_processes)
 
-        try:
-            self.update_software_status("Retrieving software list...")
+        connection_id = self.active_connection
+        if not connection_id:
+            self.process_status_label.configure(text="Select a computer to view its processes")
+            return
 
-            # Clear existing items
-            for item in self.software_tree.get_children():
-                self.software_tree.delete(item)
+        sort_key = self.process_sort.get().lower()
+        view = self.process_view
+        if view is None or view['connection_id'] != connection_id or view['sort'] != sort_key:
+            view = self.process_view = {
+                'connection_id': connection_id,
+                'sort': sort_key,
+                'generation': None,
+                'rows': {},
+                'loading': False
+            }
+        if view['loading']:
+            return
+        view['loading'] = True
 
-            # Set timeout for software inventory
-            connection = self.connections.get(self.active_connection)
-            if not connection:
-                self.update_software_status("Connection not found")
-                return
+        data = {'sort': sort_key, 'limit': self.PROCESS_LIMIT}
+        if view['generation'] is not None:
+            data['since'] = view['generation']
+        future = self.fleet.submit(connection_id, 'process_list', data)
+
+        def on_done(done):
+            try:
+                response = done.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e) or "No response from server"}
+            self.gui_events.put(('processes', connection_id, (view, response)))
+
+        future.add_done_callback(on_done)
+
+    def apply_process_update(self, view, response):
+        """Merge a full table or a delta into the view and update the tree in place"""
+        view['loading'] = False
+        if view is not self.process_view:
+            return
+        if response.get('status') != 'success':
+            self.process_status_label.configure(text=f"Error: {response.get('message', 'Unknown error')}")
+            return
+
+        result = response['data']
+        rows = view['rows']
+        if 'processes' in result:
+            rows.clear()
+            rows.update((row['pid'], row) for row in result['processes'])
+            for item in self.process_tree.get_children():
+                self.process_tree.delete(item)
+        else:
+            for pid in result['exited']:
+                rows.pop(pid, None)
+                if self.process_tree.exists(str(pid)):
+                    self.process_tree.delete(str(pid))
+            for row in result['started'] + result['changed']:
+                rows[row['pid']] = row
+        view['generation'] = result['generation']
+
+        sort_field = {'cpu': 'cpu_percent', 'memory': 'memory_rss', 'io': 'io_per_sec'}[view['sort']]
+        ordered = sorted(rows.values(), key=lambda row: row[sort_field] or 0, reverse=True)
+        for index, row in enumerate(ordered):
+            values = (
+                row['pid'],
+                row['name'],
+                f"{row['cpu_percent']:.1f}%",
+                format_bytes(row['memory_rss']),
+                "N/A" if row['io_per_sec'] is None else f"{format_bytes(row['io_per_sec'])}/s",
+                row['user'] or ""
+            )
+            item = str(row['pid'])
+            if self.process_tree.exists(item):
+                self.process_tree.item(item, values=values)
+                self.process_tree.move(item, '', index)
+            else:
+                self.process_tree.insert('', index, iid=item, values=values)
+
+        self.process_status_label.configure(
+            text=f"Top {len(rows)} of {result['total']} processes by {self.process_sort.get()}")
+
+    def kill_selected_process(self, force=False):
+        """Stop the process selected in the Processes tab after confirmation"""
+        selected = self.process_tree.selection()
+        if not selected or not self.active_connection:
+            self.toast.show_toast("Select a process first", "warning")
+            return
+
+        pid, name = self.process_tree.item(selected[0], 'values')[:2]
+        action = "Force kill" if force else "End"
+        if not messagebox.askyesno("Confirm Action", f"{action} {name} (PID {pid})?"):
+            return
 
-            # Set temporary longer timeout
-            original_timeout = connection['socket'].gettimeout()
-            connection['socket'].settimeout(30)
+        future = self.fleet.submit(self.active_connection, 'process_kill', {'pid': int(pid), 'force': force})
 
+        def on_done(done):
             try:
-                response = self.send_command(
-                    self.active_connection,
-                    'software_inventory',
-                    {'search': search_term}
-                )
+                response = done.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e) or "No response from server"}
+            category = "success" if response.get('status') == 'success' else "error"
+            self.gui_events.put(('toast', None, (response.get('message', ''), category)))
+
+        future.add_done_callback(on_done)
+
+    def run_command(self):
+        """Start the entered command as a job on the selected computer"""
+        command = self.command_entry.get().strip()
+        connection_id = self.active_connection
+        if not command or not connection_id:
+            self.toast.show_toast("Select a computer and enter a command", "warning")
+            return
 
-                if not response:
-                    self.update_software_status("No response from server")
-                    return
+        future = self.fleet.submit(connection_id, 'execute_command', {'command': command})
 
-                if response.get('status') == 'error':
-                    self.update_software_status(f"Server error: {response.get('message', 'Unknown error')}")
-                    return
+        def on_done(done):
+            try:
+                response = done.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e) or "No response from server"}
+            self.gui_events.put(('job_started', connection_id, response))
 
-                if response.get('status') == 'success':
-                    software_list = response.get('data', [])
+        future.add_done_callback(on_done)
+        self.command_entry.delete(0, tk.END)
 
-                    for software in software_list:
-                        if isinstance(software, dict):
-                            name = software.get('name', 'Unknown')
-                            version = software.get('version', 'N/A')
+    def run_command_on_all(self):
+        """Run the entered command on every computer and group the results by output"""
+        command = self.command_entry.get().strip()
+        if not command or not self.connections:
+            self.toast.show_toast("Add a computer and enter a command", "warning")
+            return
 
-                            self.software_tree.insert('', 'end', values=(name, version))
+        self.command_fan_out = self.start_fan_out(command, 'commands', 'job', command,
+                                                  timeout=self.FAN_OUT_JOB_TIMEOUT)
+        self.command_entry.delete(0, tk.END)
+
+    def show_command_fan_out(self):
+        """List the distinct results of the last command run on every computer"""
+        results = self.command_fan_out
+        selected = self.fan_out_tree.selection()
+        for item in self.fan_out_tree.get_children():
+            self.fan_out_tree.delete(item)
+
+        for index, ((ok, output), hosts) in enumerate(results.groups.items()):
+            first_line = output.strip().splitlines()[0] if output.strip() else "(no output)"
+            self.fan_out_tree.insert('', 'end', iid=str(index), text="OK" if ok else "Failed",
+                                     values=(f"{len(hosts)}: {', '.join(hosts)}", first_line))
+        if selected and self.fan_out_tree.exists(selected[0]):
+            self.fan_out_tree.selection_set(selected)
+
+        if results.finished:
+            self.fan_out_tree.heading("Result", text=f"{results.label}: {len(results.groups)} distinct results")
+        else:
+            self.fan_out_tree.heading("Result", text=results.summary())
 
-                    status = f"Found {len(software_list)} software items"
-                    if search_term:
-                        status += f" matching '{search_term}'"
-                    self.update_software_status(status)
-                else:
-                    self.update_software_status("Invalid response format")
+    def on_fan_out_select(self, event=None):
+        """Show the full output of the selected result group"""
+        selected = self.fan_out_tree.selection()
+        if not selected or self.command_fan_out is None:
+            return
+        (ok, output), hosts = list(self.command_fan_out.groups.items())[int(selected[0])]
+        self.job_output.delete('1.0', tk.END)
+        self.job_output.insert(tk.END, f"{self.command_fan_out.label} on {', '.join(hosts)}\n", 'note')
+        self.job_output.insert(tk.END, output, () if ok else 'stderr')
+
+    def default_remote_path(self, name):
+        """Where a sent file goes unless the user says otherwise"""
+        system_info = self.connections.get(self.active_connection, {}).get('system_info') or {}
+        if system_info.get('os') == 'Windows':
+            return f"C:\\Windows\\Temp\\{name}"
+        return f"/tmp/{name}"
+
+    def send_file(self, to_all=False):
+        """Upload a file to the selected computer, or to every computer at once"""
+        connection_id = self.active_connection
+        if not (self.connections if to_all else connection_id):
+            self.toast.show_toast("Select a computer first", "warning")
+            return
+
+        local_path = filedialog.askopenfilename(title="File to send")
+        if not local_path:
+            return
+        name = os.path.basename(local_path)
+        remote_path = simpledialog.askstring("Send File", "Path on the remote computer:",
+                                             initialvalue=self.default_remote_path(name), parent=self)
+        if not remote_path:
+            return
 
-            finally:
-                # Restore original timeout
-                connection['socket'].settimeout(original_timeout)
+        if to_all:
+            self.command_fan_out = self.start_fan_out(f"Send {name}", 'commands', 'file', local_path, remote_path,
+                                                      timeout=self.FAN_OUT_FILE_TIMEOUT)
+            return
 
-        except Exception as e:
-            self.update_software_status(f"Error refreshing list: {str(e)}")
+        self.toast.show_toast(f"Sending {name}...", "info")
+        future = self.fleet.upload(connection_id, local_path, remote_path)
+
+        def on_done(done):
+            try:
+                response = done.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e) or "Transfer failed"}
+            self.gui_events.put(('transfer', connection_id, (f"Sent {name}", response)))
 
-    def initialize_monitoring(self):
-        """Initialize monitoring thread safely"""
-        if hasattr(self, 'monitoring_thread'):
-            return  # Don't create multiple threads
+        future.add_done_callback(on_done)
 
-        self.monitoring_thread = threading.Thread(
-            target=self.monitor_resources,
-            daemon=True  # Make it a daemon thread
-        )
-        self.monitoring_thread.start()
-        logging.info("Monitoring thread started")
+    def fetch_file(self):
+        """Download a file from the selected computer"""
+        connection_id = self.active_connection
+        if not connection_id:
+            self.toast.show_toast("Select a computer first", "warning")
+            return
 
-    def monitor_resources(self):
-        """Monitor system resources with shutdown check"""
-        logging.info("Starting resource monitoring")
-        while getattr(self, 'running', True):  # Safe attribute access
+        remote_path = simpledialog.askstring("Fetch File", "Path on the remote computer:", parent=self)
+        if not remote_path:
+            return
+        name = re.split(r'[\\/]', remote_path)[-1]
+        local_path = filedialog.asksaveasfilename(title="Save as", initialfile=name)
+        if not local_path:
+            return
+
+        self.toast.show_toast(f"Fetching {name}...", "info")
+        future = self.fleet.download(connection_id, remote_path, local_path)
+
+        def on_done(done):
             try:
-                if not hasattr(self, 'active_connection'):
-                    time.sleep(2)
-                    continue
+                response = done.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e) or "Transfer failed"}
+            self.gui_events.put(('transfer', connection_id, (f"Fetched {name}", response)))
+
+        future.add_done_callback(on_done)
+
+    def on_transfer(self, connection_id, result):
+        label, response = result
+        if response.get('status') == 'success':
+            self.toast.show_toast(f"{label} ({format_bytes(response['data']['size'])})", "success")
+        else:
+            self.toast.show_toast(f"{label} failed: {response.get('message', 'Unknown error')}", "error")
+
+    def get_job(self, connection_id, job_id):
+        """Local record of a job, created on first sight since output may beat the start reply"""
+        key = (connection_id, job_id)
+        if key not in self.jobs:
+            self.jobs[key] = {'command': '', 'status': 'running', 'return_code': None, 'output': [], 'size': 0}
+        return self.jobs[key]
+
+    def on_job_started(self, connection_id, response):
+        if response.get('status') != 'success':
+            self.toast.show_toast(f"Command failed: {response.get('message', 'Unknown error')}", "error")
+            return
 
-                if self.active_connection and self.monitoring_active:
-                    if hasattr(self, 'cpu_progress') and hasattr(self, 'mem_progress'):
-                        self.refresh_monitoring()
-                time.sleep(2)  # Reduced update frequency
+        summary = response['data']
+        job = self.get_job(connection_id, summary['job'])
+        job['command'] = summary['command']
+        if job['status'] == 'running':
+            # Jobs wait as 'queued' while the agent's job slots are full
+            job['status'] = summary['status']
+        if connection_id == self.active_connection:
+            self.selected_job = (connection_id, summary['job'])
+            self.show_jobs()
+
+    def on_job_output(self, connection_id, data):
+        """Append a streamed chunk, skipping anything already received"""
+        job = self.get_job(connection_id, data['job'])
+        if job['status'] == 'queued':
+            job['status'] = 'running'
+        text = data['text'][max(job['size'] - data['offset'], 0):]
+        if not text:
+            return
+
+        chunks = []
+        if data['offset'] > job['size']:
+            chunks.append(('note', f"[{data['offset'] - job['size']} characters missed]\n"))
+        chunks.append((data['stream'], text))
+        job['size'] = data['offset'] + len(data['text'])
+        self.add_job_output(connection_id, data['job'], chunks)
+
+    def add_job_output(self, connection_id, job_id, chunks):
+        job = self.jobs[(connection_id, job_id)]
+        job['output'].extend(chunks)
+        # Drop the oldest chunks beyond the client-side limit
+        kept = sum(len(text) for _, text in job['output'])
+        while kept > self.MAX_JOB_OUTPUT and len(job['output']) > 1:
+            kept -= len(job['output'].pop(0)[1])
+
+        if self.selected_job == (connection_id, job_id):
+            for stream, text in chunks:
+                self.job_output.insert(tk.END, text, stream if stream != 'stdout' else ())
+            self.job_output.see(tk.END)
+
+    def on_job_exit(self, connection_id, summary):
+        job = self.get_job(connection_id, summary['job'])
+        job['status'] = summary['status']
+        job['return_code'] = summary['return_code']
+        if connection_id == self.active_connection:
+            self.show_jobs()
+
+    def show_jobs(self):
+        """List the jobs of the selected computer and show the selected job's output"""
+        for item in self.job_tree.get_children():
+            self.job_tree.delete(item)
+
+        for (connection_id, job_id), job in sorted(self.jobs.items(), key=lambda entry: entry[0][1]):
+            if connection_id != self.active_connection:
+                continue
+            status = job['status']
+            if job['return_code'] is not None:
+                status += f" ({job['return_code']})"
+            self.job_tree.insert('', 'end', iid=str(job_id), text=str(job_id), values=(job['command'], status))
+
+        if self.selected_job and self.selected_job[0] == self.active_connection:
+            item = str(self.selected_job[1])
+            if self.job_tree.exists(item) and self.job_tree.selection() != (item,):
+                self.job_tree.selection_set(item)
+        self.render_job_output()
+
+    def on_job_select(self, event=None):
+        selected = self.job_tree.selection()
+        if selected and self.selected_job != (self.active_connection, int(selected[0])):
+            self.selected_job = (self.active_connection, int(selected[0]))
+            self.render_job_output()
+
+    def render_job_output(self):
+        self.job_output.delete('1.0', tk.END)
+        job = self.jobs.get(self.selected_job) if self.selected_job else None
+        if job is None or self.selected_job[0] != self.active_connection:
+            return
+        for stream, text in job['output']:
+            self.job_output.insert(tk.END, text, stream if stream != 'stdout' else ())
+        self.job_output.see(tk.END)
+
+    def cancel_selected_job(self):
+        if not self.selected_job or self.selected_job[0] != self.active_connection:
+            self.toast.show_toast("Select a job first", "warning")
+            return
+        connection_id, job_id = self.selected_job
+        # The job_exit event updates the list once the agent has stopped it
+        self.fleet.submit(connection_id, 'job_cancel', {'job': job_id})
+
+    def tail_selected_job(self):
+        """Fetch the output the agent kept, e.g. after a reconnect, and follow the job again"""
+        if not self.selected_job or self.selected_job[0] != self.active_connection:
+            self.toast.show_toast("Select a job first", "warning")
+            return
+        connection_id, job_id = self.selected_job
+        future = self.fleet.submit(connection_id, 'job_tail', {'job': job_id, 'offset': 0, 'follow': True})
+
+        def on_done(done):
+            try:
+                response = done.result()
             except Exception as e:
-                logging.error(f"Monitor resources error: {str(e)}")
-                time.sleep(2)  # Wait before trying again
+                response = {'status': 'error', 'message': str(e) or "No response from server"}
+            self.gui_events.put(('job_tail', connection_id, response))
+
+        future.add_done_callback(on_done)
+
+    def on_job_tail(self, connection_id, response):
+        if response.get('status') != 'success':
+            self.toast.show_toast(f"Could not load output: {response.get('message', 'Unknown error')}", "error")
+            return
+
+        result = response['data']
+        job = self.get_job(connection_id, result['job'])
+        job.update(command=result['command'], status=result['status'], return_code=result['return_code'],
+                   output=[], size=0)
+        chunks = [(chunk['stream'], chunk['text']) for chunk in result['chunks']]
+        if result['chunks'] and result['chunks'][0]['offset'] > 0:
+            chunks.insert(0, ('note', "[earlier output truncated]\n"))
+        job['output'] = chunks
+        job['size'] = result['output_size']
+        if connection_id == self.active_connection:
+            self.show_jobs()
+
+    def refresh_software_list(self):
+        """Sync the inventory of the selected computer in the background"""
+        connection_id = self.active_connection
+        if not connection_id:
+            self.update_software_status("Please select a computer first")
+            return
+
+        self.update_software_status("Retrieving software list...")
+
+        # Only what changed since the last sync crosses the wire, the result arrives as an event
+        self.fleet.refresh_inventory(connection_id)
+
+    def refresh_fleet_software(self):
+        """Sync the inventory of every computer at once"""
+        if not self.connections:
+            self.fleet_status_label.configure(text="No computers connected")
+            return
+        self.start_fan_out("Inventory refresh", 'inventory', 'inventory',
+                           timeout=FleetManager.INVENTORY_TIMEOUT)
+
+    def load_software_inventory(self, connection_id, response):
+        """Index a downloaded inventory and show it if its computer is selected"""
+        if response.get('status') != 'success':
+            if connection_id == self.active_connection:
+                self.update_software_status(f"Server error: {response.get('message', 'Unknown error')}")
+            return
+
+        if response.get('unchanged'):
+            if connection_id == self.active_connection and self.active_tab == "Software":
+                self.show_software()
+            return
+
+        self.software_models[connection_id] = response['index']
+        self.fleet_software.update_host(connection_id, response['index'].items)
+        if connection_id == self.active_connection and self.active_tab == "Software":
+            self.show_software()
+        if self.active_tab == "Fleet Software":
+            self.show_fleet_software()
+
+    def show_software(self):
+        """Fill the software tree from the local index of the selected computer"""
+        self.search_after_id = None
+        for item in self.software_tree.get_children():
+            self.software_tree.delete(item)
+        self.software_rows, self.software_shown = [], 0
 
-        logging.info("Resource monitoring stopped")
+        model = self.software_models.get(self.active_connection)
+        if model is None:
+            return
+
+        search_term = self.search_entry.get().strip()
+        self.software_rows = model.sorted_items(model.search(search_term), *self.software_sort)
+        self.show_more_software()
+
+        status = f"Found {len(self.software_rows)} software items"
+        if search_term:
+            status += f" matching '{search_term}'"
+        self.update_software_status(status)
+
+    def show_more_software(self):
+        """Insert the next rows of the current result into the tree"""
+        end = self.software_shown + self.SOFTWARE_PAGE_SIZE
+        for software in self.software_rows[self.software_shown:end]:
+            self.software_tree.insert('', 'end', values=(
+                software.get('name', 'Unknown'),
+                software.get('version', 'N/A')
+            ))
+        self.software_shown = min(end, len(self.software_rows))
+
+    def on_software_scroll(self, first, last):
+        """Keep the scrollbar in sync and add rows once the end comes into view"""
+        self.software_scrollbar.set(first, last)
+        if float(last) > 0.9 and self.software_shown < len(self.software_rows):
+            self.show_more_software()
 
     def toggle_rdp(self):
         """Toggle RDP session on/off"""
@@ -1263,6 +2767,7 @@ class MCCClient(ctk.CTk):
 
             if response and response.get('status') == 'success':
                 ip, port = response['data']['ip'], response['data']['port']
+                stream_key = bytes.fromhex(response['data']['key'])
 
                 # Update status with clear feedback
                 self.rdt_status.configure(text="Connecting to remote desktop...")
@@ -1281,9 +2786,14 @@ class MCCClient(ctk.CTk):
                 self.rdp_socket.settimeout(5.0)
                 self.rdp_socket.connect((ip, port))
 
+                # Derive this stream's keys from the key sent over the command channel and the server's salt
+                salt = recv_exact(self.rdp_socket, STREAM_SALT_SIZE, idle_timeout=False)
+                self.rdp_cipher = stream_cipher(stream_key, salt, is_server=False,
+                                                cipher=response['data'].get('cipher', 'aes-gcm'))
+
                 # Send platform info
                 platform_code = b'win' if sys.platform == "win32" else b'osx' if sys.platform == "darwin" else b'x11'
-                self.rdp_socket.sendall(platform_code)
+                self.rdp_socket.sendall(self.rdp_cipher.encrypt(platform_code))
 
                 # Hide the welcome message
                 if hasattr(self, 'rdp_message') and self.rdp_message.winfo_exists():
@@ -1384,37 +2894,36 @@ class MCCClient(ctk.CTk):
                 self.rdp_button.configure(text="Start Remote Desktop", state="normal")
 
     def receive_rdp_frame(self):
-        """Receive a frame from the RDP server"""
+        """Receive and decrypt a frame from the RDP server"""
         # Get header
         header = self.receive_exact(5)
         img_type, length = struct.unpack(">BI", header)
 
-        # Get image data
-        img_data = b''
-        buffer_size = 10240
-        while length > 0:
-            chunk_size = min(buffer_size, length)
-            chunk = self.receive_exact(chunk_size)
-            img_data += chunk
-            length -= len(chunk)
+        # Get image data, the header is authenticated together with it
+        encrypted_data = self.receive_exact(length)
+        img_data = self.rdp_cipher.decrypt(encrypted_data, header)
 
         return img_type, img_data
 
     def receive_exact(self, size):
         """Receive exact number of bytes"""
-        data = b''
-        while len(data) < size and self.rdp_active:
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            if not self.rdp_active:
+                raise ConnectionError("RDP session stopped")
             try:
-                chunk = self.rdp_socket.recv(size - len(data))
-                if not chunk:
+                count = self.rdp_socket.recv_into(view[received:], size - received)
+                if not count:
                     raise ConnectionError("Connection lost")
-                data += chunk
+                received += count
             except socket.timeout:
                 continue
             except Exception as e:
                 logging.error(f"Error receiving data: {str(e)}")
                 raise
-        return data
+        return bytes(data)
 
     def rdp_display_loop(self):
         """Display loop for RDP with proper scaling and positioning"""
@@ -1587,7 +3096,7 @@ class MCCClient(ctk.CTk):
             return
 
         try:
-            self.rdp_socket.sendall(struct.pack('>BBHH', button, action, x, y))
+            self.rdp_socket.sendall(self.rdp_cipher.encrypt(struct.pack('>BBHH', button, action, x, y)))
         except Exception as e:
             logging.error(f"Error sending mouse event: {str(e)}")
             self.stop_rdp()
@@ -1617,7 +3126,7 @@ class MCCClient(ctk.CTk):
 
             # Send key event
             if scan_code > 0:
-                self.rdp_socket.sendall(struct.pack('>BBHH', scan_code, action, 0, 0))
+                self.rdp_socket.sendall(self.rdp_cipher.encrypt(struct.pack('>BBHH', scan_code, action, 0, 0)))
         except Exception as e:
             logging.error(f"Error sending key event: {str(e)}")
 
@@ -1647,11 +3156,18 @@ class MCCClient(ctk.CTk):
                     self.progress_bars['cpu'] = self.cpu_progress
                 if hasattr(self, 'mem_progress'):
                     self.progress_bars['mem'] = self.mem_progress
+                self.draw_trends()
 
             # Auto-load software list when entering Software tab
             if self.active_tab == "Software":
                 self.auto_load_software()
 
+            if self.active_tab == "Fleet Software":
+                self.show_fleet_software()
+
+            if self.active_tab == "Processes":
+                self.restart_process_view()
+
             # Update the UI based on the new tab
             self.update_idletasks()
 
@@ -1663,9 +3179,13 @@ class MCCClient(ctk.CTk):
         try:
             # Only load if a computer is connected and it's not already loaded for this connection
             if self.active_connection and self.active_connection != self.software_loaded_for:
-                self.update_software_status("Loading software list...")
-                # Schedule software loading with a small delay to allow UI to update
-                self.after(100, self.refresh_software_list)
+                if self.active_connection in self.software_models:
+                    # Already downloaded, only the Refresh button goes back to the agent
+                    self.show_software()
+                else:
+                    self.update_software_status("Loading software list...")
+                    # Schedule software loading with a small delay to allow UI to update
+                    self.after(100, self.refresh_software_list)
                 # Update the tracking variable
                 self.software_loaded_for = self.active_connection
             elif not self.active_connection:
@@ -1680,19 +3200,10 @@ class MCCClient(ctk.CTk):
             self.running = False
 
             # Close all connections
-            for conn_id in list(self.connections.keys()):
-                try:
-                    self.connections[conn_id]['socket'].close()
-                except:
-                    pass
-
             logging.info("Closing all connections")
+            self.fleet.stop()
             self.connections.clear()
 
-            # Wait for threads to finish
-            if hasattr(self, 'monitoring_thread') and self.monitoring_thread.is_alive():
-                self.monitoring_thread.join(timeout=1.0)
-
             logging.info("Application shutting down")
             self.quit()
 
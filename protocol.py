@@ -0,0 +1,642 @@
+"""Wire protocol shared by the MCC server and client.
+
+Every message on the command channel is serialized (JSON, or msgpack when
+both sides have it) and split into one or more frames. A frame is a 5 byte
+header (flags, length) followed by an encrypted chunk of the message, so a
+message of any size can be streamed without either side holding more than
+one encrypted chunk at a time.
+
+Frames are sealed with an AEAD cipher (AES-GCM or ChaCha20-Poly1305). The
+session keys come from an ephemeral X25519 exchange when the connection
+opens, one key per direction, and the nonce is the frame counter of that
+direction, so nothing but the 16 byte tag is added to each frame. The frame
+header is authenticated as associated data. The exchange is not
+authenticated, it protects against passive listeners, not against an active
+man in the middle.
+
+Right after the key exchange the client sends a 'hello' message listing what
+it can decode and the server answers with the options both sides share. The
+flags of every frame say how its message was encoded and compressed, so the
+receiver never depends on negotiation state to decode it.
+"""
+import json
+import logging
+import os
+import socket
+import struct
+import time
+import zlib
+from operator import itemgetter
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Frame header: flags (1 byte) + payload length (4 bytes), same layout as the RDP stream
+FRAME_HEADER = struct.Struct('>BI')
+
+# Frame flags
+FLAG_MORE = 0x01       # More frames follow for the current message
+FLAG_MSGPACK = 0x02    # Message (or telemetry envelope) is msgpack instead of JSON
+FLAG_TELEMETRY = 0x04  # Message data is a schema-described struct, see MessageChannel.encode
+
+# Bits 3-4 of the flags hold the compression codec of the message
+COMPRESSION_SHIFT = 3
+COMPRESSION_MASK = 0x18
+
+# Size of the plaintext chunk carried by a single frame
+CHUNK_SIZE = 64 * 1024
+
+# Upper bound for a single encrypted frame, protects against corrupted headers
+MAX_FRAME_SIZE = 4 * CHUNK_SIZE
+
+# Upper bound for a reassembled message, before and after decompression
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+# AEAD ciphers by the id the server announces in its greeting
+CIPHERS = {1: AESGCM, 2: ChaCha20Poly1305}
+CIPHER_IDS = {'aes-gcm': 1, 'chacha20-poly1305': 2}
+TAG_SIZE = 16
+
+# Server greeting: magic, cipher id, X25519 public key. The client answers with its public key.
+HANDSHAKE_MAGIC = b'MCC2'
+SERVER_GREETING = struct.Struct('>4sB32s')
+PUBLIC_KEY_SIZE = 32
+
+# Random salt the RDP server sends first, so every stream gets fresh keys
+STREAM_SALT_SIZE = 16
+
+# Encodings this side can decode, in order of preference
+ENCODINGS = ('msgpack', 'json') if msgpack else ('json',)
+
+# Compression codecs this side can decode, in order of preference, with their flag ids
+COMPRESSION_CODECS = {'zstd': 3, 'lz4': 2, 'zlib': 1}
+COMPRESSIONS = tuple(name for name in COMPRESSION_CODECS
+                     if name == 'zlib' or (name == 'zstd' and zstandard) or (name == 'lz4' and lz4))
+
+# Payloads smaller than this are sent uncompressed
+COMPRESS_THRESHOLD = 1024
+
+# Compression level per codec for payloads up to 64 KiB, up to 1 MiB and larger.
+# Big payloads get faster levels so compression does not dominate the response time.
+COMPRESSION_LEVELS = {
+    'zstd': (9, 3, 1),
+    'lz4': (9, 0, 0),
+    'zlib': (6, 4, 1)
+}
+
+# Telemetry payload header: schema id, schema definition length, envelope length
+TELEMETRY_HEADER = struct.Struct('>HII')
+
+# Distinct telemetry layouts kept per connection before falling back to plain encoding
+MAX_TELEMETRY_SCHEMAS = 256
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends data that does not follow the framing rules"""
+
+
+def recv_exact(sock, size, idle_timeout=True):
+    """Receive exactly size bytes from a socket.
+
+    A timeout before the first byte is re-raised when idle_timeout is set so
+    the caller can check its running flag; once data started arriving the
+    read keeps waiting for the rest of the frame.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        try:
+            count = sock.recv_into(view[received:], size - received)
+        except socket.timeout:
+            if received == 0 and idle_timeout:
+                raise
+            continue
+        if count == 0:
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return bytes(buffer)
+
+
+class FrameCipher:
+    """AEAD for one direction of a connection, the nonce is the frame counter"""
+
+    def __init__(self, aead):
+        self.aead = aead
+        self.counter = 0
+
+    def _next_nonce(self):
+        nonce = self.counter.to_bytes(12, 'big')
+        self.counter += 1
+        return nonce
+
+    def encrypt(self, data, associated_data=None):
+        return self.aead.encrypt(self._next_nonce(), data, associated_data)
+
+    def decrypt(self, data, associated_data=None):
+        # Raises cryptography.exceptions.InvalidTag on tampered, replayed or reordered frames
+        return self.aead.decrypt(self._next_nonce(), data, associated_data)
+
+
+class SessionCipher:
+    """Send and receive FrameCiphers of one connection"""
+
+    overhead = TAG_SIZE
+
+    def __init__(self, send_key, recv_key, cipher_id):
+        aead_class = CIPHERS[cipher_id]
+        self.cipher_id = cipher_id
+        self.sender = FrameCipher(aead_class(send_key))
+        self.receiver = FrameCipher(aead_class(recv_key))
+
+    @classmethod
+    def derive(cls, secret, salt, is_server, cipher_id):
+        """Expand a shared secret into one key per direction"""
+        material = HKDF(algorithm=hashes.SHA256(), length=64, salt=salt,
+                        info=b'mcc session keys').derive(secret)
+        client_key, server_key = material[:32], material[32:]
+        if is_server:
+            return cls(server_key, client_key, cipher_id)
+        return cls(client_key, server_key, cipher_id)
+
+    def encrypt(self, data, associated_data=None):
+        return self.sender.encrypt(data, associated_data)
+
+    def decrypt(self, data, associated_data=None):
+        return self.receiver.decrypt(data, associated_data)
+
+
+def new_stream_key():
+    """Random secret for a side stream such as RDP, handed out over the command channel"""
+    return os.urandom(32)
+
+
+def stream_cipher(key, salt, is_server, cipher='aes-gcm'):
+    """Session cipher for a side stream keyed by new_stream_key() and a per-connection salt"""
+    return SessionCipher.derive(key, salt, is_server, CIPHER_IDS[cipher])
+
+
+def local_capabilities():
+    """Options this side supports, sent in the client hello"""
+    return {
+        'encodings': list(ENCODINGS),
+        'compression': list(COMPRESSIONS),
+        'telemetry': True
+    }
+
+
+def _compression_level(codec, size):
+    small, medium, large = COMPRESSION_LEVELS[codec]
+    if size <= 64 * 1024:
+        return small
+    if size <= 1024 * 1024:
+        return medium
+    return large
+
+
+def compress(codec, payload):
+    """Compress a payload with a level that adapts to its size"""
+    level = _compression_level(codec, len(payload))
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(payload)
+    if codec == 'lz4':
+        return lz4.frame.compress(payload, compression_level=level)
+    return zlib.compress(payload, level)
+
+
+def decompress(codec, payload):
+    """Inverse of compress(), refusing payloads that expand past MAX_MESSAGE_SIZE"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ProtocolError("Peer sent zstd data but zstandard is not installed")
+        payload = bytes(payload)
+        # A frame that declares its size is decompressed into a buffer of that size
+        if zstandard.frame_content_size(payload) > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Message expands past {MAX_MESSAGE_SIZE} bytes")
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=MAX_MESSAGE_SIZE)
+
+    if codec == 'lz4':
+        if lz4 is None:
+            raise ProtocolError("Peer sent lz4 data but lz4 is not installed")
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        data = decompressor.decompress(bytes(payload), max_length=MAX_MESSAGE_SIZE + 1)
+    else:
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(payload, MAX_MESSAGE_SIZE + 1)
+    if len(data) > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message expands past {MAX_MESSAGE_SIZE} bytes")
+    if not decompressor.eof:
+        raise ProtocolError("Compressed message is truncated")
+    return data
+
+
+def _flatten_numbers(value, path, layout, values):
+    """Collect the (path, struct code) layout and the values of a nested dict of numbers.
+
+    Returns False if the value holds anything that the telemetry layout
+    cannot represent exactly.
+    """
+    for key, item in value.items():
+        item_type = type(item)
+        if item_type is float:
+            layout.append((path, key, 'd'))
+        elif item_type is int:
+            if not -2 ** 63 <= item < 2 ** 63:
+                return False
+            layout.append((path, key, 'q'))
+        elif item_type is dict and item and type(key) is str:
+            if not _flatten_numbers(item, path + (key,), layout, values):
+                return False
+            continue
+        else:
+            return False
+        if type(key) is not str:
+            return False
+        values.append(item)
+    return True
+
+
+def _telemetry_plan(value):
+    """Extraction plan of a nested dict of numbers: (keys, getter, types, children).
+
+    `types` are the value types of one level, `dict` for nested levels,
+    whose plans are listed in `children` as (position, plan).
+    """
+    keys = tuple(value)
+    getter = itemgetter(*keys) if len(keys) > 1 else (lambda node, key=keys[0]: (node[key],))
+    types = tuple(type(item) for item in value.values())
+    children = tuple((index, _telemetry_plan(item)) for index, item in enumerate(value.values())
+                     if type(item) is dict)
+    return keys, getter, types, children
+
+
+def _extract_numbers(plan, value, values):
+    """Append the values of a dict that has exactly the plan's shape; False if it does not.
+
+    Keys and types are compared a whole level at a time, values are laid
+    out in the same order as _flatten_numbers lays them out.
+    """
+    keys, getter, types, children = plan
+    # Nested levels are known to be dicts once their parent's types matched
+    if len(value) != len(keys):
+        return False
+    try:
+        items = getter(value)
+    except KeyError:
+        return False
+    if tuple(map(type, items)) != types:
+        return False
+    if not children:
+        values.extend(items)
+        return True
+
+    start = 0
+    for index, child in children:
+        values.extend(items[start:index])
+        if not _extract_numbers(child, items[index], values):
+            return False
+        start = index + 1
+    values.extend(items[start:])
+    return True
+
+
+class MessageChannel:
+    """Serializes, encrypts, chunks and frames messages for one connection"""
+
+    def __init__(self, cipher_suite, chunk_size=CHUNK_SIZE):
+        self.cipher_suite = cipher_suite
+        self.chunk_size = chunk_size
+
+        # Negotiated options, plain JSON until the hello exchange completes
+        self.encoding = 'json'
+        self.compression = None
+        self.telemetry = False
+
+        # Compression ratio and CPU time, logged at debug level
+        self.stats = {
+            'compressed_messages': 0,
+            'raw_bytes': 0,
+            'compressed_bytes': 0,
+            'compress_seconds': 0.0,
+            'decompress_seconds': 0.0
+        }
+
+        # Telemetry layouts: sent ones keyed by layout, received ones keyed by id
+        self._send_schemas = {}
+        self._recv_schemas = {}
+        # (plan, schema id, struct) of sent layouts by top-level keys, so a sample
+        # with a known shape skips building and looking up its layout
+        self._send_plans = {}
+
+    def negotiate(self, offer):
+        """Pick the options shared with a peer's hello offer (server side)"""
+        encodings = offer.get('encodings', [])
+        compressions = offer.get('compression', [])
+        return {
+            'encoding': next((name for name in ENCODINGS if name in encodings), 'json'),
+            'compression': next((name for name in COMPRESSIONS if name in compressions), None),
+            'telemetry': bool(offer.get('telemetry'))
+        }
+
+    def configure(self, agreed):
+        """Switch to the options agreed in the hello exchange"""
+        if agreed.get('encoding') in ENCODINGS:
+            self.encoding = agreed['encoding']
+        if agreed.get('compression') in COMPRESSIONS:
+            self.compression = agreed['compression']
+        self.telemetry = bool(agreed.get('telemetry'))
+
+    def compression_summary(self):
+        """One line summary of the compression stats for debug logs"""
+        stats = self.stats
+        if not stats['compressed_messages']:
+            return "no compressed messages"
+        ratio = stats['raw_bytes'] / max(stats['compressed_bytes'], 1)
+        return (f"{stats['compressed_messages']} messages, {stats['raw_bytes']} -> "
+                f"{stats['compressed_bytes']} bytes ({ratio:.1f}x), "
+                f"{stats['compress_seconds'] * 1000:.1f} ms compressing, "
+                f"{stats['decompress_seconds'] * 1000:.1f} ms decompressing")
+
+    def encode(self, message, telemetry=False, allow_compression=True):
+        """Serialize a message, returns (flags, payload).
+
+        Telemetry messages whose data is a nested dict of numbers are sent as
+        a struct of values; the field layout is only sent the first time it
+        is used on this connection. `allow_compression=False` skips
+        compression for payloads known not to shrink, such as file chunks.
+        """
+        packed = None
+        if telemetry and self.telemetry:
+            packed = self._pack_telemetry(message)
+        flags, payload = packed if packed is not None else self._serialize(message)
+
+        if allow_compression and self.compression and len(payload) >= COMPRESS_THRESHOLD:
+            started = time.thread_time()
+            compressed = compress(self.compression, payload)
+            elapsed = time.thread_time() - started
+
+            # Incompressible payloads are sent as they are
+            if len(compressed) < len(payload):
+                self.stats['compressed_messages'] += 1
+                self.stats['raw_bytes'] += len(payload)
+                self.stats['compressed_bytes'] += len(compressed)
+                self.stats['compress_seconds'] += elapsed
+                logging.debug(f"Compressed {len(payload)} -> {len(compressed)} bytes "
+                              f"({len(payload) / len(compressed):.1f}x) with {self.compression} "
+                              f"in {elapsed * 1000:.2f} ms")
+                flags |= COMPRESSION_CODECS[self.compression] << COMPRESSION_SHIFT
+                payload = compressed
+
+        return flags, payload
+
+    def decode(self, flags, payload):
+        """Inverse of encode()"""
+        codec_id = (flags & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+        if codec_id:
+            codec = next((name for name, value in COMPRESSION_CODECS.items() if value == codec_id), None)
+            started = time.thread_time()
+            payload = decompress(codec, payload)
+            self.stats['decompress_seconds'] += time.thread_time() - started
+
+        if flags & FLAG_TELEMETRY:
+            return self._unpack_telemetry(flags, payload)
+        return self._deserialize(flags, payload)
+
+    def _serialize(self, obj):
+        if self.encoding == 'msgpack':
+            return FLAG_MSGPACK, msgpack.packb(obj, use_bin_type=True)
+        return 0, json.dumps(obj).encode()
+
+    def _deserialize(self, flags, payload):
+        if flags & FLAG_MSGPACK:
+            if msgpack is None:
+                raise ProtocolError("Peer sent msgpack but msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        return json.loads(bytes(payload).decode())
+
+    def _pack_telemetry(self, message):
+        data = message.get('data')
+        if type(data) is not dict or not data:
+            return None
+
+        cached = self._send_plans.get(tuple(data))
+        if cached is not None:
+            plan, schema_id, values_struct = cached
+            values = []
+            if _extract_numbers(plan, data, values):
+                try:
+                    packed_values = values_struct.pack(*values)
+                except struct.error:
+                    # An int outside the 64 bit range, let the full check reject it
+                    packed_values = None
+                if packed_values is not None:
+                    return self._telemetry_frame(message, schema_id, b'', packed_values)
+
+        layout, values = [], []
+        if not _flatten_numbers(data, (), layout, values):
+            return None
+
+        layout = tuple(layout)
+        schema_bytes = b''
+        if layout in self._send_schemas:
+            schema_id, values_struct = self._send_schemas[layout]
+        else:
+            if len(self._send_schemas) >= MAX_TELEMETRY_SCHEMAS:
+                return None
+            schema_id = len(self._send_schemas)
+            values_struct = struct.Struct('<' + ''.join(code for _, _, code in layout))
+            self._send_schemas[layout] = (schema_id, values_struct)
+            schema_bytes = json.dumps([[list(path) + [key], code] for path, key, code in layout]).encode()
+        self._send_plans[tuple(data)] = (_telemetry_plan(data), schema_id, values_struct)
+
+        return self._telemetry_frame(message, schema_id, schema_bytes, values_struct.pack(*values))
+
+    def _telemetry_frame(self, message, schema_id, schema_bytes, packed_values):
+        flags, envelope = self._serialize({key: value for key, value in message.items() if key != 'data'})
+        header = TELEMETRY_HEADER.pack(schema_id, len(schema_bytes), len(envelope))
+        return flags | FLAG_TELEMETRY, b''.join((header, schema_bytes, envelope, packed_values))
+
+    def _unpack_telemetry(self, flags, payload):
+        schema_id, schema_length, envelope_length = TELEMETRY_HEADER.unpack_from(payload)
+        offset = TELEMETRY_HEADER.size
+
+        if schema_length:
+            layout = [(tuple(path), code)
+                      for path, code in json.loads(bytes(payload[offset:offset + schema_length]))]
+            values_struct = struct.Struct('<' + ''.join(code for _, code in layout))
+            self._recv_schemas[schema_id] = (layout, values_struct)
+            offset += schema_length
+
+        if schema_id not in self._recv_schemas:
+            raise ProtocolError(f"Unknown telemetry schema {schema_id}")
+        layout, values_struct = self._recv_schemas[schema_id]
+
+        message = self._deserialize(flags, payload[offset:offset + envelope_length])
+        offset += envelope_length
+
+        data = {}
+        for (path, _), value in zip(layout, values_struct.unpack_from(payload, offset)):
+            node = data
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = value
+        message['data'] = data
+        return message
+
+    def pack_message(self, message, telemetry=False, allow_compression=True):
+        """Serialize a message into a list of ready to send frames"""
+        message_flags, payload = self.encode(message, telemetry, allow_compression)
+        # Chunks are views into the payload, only the cipher output is a new buffer
+        payload = memoryview(payload)
+        frames = []
+        offset = 0
+        while True:
+            chunk = payload[offset:offset + self.chunk_size]
+            offset += len(chunk)
+            flags = message_flags | (FLAG_MORE if offset < len(payload) else 0)
+            # The header is authenticated together with the chunk
+            header = FRAME_HEADER.pack(flags, len(chunk) + self.cipher_suite.overhead)
+            frames.append(header + self.cipher_suite.encrypt(chunk, header))
+            if not flags & FLAG_MORE:
+                return frames
+
+    def send_message(self, sock, message, telemetry=False, allow_compression=True):
+        """Send a complete message over a blocking socket"""
+        for frame in self.pack_message(message, telemetry, allow_compression):
+            sock.sendall(frame)
+
+    def recv_message(self, sock):
+        """Receive and decode one complete message from a blocking socket.
+
+        Raises socket.timeout if no message started arriving within the
+        socket timeout.
+        """
+        payload = bytearray()
+        first = True
+        while True:
+            header = recv_exact(sock, FRAME_HEADER.size, idle_timeout=first)
+            first = False
+            flags, length = self._unpack_header(header)
+
+            token = recv_exact(sock, length, idle_timeout=False)
+            payload += self.cipher_suite.decrypt(token, header)
+            self._check_size(payload)
+
+            if not flags & FLAG_MORE:
+                return self.decode(flags, payload)
+
+    async def read_message(self, reader):
+        """Receive and decode one complete message from an asyncio StreamReader"""
+        payload = bytearray()
+        while True:
+            header = await reader.readexactly(FRAME_HEADER.size)
+            flags, length = self._unpack_header(header)
+
+            token = await reader.readexactly(length)
+            payload += self.cipher_suite.decrypt(token, header)
+            self._check_size(payload)
+
+            if not flags & FLAG_MORE:
+                return self.decode(flags, payload)
+
+    def _unpack_header(self, header):
+        flags, length = FRAME_HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame of {length} bytes exceeds limit")
+        return flags, length
+
+    @staticmethod
+    def _check_size(payload):
+        # Frames keep coming until one lacks FLAG_MORE, a peer must not be able to send forever
+        if len(payload) > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Message exceeds {MAX_MESSAGE_SIZE} bytes")
+
+
+def _key_pair():
+    private = X25519PrivateKey.generate()
+    public = private.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return private, public
+
+
+def _session_channel(private, server_public, client_public, is_server, cipher_id):
+    """Build the message channel once both public keys are known"""
+    peer_public = client_public if is_server else server_public
+    secret = private.exchange(X25519PublicKey.from_public_bytes(peer_public))
+    cipher = SessionCipher.derive(secret, server_public + client_public, is_server, cipher_id)
+    return MessageChannel(cipher)
+
+
+def _parse_greeting(greeting):
+    magic, cipher_id, server_public = SERVER_GREETING.unpack(greeting)
+    if magic != HANDSHAKE_MAGIC or cipher_id not in CIPHERS:
+        raise ProtocolError("Unsupported server handshake")
+    return cipher_id, server_public
+
+
+def server_handshake(sock, cipher='aes-gcm'):
+    """Run the server side of the key exchange and return the message channel"""
+    private, public = _key_pair()
+    sock.sendall(SERVER_GREETING.pack(HANDSHAKE_MAGIC, CIPHER_IDS[cipher], public))
+    client_public = recv_exact(sock, PUBLIC_KEY_SIZE, idle_timeout=False)
+    return _session_channel(private, public, client_public, True, CIPHER_IDS[cipher])
+
+
+async def server_handshake_async(reader, writer, cipher='aes-gcm'):
+    """Asyncio variant of server_handshake"""
+    private, public = _key_pair()
+    writer.write(SERVER_GREETING.pack(HANDSHAKE_MAGIC, CIPHER_IDS[cipher], public))
+    await writer.drain()
+    client_public = await reader.readexactly(PUBLIC_KEY_SIZE)
+    return _session_channel(private, public, client_public, True, CIPHER_IDS[cipher])
+
+
+def hello_message():
+    """First message a client sends, offering its capabilities"""
+    return {'id': 0, 'type': 'hello', 'data': local_capabilities()}
+
+
+def _apply_hello_reply(channel, reply):
+    # If the agent rejects the hello both sides keep the plain JSON defaults
+    if reply.get('status') == 'success':
+        channel.configure(reply.get('data', {}))
+
+
+def client_handshake(sock):
+    """Run the client side of the connection handshake and return the message channel"""
+    cipher_id, server_public = _parse_greeting(recv_exact(sock, SERVER_GREETING.size, idle_timeout=False))
+    private, public = _key_pair()
+    sock.sendall(public)
+    channel = _session_channel(private, server_public, public, False, cipher_id)
+
+    channel.send_message(sock, hello_message())
+    _apply_hello_reply(channel, channel.recv_message(sock))
+    return channel
+
+
+async def client_handshake_async(reader, writer):
+    """Asyncio variant of client_handshake"""
+    cipher_id, server_public = _parse_greeting(await reader.readexactly(SERVER_GREETING.size))
+    private, public = _key_pair()
+    writer.write(public)
+    channel = _session_channel(private, server_public, public, False, cipher_id)
+
+    writer.writelines(channel.pack_message(hello_message()))
+    await writer.drain()
+    _apply_hello_reply(channel, await channel.read_message(reader))
+    return channel
@@ -1,14 +1,14 @@
 import socket
 import threading
+import asyncio
 import json
 import psutil
 import platform
 import subprocess
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import winreg
 import logging
-from cryptography.fernet import Fernet
 import sys
 import time
 import numpy as np
@@ -17,16 +17,34 @@ import pyautogui as ag
 import mouse
 from PIL import ImageGrab
 import struct
+import heapq
+import itertools
+import hashlib
+import base64
+import codecs
+import locale
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import re
+from protocol import (STREAM_SALT_SIZE, new_stream_key, recv_exact, server_handshake,
+                      server_handshake_async, stream_cipher)
 
 
 class RDPServer:
-    def __init__(self, host='0.0.0.0', port=80):
+    # Encrypted input event: key, action, x, y plus the AEAD tag
+    INPUT_EVENT = struct.Struct('>BBHH')
+
+    def __init__(self, host='0.0.0.0', port=80, session_key=None, cipher='aes-gcm'):
         # Configuration
         self.REFRESH_RATE = 0.05
         self.SCROLL_SENSITIVITY = 5
         self.IMAGE_QUALITY = 95
         self.BUFFER_SIZE = 1024
 
+        # Frames and input events are sealed with keys derived from this secret
+        self.session_key = session_key or new_stream_key()
+        self.cipher = cipher
+
         # Server setup
         self.host = (host, port)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -56,12 +74,17 @@ class RDPServer:
                 conn, addr = self.socket.accept()
                 print(f"New connection from {addr}")
 
+                # Fresh salt per connection, so no two streams share keys or nonces
+                salt = os.urandom(STREAM_SALT_SIZE)
+                conn.sendall(salt)
+                session_cipher = stream_cipher(self.session_key, salt, is_server=True, cipher=self.cipher)
+
                 # Store connection reference
                 self.active_connections.append(conn)
 
-                # Start display and input threads for the client
-                display_thread = threading.Thread(target=self.handle_display, args=(conn,))
-                input_thread = threading.Thread(target=self.handle_input, args=(conn,))
+                # Start display and input threads for the client, each owns one direction of the cipher
+                display_thread = threading.Thread(target=self.handle_display, args=(conn, session_cipher))
+                input_thread = threading.Thread(target=self.handle_input, args=(conn, session_cipher))
 
                 display_thread.daemon = True
                 input_thread.daemon = True
@@ -103,7 +126,13 @@ class RDPServer:
 
         print("RDP server stopped")
 
-    def handle_display(self, conn):
+    def send_frame(self, conn, session_cipher, frame_type, frame_data):
+        """Encrypt and send one display frame, the header is authenticated with it"""
+        header = struct.pack(">BI", frame_type, len(frame_data) + session_cipher.overhead)
+        conn.sendall(header)
+        conn.sendall(session_cipher.encrypt(frame_data.tobytes(), header))
+
+    def handle_display(self, conn, session_cipher):
         """Handle screen capture and transmission with improved error handling"""
         try:
             # Initial screen capture and send
@@ -113,9 +142,7 @@ class RDPServer:
                                           [cv2.IMWRITE_JPEG_QUALITY, self.IMAGE_QUALITY])
 
             # Send initial frame
-            header = struct.pack(">BI", 1, len(image_bytes))
-            conn.sendall(header)
-            conn.sendall(image_bytes)
+            self.send_frame(conn, session_cipher, 1, image_bytes)
 
             self.last_image = initial_image
 
@@ -136,9 +163,7 @@ class RDPServer:
                     _, frame_data = cv2.imencode('.jpg', screen,
                                                  [cv2.IMWRITE_JPEG_QUALITY, self.IMAGE_QUALITY])
 
-                    header = struct.pack(">BI", 1, len(frame_data))
-                    conn.sendall(header)
-                    conn.sendall(frame_data)
+                    self.send_frame(conn, session_cipher, 1, frame_data)
 
                     self.last_image = screen
                 except:
@@ -156,24 +181,25 @@ class RDPServer:
                 except:
                     pass
 
-    def handle_input(self, conn):
+    def handle_input(self, conn, session_cipher):
         """Handle input events from client with improved error handling"""
         try:
             # Get client platform info
-            platform = conn.recv(3)
+            platform = session_cipher.decrypt(recv_exact(conn, 3 + session_cipher.overhead))
             print(f"Client platform: {platform.decode()}")
 
             # Input event loop
+            event_size = self.INPUT_EVENT.size + session_cipher.overhead
             while self.running and conn in self.active_connections:
                 try:
-                    event_data = conn.recv(6)
-                    if not event_data or len(event_data) != 6:
-                        break
+                    event_data = session_cipher.decrypt(recv_exact(conn, event_size))
 
-                    key, action, x, y = struct.unpack('>BBHH', event_data)
+                    key, action, x, y = self.INPUT_EVENT.unpack(event_data)
                     self.process_input(key, action, x, y)
                 except socket.timeout:
                     continue
+                except ConnectionError:
+                    break
                 except Exception as e:
                     print(f"Input reception error: {e}")
                     break
@@ -268,8 +294,1463 @@ class RDPServer:
     MOUSE_MOVE = 204
 
 
+class ClientSession:
+    """State of one controller connection, shared by its reader and the handler threads"""
+
+    def __init__(self, sock, address, channel):
+        self.socket = sock
+        self.address = address
+        self.channel = channel
+        self.send_lock = threading.Lock()
+
+    def send(self, message, telemetry=False, allow_compression=True):
+        """Send a message, serializing writes from concurrent handlers"""
+        with self.send_lock:
+            self.channel.send_message(self.socket, message, telemetry, allow_compression)
+
+    def close(self):
+        try:
+            self.socket.close()
+        except:
+            pass
+
+
+class AsyncClientSession(ClientSession):
+    """Connection served by the asyncio event loop; send() may be called from any thread"""
+
+    # Seconds a handler thread waits for a controller that is not reading before the connection is dropped
+    SEND_TIMEOUT = 30.0
+
+    def __init__(self, reader, writer, address, channel, loop):
+        super().__init__(writer.get_extra_info('socket'), address, channel)
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+
+    def send(self, message, telemetry=False, allow_compression=True):
+        """Encrypt in the calling thread and hand the frames to the loop for writing.
+
+        Other threads then wait until the transport has drained, so a slow
+        controller holds back the handlers writing to it instead of letting
+        its write buffer grow.
+        """
+        with self.send_lock:
+            # Frames are queued under the lock so concurrent messages never interleave
+            frames = self.channel.pack_message(message, telemetry, allow_compression)
+            if self._on_loop():
+                self._write(frames)
+                return
+            drained = asyncio.run_coroutine_threadsafe(self._write_drained(frames), self.loop)
+
+        try:
+            drained.result(self.SEND_TIMEOUT)
+        except FutureTimeoutError:
+            drained.cancel()
+            # close() would wait for the buffered frames to be written first
+            self.loop.call_soon_threadsafe(self.writer.transport.abort)
+            raise ConnectionError(f"{self.address} stopped reading, connection closed")
+
+    def _on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _write(self, frames):
+        if not self.writer.is_closing():
+            self.writer.writelines(frames)
+
+    async def _write_drained(self, frames):
+        if not self.writer.is_closing():
+            self.writer.writelines(frames)
+            await self.writer.drain()
+
+    def close(self):
+        try:
+            self.loop.call_soon_threadsafe(self.writer.close)
+        except RuntimeError:
+            # Loop already closed
+            pass
+
+
+class MetricsHistory:
+    """Fixed-size ring buffers of recent samples, one per metric.
+
+    Every series is a preallocated float64 array sharing one timestamp
+    ring, so memory stays constant however long the agent runs. Series
+    that appear later (a new drive or NIC) start out as NaN.
+    """
+
+    def __init__(self, capacity=3600):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)
+        self.series = {}
+        self.position = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, timestamp, values):
+        with self.lock:
+            index = self.position
+            self.timestamps[index] = timestamp
+            for name, buffer in self.series.items():
+                buffer[index] = values.get(name, np.nan)
+            for name in values.keys() - self.series.keys():
+                buffer = np.full(self.capacity, np.nan)
+                buffer[index] = values[name]
+                self.series[name] = buffer
+
+            self.position = (index + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def names(self):
+        with self.lock:
+            return sorted(self.series)
+
+    def _ordered(self, names):
+        """Copy of the timestamps and the requested series, oldest sample first"""
+        with self.lock:
+            order = (np.arange(self.count) + self.position - self.count) % self.capacity
+            timestamps = self.timestamps[order]
+            return timestamps, {name: self.series[name][order] for name in names if name in self.series}
+
+    def query(self, start, end, points, names=None):
+        """Downsample [start, end] to at most `points` buckets of min/mean/max"""
+        timestamps, series = self._ordered(self.names() if names is None else names)
+
+        # Timestamps are ascending, so the range is a slice
+        first = np.searchsorted(timestamps, start, side='left')
+        last = np.searchsorted(timestamps, end, side='right')
+        timestamps = timestamps[first:last]
+        if not len(timestamps):
+            return {'timestamps': [], 'series': {name: {'min': [], 'mean': [], 'max': []} for name in series}}
+
+        # Bucket of each sample, reduceat works on the start offset of each non-empty bucket
+        width = (end - start) / points
+        buckets = np.minimum(((timestamps - start) / width).astype(np.int64), points - 1)
+        offsets = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+
+        result = {}
+        for name, values in series.items():
+            values = values[first:last]
+            missing = np.isnan(values)
+            counts = np.add.reduceat(~missing, offsets)
+            sums = np.add.reduceat(np.where(missing, 0.0, values), offsets)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / counts
+            result[name] = {
+                'min': self._to_list(np.fmin.reduceat(values, offsets)),
+                'mean': self._to_list(means),
+                'max': self._to_list(np.fmax.reduceat(values, offsets))
+            }
+
+        return {
+            'timestamps': (start + buckets[offsets] * width).tolist(),
+            'series': result
+        }
+
+    @staticmethod
+    def _to_list(values):
+        """NaN is not valid JSON, empty buckets become None"""
+        return [None if value != value else value for value in values.tolist()]
+
+
+class HardwareSampler:
+    """Keeps the latest CPU, memory, disk and network snapshot up to date.
+
+    A single background thread refreshes the snapshot every `interval`
+    seconds, so readers never block on psutil. Walking the partitions is
+    slower than the rest, so disks are only refreshed every `disk_interval`
+    seconds. Snapshots are replaced whole and must be treated as read-only.
+    Each sample is also recorded into `history` when one is given.
+
+    Per-interface counters are turned into bytes/s and packets/s on every
+    tick. Where psutil reports non-disk process I/O (other_bytes, Windows
+    only) the busiest processes are ranked every `process_interval`
+    seconds as an approximation of per-process network traffic.
+    """
+
+    # Counters of net_io_counters(pernic=True) that are turned into rates
+    RATE_COUNTERS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv')
+
+    # Processes listed in the per-process rate table
+    TOP_PROCESSES = 20
+
+    def __init__(self, interval=1.0, disk_interval=10.0, history=None, process_interval=5.0):
+        self.interval = interval
+        self.disk_interval = disk_interval
+        self.process_interval = process_interval
+        self.history = history
+        self.snapshot = None
+        self.rates = None
+        self.ready = threading.Event()
+        self.stop_event = threading.Event()
+
+        self.thread = threading.Thread(target=self._run, name='mcc-sampler', daemon=True)
+        self.thread.start()
+
+    def latest(self, wait=True):
+        """Most recent snapshot, waits for the very first one unless `wait` is false"""
+        if wait:
+            self.ready.wait(self.interval * 2)
+        return self.snapshot
+
+    def latest_rates(self, wait=True):
+        """Most recent rate table of interfaces and processes, waits like latest()"""
+        if wait:
+            self.ready.wait(self.interval * 2)
+        return self.rates
+
+    def stop(self):
+        self.stop_event.set()
+
+    def collect_disk_usage(self):
+        """Usage of every fixed drive"""
+        disk_usage = {}
+
+        # Safely collect disk usage information
+        for partition in psutil.disk_partitions(all=False):
+            try:
+                # Only check fixed drives and skip removable drives
+                if 'fixed' in partition.opts or partition.fstype == 'NTFS':
+                    usage = psutil.disk_usage(partition.mountpoint)
+                    disk_usage[partition.mountpoint] = dict(usage._asdict())
+            except Exception as e:
+                logging.warning(f"Could not access drive {partition.mountpoint}: {str(e)}")
+                continue
+
+        return disk_usage
+
+    def _run(self):
+        # The first non-blocking call only sets the reference point for the CPU figure
+        psutil.cpu_percent(interval=None)
+        disk_usage = None
+        disk_sampled = 0.0
+        previous_nics = psutil.net_io_counters(pernic=True)
+        previous_time = time.monotonic()
+
+        attribution = self._supports_process_io()
+        process_rates = [] if attribution else None
+        previous_processes = {}
+        process_sampled = previous_time
+
+        while not self.stop_event.wait(self.interval):
+            try:
+                now = time.monotonic()
+                if disk_usage is None or now - disk_sampled >= self.disk_interval:
+                    disk_usage = self.collect_disk_usage()
+                    disk_sampled = now
+
+                nics = psutil.net_io_counters(pernic=True)
+                network_rates = self._nic_rates(nics, previous_nics, now - previous_time)
+                previous_nics, previous_time = nics, now
+
+                if attribution and now - process_sampled >= self.process_interval:
+                    process_rates, previous_processes = self._process_rates(previous_processes,
+                                                                            now - process_sampled)
+                    process_sampled = now
+
+                snapshot = {
+                    'timestamp': time.time(),
+                    'cpu_percent': psutil.cpu_percent(interval=None),
+                    'memory_usage': dict(psutil.virtual_memory()._asdict()),
+                    'disk_usage': disk_usage,
+                    'network_io': dict(psutil.net_io_counters()._asdict()),
+                    'network_rates': network_rates
+                }
+                self.snapshot = snapshot
+                self.rates = {
+                    'timestamp': snapshot['timestamp'],
+                    'interfaces': network_rates,
+                    'processes': process_rates,
+                    'process_attribution': 'other_bytes' if attribution else None
+                }
+                self.ready.set()
+
+                if self.history is not None:
+                    self.history.record(snapshot['timestamp'], self._history_values(snapshot))
+            except Exception as e:
+                logging.error(f"Hardware sampling error: {str(e)}")
+
+    def _nic_rates(self, nics, previous_nics, elapsed):
+        """Per-second rates of every interface seen in both samples"""
+        rates = {}
+        for nic, counters in nics.items():
+            previous = previous_nics.get(nic)
+            if previous is None or elapsed <= 0:
+                continue
+            # Counters can wrap or reset when an adapter is reconnected
+            rates[nic] = {f'{counter}_per_sec': max(getattr(counters, counter) - getattr(previous, counter), 0) / elapsed
+                          for counter in self.RATE_COUNTERS}
+        return rates
+
+    @staticmethod
+    def _supports_process_io():
+        try:
+            return hasattr(psutil.Process().io_counters(), 'other_bytes')
+        except (AttributeError, psutil.Error):
+            return False
+
+    def _process_rates(self, previous, elapsed):
+        """Top processes by non-disk I/O per second, and the counters to diff against next time"""
+        current = {}
+        for process in psutil.process_iter(['name']):
+            try:
+                current[process.pid] = (process.info['name'], process.io_counters().other_bytes)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        rates = []
+        for pid, (name, other_bytes) in current.items():
+            if pid in previous and elapsed > 0:
+                rate = max(other_bytes - previous[pid][1], 0) / elapsed
+                if rate > 0:
+                    rates.append({'pid': pid, 'name': name, 'bytes_per_sec': rate})
+
+        rates.sort(key=lambda entry: entry['bytes_per_sec'], reverse=True)
+        return rates[:self.TOP_PROCESSES], current
+
+    @staticmethod
+    def _history_values(snapshot):
+        """Flat series values of one sample: percentages and per-NIC byte rates"""
+        values = {
+            'cpu_percent': snapshot['cpu_percent'],
+            'memory_percent': snapshot['memory_usage']['percent']
+        }
+        for mountpoint, usage in snapshot['disk_usage'].items():
+            values[f'disk:{mountpoint}'] = usage['percent']
+
+        for nic, rates in snapshot['network_rates'].items():
+            values[f'net:{nic}:sent'] = rates['bytes_sent_per_sec']
+            values[f'net:{nic}:recv'] = rates['bytes_recv_per_sec']
+        return values
+
+
+class TelemetryPublisher:
+    """Pushes telemetry samples to subscribed clients from a single thread.
+
+    Subscriptions sit in a min-heap ordered by their next due time, so the
+    thread only wakes up when a sample is actually due. Subscriptions that
+    come due together share one sample. Intervals are never shorter than
+    `min_interval`, the rate at which new samples are taken, and a sample
+    already sent to a subscriber is not sent to it again.
+    """
+
+    MIN_INTERVAL = 0.5
+
+    def __init__(self, sample_source, min_interval=MIN_INTERVAL):
+        self.sample_source = sample_source
+        self.min_interval = max(min_interval, self.MIN_INTERVAL)
+        self.subscriptions = {}
+        self.schedule = []
+        self.subscription_ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.thread = threading.Thread(target=self._run, name='mcc-telemetry', daemon=True)
+        self.thread.start()
+
+    def subscribe(self, session, metrics, interval):
+        interval = max(float(interval), self.min_interval)
+        with self.condition:
+            subscription_id = next(self.subscription_ids)
+            self.subscriptions[subscription_id] = {
+                'session': session,
+                'metrics': metrics,
+                'interval': interval
+            }
+            # First sample goes out right away
+            heapq.heappush(self.schedule, (time.monotonic(), subscription_id))
+            self.condition.notify()
+        return subscription_id, interval
+
+    def unsubscribe(self, subscription_id, session=None):
+        """Remove a subscription, optionally only if it belongs to the given session"""
+        with self.condition:
+            subscription = self.subscriptions.get(subscription_id)
+            if subscription is None or (session is not None and subscription['session'] is not session):
+                return False
+            del self.subscriptions[subscription_id]
+            # The heap entry is skipped when it comes due
+            return True
+
+    def remove_session(self, session):
+        """Drop every subscription of a closed connection"""
+        with self.condition:
+            for subscription_id in [key for key, value in self.subscriptions.items()
+                                    if value['session'] is session]:
+                del self.subscriptions[subscription_id]
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def _next_due(self):
+        """Wait for the next due subscriptions, returns them or None on stop"""
+        with self.condition:
+            while self.running:
+                # Skip entries of cancelled subscriptions
+                while self.schedule and self.schedule[0][1] not in self.subscriptions:
+                    heapq.heappop(self.schedule)
+
+                if not self.schedule:
+                    self.condition.wait()
+                    continue
+
+                now = time.monotonic()
+                due_time = self.schedule[0][0]
+                if due_time > now:
+                    self.condition.wait(due_time - now)
+                    continue
+
+                due = []
+                while self.schedule and self.schedule[0][0] <= now:
+                    _, subscription_id = heapq.heappop(self.schedule)
+                    subscription = self.subscriptions.get(subscription_id)
+                    if subscription is None:
+                        continue
+                    due.append((subscription_id, subscription))
+                    heapq.heappush(self.schedule, (now + subscription['interval'], subscription_id))
+                return due
+        return None
+
+    def _run(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+
+            try:
+                sample = self.sample_source()
+            except Exception as e:
+                logging.error(f"Telemetry sampling error: {str(e)}")
+                continue
+            if sample is None:
+                continue
+
+            for subscription_id, subscription in due:
+                # Timer jitter can fire before the sampler has a new sample
+                if sample.get('timestamp') == subscription.get('last_timestamp'):
+                    continue
+                subscription['last_timestamp'] = sample.get('timestamp')
+                metrics = subscription['metrics']
+                data = {key: value for key, value in sample.items()
+                        if not metrics or key in metrics or key == 'timestamp'}
+                try:
+                    subscription['session'].send({
+                        'event': 'telemetry',
+                        'subscription': subscription_id,
+                        'status': 'success',
+                        'data': data
+                    }, telemetry=True)
+                except (OSError, RuntimeError) as e:
+                    logging.warning(f"Dropping telemetry subscription {subscription_id}: {str(e)}")
+                    self.unsubscribe(subscription_id)
+
+
+class SoftwareInventoryCache:
+    """Installed programs from the Uninstall registry keys, cached between scans.
+
+    Every hive key and every program subkey is remembered together with the
+    last-write time QueryInfoKey reports for it. A hive whose key is
+    unchanged is served from memory; otherwise only subkeys with a new
+    timestamp are read again. Editing a program's values does not touch the
+    hive key, so subkey timestamps are also revalidated every
+    `revalidate_seconds`.
+
+    Every distinct inventory gets a token, a hash of its content, and the
+    last few are kept so a client holding an older token can be sent only
+    what changed since.
+    """
+
+    # Earlier inventories kept for answering with a delta
+    MAX_GENERATIONS = 8
+
+    UNINSTALL_KEYS = [
+        (winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall'),
+        (winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall'),
+        (winreg.HKEY_CURRENT_USER, r'SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall')
+    ]
+
+    # Skip system components and irrelevant entries
+    SKIP_KEYWORDS = [
+        "update", "microsoft", "windows", "cache", "installer",
+        "pack", "driver", "system", "component", "setup",
+        "prerequisite", "runtime", "application", "sdk"
+    ]
+
+    def __init__(self, revalidate_seconds=300):
+        self.revalidate_seconds = revalidate_seconds
+        self.hives = {}
+        self.missing = set()
+        self.software_list = None
+        self.token = None
+        self.generations = OrderedDict()
+        self.validated = 0.0
+        self.lock = threading.Lock()
+
+    def inventory(self):
+        """Current token and list of {'name', 'version'}, sorted by name"""
+        with self.lock:
+            revalidate = time.monotonic() - self.validated >= self.revalidate_seconds
+            changed = False
+            for reg_root, key_path in self.UNINSTALL_KEYS:
+                changed |= self._refresh_hive(reg_root, key_path, revalidate)
+            if revalidate:
+                self.validated = time.monotonic()
+
+            if changed or self.software_list is None:
+                self.software_list = self._build_list()
+                self._add_generation()
+            return self.token, self.software_list
+
+    def _add_generation(self):
+        programs = {software['name']: software['version'] for software in self.software_list}
+        digest = hashlib.sha256()
+        for software in self.software_list:
+            digest.update(f"{software['name']}\0{software['version']}\n".encode('utf-8'))
+        self.token = digest.hexdigest()[:16]
+
+        self.generations[self.token] = programs
+        self.generations.move_to_end(self.token)
+        while len(self.generations) > self.MAX_GENERATIONS:
+            self.generations.popitem(last=False)
+
+    def changes_since(self, old_token, new_token):
+        """Added, removed and updated programs between two tokens, None if either is unknown"""
+        with self.lock:
+            old = self.generations.get(old_token)
+            current = self.generations.get(new_token)
+            if old is None or current is None:
+                return None
+
+        return {
+            'added': [{'name': name, 'version': version} for name, version in current.items() if name not in old],
+            'removed': [name for name in old if name not in current],
+            'updated': [{'name': name, 'version': version} for name, version in current.items()
+                        if name in old and old[name] != version]
+        }
+
+    def _refresh_hive(self, reg_root, key_path, revalidate):
+        """Bring one hive up to date, returns True if any of its programs changed"""
+        hive_key = (reg_root, key_path)
+        cached = self.hives.get(hive_key)
+        reg_key = None
+        try:
+            reg_key = winreg.OpenKey(reg_root, key_path)
+            self.missing.discard(hive_key)
+            subkey_count, _, last_write = winreg.QueryInfoKey(reg_key)
+            if cached is not None and cached['last_write'] == last_write and not revalidate:
+                return False
+
+            old_entries = cached['entries'] if cached else {}
+            entries = {}
+            changed = cached is None
+            for i in range(subkey_count):
+                subkey = None
+                try:
+                    subkey_name = winreg.EnumKey(reg_key, i)
+                    subkey = winreg.OpenKey(reg_key, subkey_name)
+                    subkey_write = winreg.QueryInfoKey(subkey)[2]
+
+                    previous = old_entries.get(subkey_name)
+                    if previous is not None and previous[0] == subkey_write:
+                        entries[subkey_name] = previous
+                        continue
+
+                    entries[subkey_name] = (subkey_write, self._read_program(subkey))
+                    changed = True
+                except WindowsError:
+                    continue
+                finally:
+                    if subkey is not None:
+                        winreg.CloseKey(subkey)
+
+            changed |= entries.keys() != old_entries.keys()
+            self.hives[hive_key] = {'last_write': last_write, 'entries': entries}
+            return changed
+
+        except WindowsError as e:
+            # Report a missing key once rather than on every scan
+            if hive_key not in self.missing:
+                print(f"Error accessing {key_path}: {str(e)}")
+                self.missing.add(hive_key)
+            # A hive that vanished takes its programs with it
+            return self.hives.pop(hive_key, None) is not None
+        finally:
+            if reg_key is not None:
+                winreg.CloseKey(reg_key)
+
+    @staticmethod
+    def _read_program(subkey):
+        """(name, version) of an Uninstall subkey, None if it has no display name"""
+        try:
+            name = winreg.QueryValueEx(subkey, "DisplayName")[0].strip()
+        except (WindowsError, KeyError):
+            return None
+        if not name:
+            return None
+
+        version = "N/A"
+        try:
+            version = winreg.QueryValueEx(subkey, "DisplayVersion")[0].strip()
+        except (WindowsError, KeyError):
+            pass
+        return name, version
+
+    def _build_list(self):
+        software_list = []
+        seen_programs = set()
+
+        for key in self.UNINSTALL_KEYS:
+            hive = self.hives.get(key)
+            if hive is None:
+                continue
+            for _, program in hive['entries'].values():
+                if program is None or program[0] in seen_programs:
+                    continue
+                name, version = program
+                seen_programs.add(name)
+
+                if any(keyword in name.lower() for keyword in self.SKIP_KEYWORDS):
+                    continue
+
+                software_list.append({
+                    'name': name,
+                    'version': version
+                })
+
+        # Sort the list by program name
+        software_list.sort(key=lambda x: x['name'].lower())
+        return software_list
+
+
+class ProcessMonitor:
+    """Process table built from one process_iter pass per sample.
+
+    CPU% and I/O rates come from the difference to the cached times and
+    counters of the previous sample, keyed by pid and creation time so a
+    reused pid starts over. Each sample is a numbered generation; the last
+    few are kept so a client can be sent only the processes that started,
+    exited or changed since the generation it holds. Samples closer together
+    than `min_interval` reuse the latest generation.
+    """
+
+    ATTRS = ['pid', 'name', 'username', 'status', 'create_time', 'cpu_times', 'memory_info', 'io_counters']
+
+    SORT_KEYS = {
+        'cpu': lambda row: row['cpu_percent'],
+        'memory': lambda row: row['memory_rss'],
+        'io': lambda row: row['io_per_sec'] or 0
+    }
+
+    MAX_GENERATIONS = 4
+
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self.cpu_count = psutil.cpu_count() or 1
+        self.previous = {}
+        self.sampled = None
+        self.generation = 0
+        self.generations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """Latest generation number and {pid: row}, sampling again if it is old enough"""
+        with self.lock:
+            now = time.monotonic()
+            if self.sampled is not None and now - self.sampled < self.min_interval:
+                return self.generation, self.generations[self.generation]
+
+            elapsed = now - self.sampled if self.sampled is not None else None
+            rows, current = {}, {}
+            for process in psutil.process_iter(attrs=self.ATTRS, ad_value=None):
+                info = process.info
+                cpu_times, io = info['cpu_times'], info['io_counters']
+                cpu_total = cpu_times.user + cpu_times.system if cpu_times else None
+                io_total = io.read_bytes + io.write_bytes if io else None
+
+                key = (info['pid'], info['create_time'])
+                current[key] = (cpu_total, io_total)
+                previous = self.previous.get(key)
+
+                cpu_percent = io_per_sec = None
+                if previous is not None and elapsed:
+                    if cpu_total is not None and previous[0] is not None:
+                        # Share of the whole machine, like the overall cpu_percent
+                        cpu_percent = max(cpu_total - previous[0], 0) / elapsed / self.cpu_count * 100
+                    if io_total is not None and previous[1] is not None:
+                        io_per_sec = max(io_total - previous[1], 0) / elapsed
+
+                rows[info['pid']] = {
+                    'pid': info['pid'],
+                    'name': info['name'] or '',
+                    'user': info['username'],
+                    'status': info['status'],
+                    # Rounded so that noise does not count as a change
+                    'cpu_percent': round(cpu_percent or 0.0, 1),
+                    'memory_rss': info['memory_info'].rss if info['memory_info'] else 0,
+                    'io_per_sec': None if io_per_sec is None else int(io_per_sec)
+                }
+
+            self.previous = current
+            self.sampled = now
+            self.generation += 1
+            self.generations[self.generation] = rows
+            while len(self.generations) > self.MAX_GENERATIONS:
+                self.generations.popitem(last=False)
+            return self.generation, rows
+
+    def view(self, rows, sort_key, limit):
+        """Top `limit` rows by the sort key, all rows if limit is None"""
+        if limit is None:
+            return rows
+        top = heapq.nlargest(limit, rows.values(), key=self.SORT_KEYS[sort_key])
+        return {row['pid']: row for row in top}
+
+    def listing(self, sort_key='cpu', limit=None, since=None):
+        """Full view, or the changes to the view of generation `since` when it is still known"""
+        generation, rows = self.sample()
+        view = self.view(rows, sort_key, limit)
+        result = {'generation': generation, 'total': len(rows)}
+
+        with self.lock:
+            old_rows = self.generations.get(since) if since is not None else None
+        if old_rows is None:
+            result['processes'] = sorted(view.values(), key=self.SORT_KEYS[sort_key], reverse=True)
+            return result
+
+        old_view = self.view(old_rows, sort_key, limit)
+        result.update({
+            'since': since,
+            'started': [row for pid, row in view.items() if pid not in old_view],
+            'exited': [pid for pid in old_view if pid not in view],
+            'changed': [row for pid, row in view.items() if pid in old_view and old_view[pid] != row]
+        })
+        return result
+
+
+class FairQueue:
+    """Queues per priority in which clients take turns.
+
+    Each priority keeps one FIFO per client; popping serves the highest
+    priority with work and, within it, rotates between clients so one busy
+    client cannot push everyone else's work back. Not thread-safe on its own.
+    """
+
+    def __init__(self, priorities):
+        self.priorities = priorities
+        self.queues = {priority: OrderedDict() for priority in priorities}
+
+    def push(self, priority, client, item):
+        self.queues[priority].setdefault(client, deque()).append(item)
+
+    def pop(self, priorities=None):
+        """Next (priority, client, item) among the given priorities, None if they are empty"""
+        for priority in priorities or self.priorities:
+            clients = self.queues[priority]
+            if not clients:
+                continue
+            client, items = next(iter(clients.items()))
+            item = items.popleft()
+            if items:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            return priority, client, item
+        return None
+
+    def depth(self):
+        return {priority: sum(len(items) for items in clients.values())
+                for priority, clients in self.queues.items()}
+
+    def client_depth(self):
+        depth = Counter()
+        for clients in self.queues.values():
+            for client, items in clients.items():
+                depth[client] += len(items)
+        return dict(depth)
+
+    def __len__(self):
+        return sum(self.depth().values())
+
+
+class CommandScheduler:
+    """Bounded worker pool that serves queued commands fairly and by priority.
+
+    `reserved` of the workers only take high priority work, so telemetry and
+    power commands still run while every other worker is busy with slow
+    inventories or shells. Tracks queue depth, waiting time and throughput.
+    """
+
+    PRIORITIES = ('high', 'normal', 'low')
+
+    def __init__(self, workers=8, reserved=1):
+        self.queue = FairQueue(self.PRIORITIES)
+        self.condition = threading.Condition()
+        self.running = True
+        self.busy = 0
+        self.submitted = Counter()
+        self.completed = Counter()
+        self.wait_time = Counter()
+        self.max_depth = 0
+
+        reserved = min(reserved, workers - 1)
+        self.threads = []
+        for index in range(workers):
+            priorities = self.PRIORITIES[:1] if index < reserved else self.PRIORITIES
+            thread = threading.Thread(target=self._worker, args=(priorities,),
+                                      name=f'mcc-worker-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, client, priority, func, *args):
+        """Queue func(*args) for a client, returns a concurrent.futures.Future"""
+        future = Future()
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("Scheduler is shut down")
+            self.queue.push(priority, client, (future, func, args, time.monotonic()))
+            self.submitted[priority] += 1
+            self.max_depth = max(self.max_depth, len(self.queue))
+            # Reserved workers only wake for high priority work, so wake everyone
+            self.condition.notify_all()
+        return future
+
+    def stats(self):
+        with self.condition:
+            return {
+                'workers': len(self.threads),
+                'busy': self.busy,
+                'queued': self.queue.depth(),
+                'queued_by_client': {str(client): depth for client, depth in self.queue.client_depth().items()},
+                'max_queued': self.max_depth,
+                'submitted': dict(self.submitted),
+                'completed': dict(self.completed),
+                'average_wait_ms': {priority: self.wait_time[priority] / self.completed[priority] * 1000
+                                    for priority in self.completed}
+            }
+
+    def shutdown(self):
+        """Stop taking work; queued commands are cancelled"""
+        with self.condition:
+            self.running = False
+            while True:
+                entry = self.queue.pop()
+                if entry is None:
+                    break
+                entry[2][0].cancel()
+            self.condition.notify_all()
+
+    def _worker(self, priorities):
+        while True:
+            with self.condition:
+                entry = self.queue.pop(priorities)
+                while entry is None and self.running:
+                    self.condition.wait()
+                    entry = self.queue.pop(priorities)
+                if entry is None:
+                    return
+                priority, _, (future, func, args, queued) = entry
+                self.busy += 1
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.busy -= 1
+                    self.completed[priority] += 1
+                    self.wait_time[priority] += time.monotonic() - queued
+
+
+class CommandJob:
+    """One command started by execute_command, with the tail of its output"""
+
+    def __init__(self, job_id, command, process, on_exit=None):
+        self.job_id = job_id
+        self.command = command
+        self.process = process
+        self.status = 'running'
+        self.return_code = None
+        self.started = time.time()
+        self.finished = None
+        # Called with the job once it has exited, failed or was cancelled
+        self.on_exit = on_exit
+
+        # (offset, stream, text) chunks; offsets count characters across both streams
+        self.chunks = []
+        self.output_size = 0
+        self.kept_size = 0
+        self.subscribers = set()
+
+    def summary(self):
+        return {
+            'job': self.job_id,
+            'command': self.command,
+            'status': self.status,
+            'return_code': self.return_code,
+            'started': self.started,
+            'finished': self.finished,
+            'output_size': self.output_size
+        }
+
+
+class JobManager:
+    """Runs commands in the background and streams their output.
+
+    At most `max_running` shells run at once; further jobs wait as
+    'queued' and clients take turns starting theirs. Each running job gets
+    a reader thread per pipe. Output is pushed to subscribed connections as
+    'job_output' events as soon as it is read, and the last `max_output`
+    characters are kept for job_tail. Finished jobs stay listed until more
+    than `max_finished` have piled up.
+    """
+
+    READ_SIZE = 4096
+
+    def __init__(self, max_running=4, max_output=1024 * 1024, max_finished=50):
+        self.max_running = max_running
+        self.max_output = max_output
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()
+        self.job_ids = itertools.count(1)
+        self.waiting = FairQueue(('normal',))
+        self.running = 0
+        self.lock = threading.Lock()
+        self.encoding = locale.getpreferredencoding(False)
+
+    def start(self, command, session=None, client=None, on_exit=None):
+        """Start a job now if a slot is free, otherwise queue it for the client"""
+        with self.lock:
+            job = CommandJob(next(self.job_ids), command, None, on_exit)
+            if session is not None:
+                job.subscribers.add(session)
+            self.jobs[job.job_id] = job
+            self._prune()
+
+            if self.running >= self.max_running:
+                job.status = 'queued'
+                self.waiting.push('normal', client, job)
+                return job
+            self.running += 1
+
+        self._launch(job)
+        return job
+
+    def queued(self):
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job.status == 'queued')
+
+    def _launch(self, job):
+        try:
+            job.process = subprocess.Popen(
+                job.command,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0
+            )
+        except Exception as e:
+            logging.error(f"Job {job.job_id} failed to start: {str(e)}")
+            job.status = 'failed'
+            self._finish(job)
+            return
+
+        with self.lock:
+            job.started = time.time()
+            cancelled = job.status == 'cancelled'
+        if cancelled:
+            # Cancelled while its shell was starting
+            job.process.kill()
+
+        stderr_thread = threading.Thread(target=self._read_stream, args=(job, 'stderr', job.process.stderr),
+                                         name=f'mcc-job-{job.job_id}-stderr', daemon=True)
+        stderr_thread.start()
+        threading.Thread(target=self._run, args=(job, stderr_thread),
+                         name=f'mcc-job-{job.job_id}', daemon=True).start()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.summary() for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        """Stop a running job and everything it started, or drop a queued one"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ('running', 'queued'):
+                return job
+            was_queued = job.status == 'queued'
+            job.status = 'cancelled'
+
+        if was_queued:
+            # Skipped when it reaches the front of the queue
+            job.finished = time.time()
+            self._exited(job)
+            return job
+
+        if job.process is None:
+            # Still starting, _launch kills it once the shell exists
+            return job
+
+        try:
+            parent = psutil.Process(job.process.pid)
+            for child in parent.children(recursive=True):
+                child.kill()
+            parent.kill()
+        except psutil.NoSuchProcess:
+            pass
+        return job
+
+    def tail(self, job_id, offset=0, session=None):
+        """Output chunks from offset on; with a session, stream what follows to it too"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            chunks = [{'offset': start, 'stream': stream, 'text': text}
+                      for start, stream, text in job.chunks if start + len(text) > offset]
+            if chunks and chunks[0]['offset'] < offset:
+                chunks[0]['text'] = chunks[0]['text'][offset - chunks[0]['offset']:]
+                chunks[0]['offset'] = offset
+            if session is not None and job.status in ('running', 'queued'):
+                job.subscribers.add(session)
+
+            result = job.summary()
+            result['chunks'] = chunks
+            return result
+
+    def remove_session(self, session):
+        with self.lock:
+            for job in self.jobs.values():
+                job.subscribers.discard(session)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status not in ('running', 'queued')]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job_id]
+
+    def _run(self, job, stderr_thread):
+        self._read_stream(job, 'stdout', job.process.stdout)
+        stderr_thread.join()
+        return_code = job.process.wait()
+        with self.lock:
+            job.return_code = return_code
+            if job.status == 'running':
+                job.status = 'exited'
+        self._finish(job)
+
+    def _finish(self, job):
+        """Report a job's end and hand its slot to the next queued job"""
+        job.finished = time.time()
+        logging.info(f"Job {job.job_id} {job.status} with code {job.return_code}")
+        self._exited(job)
+
+        with self.lock:
+            job.subscribers.clear()
+            next_job = None
+            while next_job is None:
+                entry = self.waiting.pop()
+                if entry is None:
+                    self.running -= 1
+                    return
+                if entry[2].status == 'queued':
+                    next_job = entry[2]
+                    next_job.status = 'running'
+
+        self._launch(next_job)
+
+    def _exited(self, job):
+        self._publish(job, {
+            'event': 'job_exit',
+            'status': 'success',
+            'data': job.summary()
+        })
+        if job.on_exit is not None:
+            try:
+                job.on_exit(job)
+            except Exception as e:
+                logging.error(f"Job {job.job_id} exit callback failed: {str(e)}")
+
+    def _read_stream(self, job, stream, pipe):
+        # Multi-byte characters may be split across reads
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        try:
+            while True:
+                data = pipe.read(self.READ_SIZE)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    self._append(job, stream, text)
+                if not data:
+                    break
+        except (OSError, ValueError) as e:
+            logging.warning(f"Job {job.job_id} {stream} read error: {str(e)}")
+        finally:
+            pipe.close()
+
+    def _append(self, job, stream, text):
+        with self.lock:
+            offset = job.output_size
+            job.chunks.append((offset, stream, text))
+            job.output_size += len(text)
+            job.kept_size += len(text)
+            while job.kept_size > self.max_output and len(job.chunks) > 1:
+                job.kept_size -= len(job.chunks.pop(0)[2])
+
+        self._publish(job, {
+            'event': 'job_output',
+            'status': 'success',
+            'data': {'job': job.job_id, 'stream': stream, 'offset': offset, 'text': text}
+        })
+
+    def _publish(self, job, message):
+        with self.lock:
+            subscribers = list(job.subscribers)
+        for session in subscribers:
+            try:
+                session.send(message)
+            except (OSError, RuntimeError):
+                with self.lock:
+                    job.subscribers.discard(session)
+
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields take `*`, numbers, ranges (`1-5`), lists (`1,15`) and steps
+    (`*/10`, `8-18/2`). Day-of-week runs 0-6 from Sunday, 7 is Sunday too.
+    As in cron, a day matches when either day field does if both are set.
+    """
+
+    FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError("Cron expression needs 5 fields: minute hour day month weekday")
+
+        self.expression = expression
+        values = [self._parse(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {day % 7 for day in weekdays}
+        # '*/N' leaves the field as unrestricted as '*' for cron's day matching rule
+        self.any_day = parts[2].startswith('*')
+        self.any_weekday = parts[4].startswith('*')
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for item in field.split(','):
+            item, _, step = item.partition('/')
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = map(int, item.split('-', 1))
+            else:
+                start = end = int(item)
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Cron field '{field}' is out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        # datetime counts weekdays from Monday, cron from Sunday
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, timestamp):
+        """First matching minute strictly after timestamp, in local time"""
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Whole months, days and hours are skipped at once instead of walking every minute
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+class TaskScheduler:
+    """Runs commands at set times or on a cron schedule, surviving restarts.
+
+    Due times sit in a min-heap served by one timer thread that sleeps until
+    the earliest is due, so thousands of tasks cost nothing while idle. Every
+    change is appended to a JSON-lines journal that is replayed on start, and
+    rewritten with only the live tasks once it has grown well past them.
+    Runs missed by more than `grace` seconds while the agent was down are
+    skipped rather than fired late.
+    """
+
+    # Wall-clock changes are noticed within this many seconds
+    MAX_SLEEP = 60.0
+
+    # The journal is compacted past this many records per live task, and at least MIN_COMPACT_RECORDS
+    COMPACT_RATIO = 4
+    MIN_COMPACT_RECORDS = 100
+
+    def __init__(self, journal_path, runner, grace=300.0):
+        # Relative paths belong to the agent's install, not whatever directory it was started from
+        self.journal_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), journal_path)
+        self.runner = runner
+        self.grace = grace
+        self.tasks = {}
+        self.heap = []
+        self.task_ids = itertools.count(1)
+        self.journal_records = 0
+        self.condition = threading.Condition()
+        self.running = True
+
+        with self.condition:
+            self._load()
+        self.thread = threading.Thread(target=self._run, name='mcc-tasks', daemon=True)
+        self.thread.start()
+
+    def schedule(self, command, at=None, cron=None, name=None):
+        """Add a task that runs `command` once at `at` or whenever `cron` matches"""
+        schedule = CronSchedule(cron) if cron else None
+        if schedule is None and at is None:
+            raise ValueError("A task needs a time or a cron expression")
+
+        with self.condition:
+            task = {
+                'id': next(self.task_ids),
+                'name': name or command.get('type'),
+                'command': command,
+                'cron': cron,
+                'next_run': float(at) if schedule is None else schedule.next_after(time.time()),
+                'last_run': None,
+                'last_status': None,
+                'runs': 0
+            }
+            self._add(task, schedule)
+            self._journal({'op': 'add', 'task': self._record(task)})
+            return self._record(task)
+
+    def cancel(self, task_id):
+        with self.condition:
+            task = self.tasks.pop(task_id, None)
+            if task is not None:
+                # Its heap entry is dropped when it comes up
+                self._journal({'op': 'cancel', 'id': task_id})
+            return task
+
+    def list(self):
+        with self.condition:
+            return [self._record(task) for task in sorted(self.tasks.values(), key=lambda task: task['next_run'])]
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    @staticmethod
+    def _record(task):
+        """A task as journaled and listed, the cron expression stands in for its parsed schedule"""
+        return {key: value for key, value in task.items() if key != 'schedule'}
+
+    def _add(self, task, schedule=None):
+        task['schedule'] = schedule
+        self.tasks[task['id']] = task
+        heapq.heappush(self.heap, (task['next_run'], task['id']))
+        if self.heap[0][1] == task['id']:
+            # New earliest task, the timer thread has to wake sooner
+            self.condition.notify()
+
+    def _journal(self, record):
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(json.dumps(record) + '\n')
+            self.journal_records += 1
+        except OSError as e:
+            logging.error(f"Could not write task journal: {str(e)}")
+
+    def _compact(self):
+        """Rewrite the journal with one record per live task"""
+        try:
+            temp_path = self.journal_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as journal:
+                for task in self.tasks.values():
+                    journal.write(json.dumps({'op': 'add', 'task': self._record(task)}) + '\n')
+            os.replace(temp_path, self.journal_path)
+            self.journal_records = len(self.tasks)
+        except OSError as e:
+            logging.error(f"Could not compact task journal: {str(e)}")
+
+    def _load(self):
+        """Replay the journal, then rewrite it with only the live tasks"""
+        tasks = {}
+        try:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a torn last line
+                        continue
+                    if record['op'] == 'add':
+                        tasks[record['task']['id']] = record['task']
+                    elif record['op'] == 'run' and record['id'] in tasks:
+                        tasks[record['id']].update(next_run=record['next_run'], last_run=record['last_run'],
+                                                   runs=record['runs'], last_status=record.get('last_status'))
+                    elif record['op'] in ('cancel', 'done'):
+                        tasks.pop(record['id'], None)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Could not read task journal: {str(e)}")
+
+        now = time.time()
+        for task in tasks.values():
+            schedule = CronSchedule(task['cron']) if task['cron'] else None
+            if task['next_run'] < now - self.grace:
+                if schedule is None:
+                    logging.warning(f"Skipping task {task['id']} ({task['name']}), missed while stopped")
+                    continue
+                task['next_run'] = schedule.next_after(now)
+            self._add(task, schedule)
+        self.task_ids = itertools.count(max(tasks, default=0) + 1)
+        self._compact()
+        logging.info(f"Loaded {len(self.tasks)} scheduled tasks")
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    # Each run adds records, a repeating task would grow the journal until the next restart
+                    if self.journal_records > max(self.COMPACT_RATIO * len(self.tasks), self.MIN_COMPACT_RECORDS):
+                        self._compact()
+                    # Drop entries of cancelled or rescheduled tasks
+                    while self.heap and self.tasks.get(self.heap[0][1], {}).get('next_run') != self.heap[0][0]:
+                        heapq.heappop(self.heap)
+                    delay = self.heap[0][0] - time.time() if self.heap else self.MAX_SLEEP
+                    if delay <= 0:
+                        break
+                    self.condition.wait(min(delay, self.MAX_SLEEP))
+                if not self.running:
+                    return
+
+                _, task_id = heapq.heappop(self.heap)
+                task = self.tasks[task_id]
+                task['last_run'] = time.time()
+                task['runs'] += 1
+                if task['schedule'] is not None:
+                    task['next_run'] = task['schedule'].next_after(task['last_run'])
+                    heapq.heappush(self.heap, (task['next_run'], task_id))
+                    self._journal_run(task)
+                else:
+                    del self.tasks[task_id]
+                    self._journal({'op': 'done', 'id': task_id})
+
+            logging.info(f"Running scheduled task {task_id} ({task['name']})")
+            try:
+                self.runner(task['command']).add_done_callback(
+                    lambda done, task=task: self._record_result(task, done))
+            except Exception as e:
+                logging.error(f"Scheduled task {task_id} failed to start: {str(e)}")
+                self._set_status(task, str(e))
+
+    def _journal_run(self, task):
+        self._journal({'op': 'run', 'id': task['id'], 'next_run': task['next_run'], 'last_run': task['last_run'],
+                       'runs': task['runs'], 'last_status': task['last_status']})
+
+    def _record_result(self, task, done):
+        try:
+            response = done.result()
+            if response.get('status') == 'success':
+                status = 'success'
+            else:
+                status = response.get('message', 'error')
+        except Exception as e:
+            status = str(e)
+        logging.info(f"Scheduled task {task['id']} finished: {status}")
+        self._set_status(task, status)
+
+    def _set_status(self, task, status):
+        """Keep a run's outcome, journaled so list_tasks still shows it after a restart"""
+        with self.condition:
+            task['last_status'] = status
+            if self.tasks.get(task['id']) is task:
+                self._journal_run(task)
+
+
 class MCCServer:
-    def __init__(self, host='0.0.0.0', port=5000):
+    # Cheap handlers that are run directly on the event loop in asyncio mode
+    INLINE_COMMANDS = {'system_info', 'hardware_monitor', 'network_rates'}
+
+    # Scheduling priority of each command, anything else is 'normal'. Workers held
+    # back for 'high' keep telemetry and power commands responsive under load
+    COMMAND_PRIORITIES = {
+        'system_info': 'high',
+        'hardware_monitor': 'high',
+        'network_rates': 'high',
+        'subscribe': 'high',
+        'unsubscribe': 'high',
+        'power_management': 'high',
+        'process_kill': 'high',
+        'job_cancel': 'high',
+        'scheduler_stats': 'high',
+        'cancel_task': 'high',
+        'software_inventory': 'low',
+        'file_put': 'low',
+        'file_get': 'low',
+        'network_monitor': 'low',
+        'metrics_history': 'low'
+    }
+
+    # Handlers whose numeric samples may use the compact telemetry encoding
+    TELEMETRY_COMMANDS = {'hardware_monitor'}
+
+    # Metrics a telemetry subscription can ask for
+    TELEMETRY_METRICS = {'cpu_percent', 'memory_usage', 'disk_usage', 'network_io', 'network_rates'}
+
+    # Handlers without side effects, a batch runs these concurrently
+    READ_ONLY_COMMANDS = {'system_info', 'hardware_monitor', 'metrics_history', 'software_inventory',
+                          'network_monitor', 'network_rates', 'process_list', 'job_poll', 'job_tail',
+                          'scheduler_stats', 'list_tasks', 'file_get'}
+
+    # Sort orders of software_inventory, versions compare number by number
+    SOFTWARE_SORT_KEYS = {
+        'name': lambda software: software['name'].lower(),
+        'version': lambda software: [int(part) if part.isdigit() else part
+                                     for part in re.split(r'(\d+)', software['version'].lower())]
+    }
+
+    # Connection rows per network_monitor page, by default and at most
+    NETWORK_PAGE_SIZE = 500
+    MAX_NETWORK_PAGE_SIZE = 5000
+
+    # Most buckets a metrics_history reply may ask for
+    MAX_HISTORY_POINTS = 3600
+
+    # Bytes per file_get chunk by default and at most, also the largest file_put chunk
+    FILE_CHUNK_SIZE = 1024 * 1024
+    MAX_FILE_CHUNK_SIZE = 4 * 1024 * 1024
+
+    # Replies carrying file data, which seldom compresses and is not worth trying
+    UNCOMPRESSED_COMMANDS = {'file_get'}
+
+    def __init__(self, host='0.0.0.0', port=5000, max_workers=8, cipher='aes-gcm', sample_interval=1.0,
+                 history_seconds=3600, reserved_workers=1, max_jobs=4, task_journal='scheduled_tasks.jsonl'):
         # Setup logging first
         logging.basicConfig(
             level=logging.DEBUG,
@@ -286,10 +1767,39 @@ class MCCServer:
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.clients = {}
-        self.encryption_key = Fernet.generate_key()
-        self.cipher_suite = Fernet(self.encryption_key)
+        # AEAD used for every session, keys are agreed per connection
+        self.cipher = cipher
         self.running = True
 
+        # Requests are queued per client and priority and run on a bounded pool,
+        # with workers held back for high priority commands
+        self.scheduler = CommandScheduler(workers=max_workers, reserved=reserved_workers)
+
+        # Set while running in asyncio mode
+        self.loop = None
+        self.stop_event = None
+
+        # Uninstall registry keys, rescanned only where their last-write time changed
+        self.software_cache = SoftwareInventoryCache()
+
+        # Background command jobs of execute_command
+        self.jobs = JobManager(max_running=max_jobs)
+
+        # Commands run at set times or on a cron schedule, kept in a journal across restarts
+        self.tasks = TaskScheduler(task_journal, self.run_scheduled_task)
+
+        # Process table shared by every process_list caller
+        self.processes = ProcessMonitor()
+
+        # Constant-size history of every sample, enough for history_seconds
+        self.history = MetricsHistory(capacity=max(int(history_seconds / sample_interval), 1))
+
+        # Hardware snapshot refreshed in the background, read by hardware_monitor and telemetry
+        self.sampler = HardwareSampler(interval=sample_interval, history=self.history)
+
+        # Server-push telemetry for subscribed clients
+        self.publisher = TelemetryPublisher(self.sampler.latest, min_interval=sample_interval)
+
         self.rdp_server = None
         self.rdp_thread = None
 
@@ -322,29 +1832,33 @@ class MCCServer:
             client_socket.settimeout(1.0)
             logging.info(f"New connection from {address}")
 
-            client_socket.send(self.encryption_key)
+            channel = server_handshake(client_socket, self.cipher)
+            session = ClientSession(client_socket, address, channel)
 
             self.clients[address] = {
                 'socket': client_socket,
+                'session': session,
                 'last_seen': datetime.now(),
                 'system_info': self.get_system_info()
             }
 
             while self.running:
                 try:
-                    encrypted_data = client_socket.recv(4096)
-                    if not encrypted_data:
-                        break
-
-                    data = self.cipher_suite.decrypt(encrypted_data).decode()
-                    command = json.loads(data)
-                    response = self.process_command(command)
-
-                    encrypted_response = self.cipher_suite.encrypt(json.dumps(response).encode())
-                    client_socket.send(encrypted_response)
+                    command = session.channel.recv_message(client_socket)
+                    self.clients[address]['last_seen'] = datetime.now()
+
+                    if command.get('type') == 'hello':
+                        self.handle_hello(session, command)
+                    elif command.get('id') is None:
+                        # Legacy clients expect strictly one response per request, in order
+                        self.handle_request(session, command)
+                    else:
+                        self.schedule_request(session, command)
 
                 except socket.timeout:
                     continue
+                except ConnectionError:
+                    break
                 except Exception as e:
                     logging.error(f"Error handling client {address}: {str(e)}")
                     break
@@ -352,13 +1866,122 @@ class MCCServer:
         except Exception as e:
             logging.error(f"Client handler error for {address}: {str(e)}")
         finally:
-            self.clients.pop(address, None)
+            client = self.clients.pop(address, None)
             try:
                 client_socket.close()
             except:
                 pass
+            if client:
+                self.publisher.remove_session(client['session'])
+                self.jobs.remove_session(client['session'])
+                logging.debug(f"Compression for {address}: {client['session'].channel.compression_summary()}")
+            logging.info(f"Connection closed from {address}")
+
+    def start_async(self):
+        """Run the server on an asyncio event loop instead of a thread per client"""
+        try:
+            asyncio.run(self.serve_async())
+        except Exception as e:
+            logging.error(f"Server error: {str(e)}")
+        finally:
+            self.stop()
+
+    async def serve_async(self):
+        """Accept connections on the running loop until stop() is called"""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+
+        server = await asyncio.start_server(self.handle_client_async, self.host, self.port)
+        logging.info(f"Serving on {self.host}:{self.port} (asyncio mode)")
+
+        async with server:
+            await self.stop_event.wait()
+
+    async def handle_client_async(self, reader, writer):
+        """Serve one connection on the event loop, blocking handlers go to the executor"""
+        address = writer.get_extra_info('peername')
+        logging.info(f"New connection from {address}")
+
+        session = None
+        try:
+            channel = await server_handshake_async(reader, writer, self.cipher)
+            session = AsyncClientSession(reader, writer, address, channel, self.loop)
+
+            self.clients[address] = {
+                'socket': session.socket,
+                'session': session,
+                'last_seen': datetime.now(),
+                'system_info': self.get_system_info()
+            }
+
+            while self.running:
+                command = await session.channel.read_message(reader)
+                self.clients[address]['last_seen'] = datetime.now()
+
+                if command.get('type') == 'hello':
+                    self.handle_hello(session, command)
+                elif command.get('type') in self.INLINE_COMMANDS:
+                    self.handle_request(session, command)
+                elif command.get('id') is None:
+                    # Legacy clients expect strictly one response per request, in order
+                    await asyncio.wrap_future(self.schedule_request(session, command))
+                else:
+                    self.schedule_request(session, command)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logging.error(f"Error handling client {address}: {str(e)}")
+        finally:
+            self.clients.pop(address, None)
+            writer.close()
+            if session:
+                self.publisher.remove_session(session)
+                self.jobs.remove_session(session)
+                logging.debug(f"Compression for {address}: {session.channel.compression_summary()}")
             logging.info(f"Connection closed from {address}")
 
+    def handle_hello(self, session, command):
+        """Agree on encoding options with a newly connected client"""
+        agreed = session.channel.negotiate(command.get('data', {}))
+        # The reply still uses the defaults, the new options apply from the next message on
+        session.send({'id': command.get('id'), 'status': 'success', 'data': agreed})
+        session.channel.configure(agreed)
+        logging.info(f"Negotiated {agreed} with {session.address}")
+
+    def schedule_request(self, session, command):
+        """Queue a request on the scheduler under its client and priority"""
+        priority = self.COMMAND_PRIORITIES.get(command.get('type'), 'normal')
+        return self.scheduler.submit(session.address, priority, self.handle_request, session, command)
+
+    def handle_request(self, session, command):
+        """Run a command and send its response tagged with the request id"""
+        request_id = command.get('id')
+        try:
+            response = self.process_command(command, session)
+        except Exception as e:
+            logging.exception(f"Command {command.get('type')} failed")
+            response = {'status': 'error', 'message': str(e)}
+
+        if request_id is not None:
+            response = dict(response, id=request_id)
+
+        try:
+            session.send(response, telemetry=command.get('type') in self.TELEMETRY_COMMANDS,
+                         allow_compression=command.get('type') not in self.UNCOMPRESSED_COMMANDS)
+        except OSError as e:
+            logging.warning(f"Could not send response to {session.address}: {str(e)}")
+        except Exception as e:
+            # Encoding failed before any frame was sealed, so the channel can still carry an error
+            logging.exception(f"Could not encode {command.get('type')} response for {session.address}")
+            error = {'status': 'error', 'message': f"Could not encode response: {str(e)}"}
+            if request_id is not None:
+                error['id'] = request_id
+            try:
+                session.send(error)
+            except Exception as e:
+                logging.warning(f"Could not send error to {session.address}: {str(e)}")
+
     def get_system_info(self):
         """Gather system information"""
         return {
@@ -370,19 +1993,51 @@ class MCCServer:
             'disk_partitions': [partition.mountpoint for partition in psutil.disk_partitions()]
         }
 
-    def process_command(self, command):
+    def process_command(self, command, session=None):
         cmd_type = command.get('type')
         cmd_data = command.get('data', {})
 
+        # Handlers that need to know which connection sent the command
+        session_handlers = {
+            'subscribe': self.handle_subscribe,
+            'unsubscribe': self.handle_unsubscribe
+        }
+
+        if cmd_type in session_handlers:
+            if session is None:
+                return {'status': 'error', 'message': f'{cmd_type} requires a connection'}
+            return session_handlers[cmd_type](cmd_data, session)
+
+        # Handlers that stream to the sending connection, or queue work for it, when there is one
+        streaming_handlers = {
+            'execute_command': self.handle_command_execution,
+            'job_tail': self.handle_job_tail,
+            'batch': self.handle_batch
+        }
+
+        if cmd_type in streaming_handlers:
+            return streaming_handlers[cmd_type](cmd_data, session)
+
         command_handlers = {
             'system_info': self.handle_system_info,
             'hardware_monitor': self.handle_hardware_monitor,
+            'metrics_history': self.handle_metrics_history,
             'software_inventory': self.handle_software_inventory,
             'power_management': self.handle_power_management,
-            'execute_command': self.handle_command_execution,
+            'job_poll': self.handle_job_poll,
+            'job_cancel': self.handle_job_cancel,
             'network_monitor': self.handle_network_monitor,
+            'network_rates': self.handle_network_rates,
+            'process_list': self.handle_process_list,
+            'process_kill': self.handle_process_kill,
             'start_rdp': self.handle_start_rdp,
-            'stop_rdp': self.handle_stop_rdp
+            'stop_rdp': self.handle_stop_rdp,
+            'scheduler_stats': self.handle_scheduler_stats,
+            'schedule_task': self.handle_schedule_task,
+            'list_tasks': self.handle_list_tasks,
+            'cancel_task': self.handle_cancel_task,
+            'file_put': self.handle_file_put,
+            'file_get': self.handle_file_get
         }
 
         handler = command_handlers.get(cmd_type)
@@ -391,6 +2046,250 @@ class MCCServer:
         else:
             return {'status': 'error', 'message': 'Unknown command'}
 
+    def handle_schedule_task(self, data):
+        """Run a command later: once at `at` (a timestamp) or after `delay` seconds, or on a `cron` schedule.
+
+        `command` is a request like any other, e.g. {'type': 'execute_command',
+        'data': {'command': 'cleanmgr /sagerun:1'}}. Times are the agent's.
+        """
+        command = data.get('command')
+        if not isinstance(command, dict) or not command.get('type'):
+            return {'status': 'error', 'message': 'No command given'}
+        if command['type'] in ('schedule_task', 'subscribe', 'unsubscribe'):
+            return {'status': 'error', 'message': f"{command['type']} cannot be scheduled"}
+        command = {'type': command['type'], 'data': command.get('data') or {}}
+
+        try:
+            at = data.get('at')
+            if at is None and data.get('delay') is not None:
+                at = time.time() + float(data['delay'])
+            task = self.tasks.schedule(command, at=at, cron=data.get('cron'), name=data.get('name'))
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}
+
+        task.pop('schedule', None)
+        logging.info(f"Scheduled task {task['id']} ({task['name']}) for {datetime.fromtimestamp(task['next_run'])}")
+        return {'status': 'success', 'data': task}
+
+    def handle_list_tasks(self, data):
+        """Scheduled tasks, soonest first"""
+        return {'status': 'success', 'data': self.tasks.list()}
+
+    def handle_cancel_task(self, data):
+        task = self.tasks.cancel(data.get('task'))
+        if task is None:
+            return {'status': 'error', 'message': 'Unknown task'}
+        return {'status': 'success', 'message': f"Task {task['id']} cancelled"}
+
+    def run_scheduled_task(self, command):
+        """Queue a due task's command like a request of its own.
+
+        The returned future holds the command's response, for execute_command
+        that is only known once its job has exited.
+        """
+        priority = self.COMMAND_PRIORITIES.get(command['type'], 'normal')
+        if command['type'] != 'execute_command':
+            return self.scheduler.submit('scheduled', priority, self.process_command, command)
+
+        exited = Future()
+
+        def start_job():
+            response = self.handle_command_execution(command['data'],
+                                                     on_exit=lambda job: exited.set_result(self.job_result(job)))
+            if response['status'] != 'success':
+                exited.set_result(response)
+
+        self.scheduler.submit('scheduled', priority, start_job)
+        return exited
+
+    @staticmethod
+    def job_result(job):
+        """A finished job as a response, successful only if its command exited with code 0"""
+        if job.status == 'exited' and job.return_code == 0:
+            return {'status': 'success', 'data': job.summary()}
+        if job.status == 'exited':
+            return {'status': 'error', 'message': f"Exited with code {job.return_code}"}
+        return {'status': 'error', 'message': f"Job {job.status}"}
+
+    def handle_file_put(self, data):
+        """Receive one chunk of an upload, or report or finish the upload.
+
+        Chunks are written to `path`.part at their `offset` and must match
+        their `sha256`, they may arrive out of order. Without a chunk the size
+        of the part received so far is returned, so an interrupted upload can
+        resume (`restart` discards it instead). With `commit` the part is
+        checked against the file's `size` and `sha256` and moved to `path`.
+        """
+        path = data.get('path')
+        if not path or not os.path.isabs(path):
+            return {'status': 'error', 'message': 'An absolute path is required'}
+        part_path = path + '.part'
+
+        try:
+            if data.get('commit'):
+                return self.commit_upload(path, part_path, data.get('size'), data.get('sha256'))
+
+            if data.get('chunk') is None:
+                if data.get('restart') and os.path.exists(part_path):
+                    os.remove(part_path)
+                received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                return {'status': 'success', 'data': {'received': received}}
+
+            chunk = self._chunk_bytes(data['chunk'])
+            offset = int(data.get('offset', 0))
+            if offset < 0 or len(chunk) > self.MAX_FILE_CHUNK_SIZE:
+                return {'status': 'error', 'message': 'Invalid chunk offset or size'}
+            if hashlib.sha256(chunk).hexdigest() != data.get('sha256'):
+                return {'status': 'error', 'message': f'Checksum mismatch in chunk at {offset}'}
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Opened without truncating, concurrent chunks each write their own range
+            fd = os.open(part_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+            with open(fd, 'r+b') as part:
+                part.seek(offset)
+                part.write(chunk)
+            return {'status': 'success', 'data': {'offset': offset, 'length': len(chunk)}}
+
+        except (OSError, TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}
+
+    def commit_upload(self, path, part_path, size, sha256):
+        """Check a received part against the whole file and move it into place"""
+        if not os.path.exists(part_path):
+            return {'status': 'error', 'message': 'Nothing was uploaded'}
+        if os.path.getsize(part_path) != size:
+            return {'status': 'error', 'message': f'Received {os.path.getsize(part_path)} of {size} bytes'}
+
+        with open(part_path, 'rb') as part:
+            digest = self.file_sha256(part)
+        if digest != sha256:
+            os.remove(part_path)
+            return {'status': 'error', 'message': 'File checksum mismatch, upload discarded'}
+
+        os.replace(part_path, path)
+        logging.info(f"Received file {path} ({size} bytes)")
+        return {'status': 'success', 'data': {'path': path, 'size': size}}
+
+    def file_sha256(self, source):
+        """sha256 of an open file, read a chunk at a time"""
+        digest = hashlib.sha256()
+        buffer = bytearray(self.FILE_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            length = source.readinto(buffer)
+            if not length:
+                return digest.hexdigest()
+            digest.update(view[:length])
+
+    def handle_file_get(self, data):
+        """Read `length` bytes of a file from `offset`, with their sha256 and the file's size and mtime.
+
+        The chunk is sent as raw bytes when `binary` is set (msgpack sessions)
+        and as base64 otherwise. With `checksum` the sha256 of the whole file
+        is returned instead of a chunk, so a download can be checked once complete.
+        """
+        path = data.get('path')
+        if not path or not os.path.isabs(path):
+            return {'status': 'error', 'message': 'An absolute path is required'}
+
+        try:
+            if data.get('checksum'):
+                with open(path, 'rb') as source:
+                    stat = os.fstat(source.fileno())
+                    return {
+                        'status': 'success',
+                        'data': {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': self.file_sha256(source)}
+                    }
+
+            offset = max(int(data.get('offset', 0)), 0)
+            length = min(max(int(data.get('length', self.FILE_CHUNK_SIZE)), 1), self.MAX_FILE_CHUNK_SIZE)
+            with open(path, 'rb') as source:
+                stat = os.fstat(source.fileno())
+                source.seek(offset)
+                chunk = source.read(length)
+        except (OSError, TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}
+
+        return {
+            'status': 'success',
+            'data': {
+                'offset': offset,
+                'chunk': chunk if data.get('binary') else base64.b64encode(chunk).decode('ascii'),
+                'sha256': hashlib.sha256(chunk).hexdigest(),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime
+            }
+        }
+
+    @staticmethod
+    def _chunk_bytes(chunk):
+        """File data arrives as bytes over msgpack and as base64 over JSON"""
+        if isinstance(chunk, str):
+            return base64.b64decode(chunk)
+        return bytes(chunk)
+
+    def handle_scheduler_stats(self, data):
+        """Queue depths, waiting times and throughput of the command scheduler and the job queue"""
+        stats = self.scheduler.stats()
+        stats['jobs'] = {
+            'running': self.jobs.running,
+            'queued': self.jobs.queued(),
+            'max_running': self.jobs.max_running
+        }
+        return {'status': 'success', 'data': stats}
+
+    def run_batch_item(self, command):
+        """Run one batch item, errors are reported in its own status"""
+        if command.get('type') == 'batch':
+            return {'status': 'error', 'message': 'Nested batches are not supported'}
+        try:
+            return self.process_command(command)
+        except Exception as e:
+            logging.exception(f"Batch item {command.get('type')} failed")
+            return {'status': 'error', 'message': str(e)}
+
+    def handle_batch(self, data, session=None):
+        """Run several commands in one round trip.
+
+        Read-only commands are queued on the command scheduler under the
+        sender and their own priority, as if sent one by one, and run
+        concurrently. Commands with side effects run one after another in the
+        order given. The response holds one result per command, in request
+        order.
+        """
+        commands = data.get('commands')
+        if not isinstance(commands, list):
+            return {'status': 'error', 'message': 'Batch requires a list of commands'}
+
+        # Without a connection the batch is a scheduled task
+        client = session.address if session is not None else 'scheduled'
+        results = [None] * len(commands)
+        futures = {}
+        for index, command in enumerate(commands):
+            if isinstance(command, dict) and command.get('type') in self.READ_ONLY_COMMANDS:
+                priority = self.COMMAND_PRIORITIES.get(command['type'], 'normal')
+                futures[index] = self.scheduler.submit(client, priority, self.run_batch_item, command)
+
+        for index, command in enumerate(commands):
+            if index in futures:
+                continue
+            if not isinstance(command, dict):
+                results[index] = {'status': 'error', 'message': 'Invalid command'}
+            else:
+                results[index] = self.run_batch_item(command)
+
+        for index, future in futures.items():
+            # The batch itself holds a worker, so items still queued run here rather than waiting on one
+            if future.cancel():
+                results[index] = self.run_batch_item(commands[index])
+            else:
+                results[index] = future.result()
+
+        return {
+            'status': 'success',
+            'data': results
+        }
+
     def handle_system_info(self, data):
         """Return system information"""
         return {
@@ -399,35 +2298,74 @@ class MCCServer:
         }
 
     def handle_hardware_monitor(self, data):
-        """Monitor hardware metrics with improved drive handling"""
-        disk_usage = {}
+        """Latest hardware snapshot of the background sampler, with its timestamp"""
+        # Runs on the event loop in asyncio mode, which must not wait for the first sample
+        snapshot = self.sampler.latest(wait=False)
+        if snapshot is None:
+            return {'status': 'error', 'message': 'No hardware sample available yet'}
+        return {
+            'status': 'success',
+            'data': snapshot
+        }
 
-        # Safely collect disk usage information
-        for partition in psutil.disk_partitions(all=False):
-            try:
-                # Only check fixed drives and skip removable drives
-                if 'fixed' in partition.opts or partition.fstype == 'NTFS':
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    disk_usage[partition.mountpoint] = dict(usage._asdict())
-            except Exception as e:
-                logging.warning(f"Could not access drive {partition.mountpoint}: {str(e)}")
-                continue
+    def handle_metrics_history(self, data):
+        """Recorded metrics of a time range, downsampled to min/mean/max per bucket
+
+        Accepts start/end as epoch seconds, or `seconds` back from now
+        (default one hour), plus the number of `points` and optionally the
+        `metrics` to return.
+        """
+        try:
+            end = float(data.get('end') or time.time())
+            start = float(data.get('start') or end - float(data.get('seconds', 3600)))
+            points = int(data.get('points', 120))
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid time range'}
+
+        if start >= end or not 1 <= points <= self.MAX_HISTORY_POINTS:
+            return {'status': 'error', 'message': 'Invalid time range'}
+
+        result = self.history.query(start, end, points, data.get('metrics'))
+        result.update({'start': start, 'end': end, 'bucket_seconds': (end - start) / points})
+        return {
+            'status': 'success',
+            'data': result
+        }
+
+    def handle_subscribe(self, data, session):
+        """Start pushing telemetry samples to this connection at the requested interval"""
+        metrics = data.get('metrics') or []
+        unknown = [metric for metric in metrics if metric not in self.TELEMETRY_METRICS]
+        if unknown:
+            return {'status': 'error', 'message': f'Unknown metrics: {", ".join(unknown)}'}
 
+        subscription_id, interval = self.publisher.subscribe(session, metrics, data.get('interval', 2.0))
         return {
             'status': 'success',
             'data': {
-                'cpu_percent': psutil.cpu_percent(interval=1),
-                'memory_usage': dict(psutil.virtual_memory()._asdict()),
-                'disk_usage': disk_usage,
-                'network_io': dict(psutil.net_io_counters()._asdict())
+                'subscription': subscription_id,
+                'interval': interval
             }
         }
 
+    def handle_unsubscribe(self, data, session):
+        """Stop a telemetry subscription of this connection"""
+        if self.publisher.unsubscribe(data.get('subscription'), session):
+            return {'status': 'success', 'message': 'Subscription cancelled'}
+        return {'status': 'error', 'message': 'Unknown subscription'}
+
     def handle_software_inventory(self, data):
-        """Get installed software inventory with improved registry handling"""
-        print("\n=== Starting Software Inventory Scan ===")
-        software_list = []
+        """Get one page of the installed software inventory.
+
+        Accepts `search` (case-insensitive, on name or version), `sort`
+        ('name' or 'version'), `descending`, `offset` and `limit`, and
+        returns the matching page with the total number of matches.
+        Unchanged registry keys are served from the cache.
 
+        Every reply carries the inventory `token`. A full-list request that
+        sends back a known token as `since` gets {'unchanged': True} or
+        just the `delta` instead of the items.
+        """
         try:
             if platform.system() != 'Windows':
                 return {
@@ -435,76 +2373,60 @@ class MCCServer:
                     'message': 'Not a Windows system'
                 }
 
-            # Registry paths to check
-            keys_to_check = [
-                (winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall'),
-                (winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall'),
-                (winreg.HKEY_CURRENT_USER, r'SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall')
-            ]
-
-            seen_programs = set()
-
-            for reg_root, key_path in keys_to_check:
-                reg_key = None
-                try:
-                    reg_key = winreg.OpenKey(reg_root, key_path)
-                    subkey_count, _, _ = winreg.QueryInfoKey(reg_key)
-
-                    for i in range(subkey_count):
-                        subkey = None
-                        try:
-                            subkey_name = winreg.EnumKey(reg_key, i)
-                            subkey = winreg.OpenKey(reg_key, subkey_name)
-
-                            try:
-                                name = winreg.QueryValueEx(subkey, "DisplayName")[0].strip()
-                                if not name or name in seen_programs:
-                                    continue
-
-                                version = "N/A"
-                                try:
-                                    version = winreg.QueryValueEx(subkey, "DisplayVersion")[0].strip()
-                                except (WindowsError, KeyError):
-                                    pass
-
-                                # Skip system components and irrelevant entries
-                                skip_keywords = [
-                                    "update", "microsoft", "windows", "cache", "installer",
-                                    "pack", "driver", "system", "component", "setup",
-                                    "prerequisite", "runtime", "application", "sdk"
-                                ]
-
-                                if any(keyword in name.lower() for keyword in skip_keywords):
-                                    continue
-
-                                software_list.append({
-                                    'name': name,
-                                    'version': version
-                                })
-                                seen_programs.add(name)
-
-                            except (WindowsError, KeyError):
-                                continue
-
-                        except WindowsError:
-                            continue
-                        finally:
-                            if subkey is not None:
-                                winreg.CloseKey(subkey)
-
-                except WindowsError as e:
-                    print(f"Error accessing {key_path}: {str(e)}")
-                finally:
-                    if reg_key is not None:
-                        winreg.CloseKey(reg_key)
-
-            # Sort the list by program name
-            software_list.sort(key=lambda x: x['name'].lower())
-
-            print(f"\nTotal programs found: {len(software_list)}")
+            sort_key = data.get('sort', 'name')
+            if sort_key not in self.SOFTWARE_SORT_KEYS:
+                return {'status': 'error', 'message': f'Cannot sort by {sort_key}'}
+            try:
+                offset = max(int(data.get('offset', 0)), 0)
+                limit = data.get('limit')
+                limit = None if limit is None else max(int(limit), 0)
+            except (TypeError, ValueError):
+                return {'status': 'error', 'message': 'Invalid offset or limit'}
+
+            started = time.perf_counter()
+            token, software_list = self.software_cache.inventory()
+
+            search = (data.get('search') or '').strip().lower()
+            since = data.get('since')
+            if since and not search and not offset and limit is None:
+                if since == token:
+                    return {'status': 'success', 'data': {'token': token, 'unchanged': True}}
+
+                delta = self.software_cache.changes_since(since, token)
+                if delta is not None:
+                    print(f"Software inventory: delta of {sum(len(part) for part in delta.values())} "
+                          f"changes since {since}")
+                    return {
+                        'status': 'success',
+                        'data': {
+                            'token': token,
+                            'delta': delta,
+                            'total': len(software_list)
+                        }
+                    }
+
+            if search:
+                software_list = [software for software in software_list
+                                 if search in software['name'].lower() or search in software['version'].lower()]
+
+            # The cache is already sorted by name
+            descending = bool(data.get('descending'))
+            if sort_key != 'name' or descending:
+                software_list = sorted(software_list, key=self.SOFTWARE_SORT_KEYS[sort_key], reverse=descending)
+
+            end = None if limit is None else offset + limit
+            page = software_list[offset:end]
+
+            print(f"Software inventory: {len(page)} of {len(software_list)} programs in "
+                  f"{(time.perf_counter() - started) * 1000:.1f} ms")
             return {
                 'status': 'success',
-                'data': software_list
+                'data': {
+                    'token': token,
+                    'items': page,
+                    'total': len(software_list),
+                    'offset': offset
+                }
             }
 
         except Exception as e:
@@ -515,21 +2437,34 @@ class MCCServer:
                 'message': error_msg
             }
 
+    def cancel_power_tasks(self):
+        """Drop scheduled shutdowns and restarts"""
+        for task in self.tasks.list():
+            command = task['command']
+            if command['type'] == 'power_management' and command['data'].get('action') in ('shutdown', 'restart'):
+                self.tasks.cancel(task['id'])
+
     def handle_power_management(self, data):
         """Handle power management commands with enhanced functionality"""
         action = data.get('action')
         seconds = data.get('seconds')
 
         try:
+            if action == 'shutdown' and seconds is not None:
+                if seconds <= 0:
+                    raise ValueError("Invalid shutdown time")
+                # A task rather than 'shutdown /t', so list_tasks and cancel_task see it
+                task = self.tasks.schedule({'type': 'power_management', 'data': {'action': 'shutdown'}},
+                                           at=time.time() + seconds, name=f"Shutdown in {seconds} seconds")
+                return {
+                    'status': 'success',
+                    'message': f"Shutdown scheduled as task {task['id']}",
+                    'data': task
+                }
+
             if platform.system() == 'Windows':
                 if action == 'shutdown':
-                    if seconds is not None:
-                        if seconds > 0:
-                            os.system(f'shutdown /s /t {seconds}')
-                        else:
-                            raise ValueError("Invalid shutdown time")
-                    else:
-                        os.system('shutdown /s /t 1')
+                    os.system('shutdown /s /t 1')
 
                 elif action == 'restart':
                     os.system('shutdown /r /t 1')
@@ -539,20 +2474,19 @@ class MCCServer:
 
                 elif action == 'cancel_scheduled':
                     os.system('shutdown /a')
+                    self.cancel_power_tasks()
 
             else:
                 # Linux/Unix commands
                 if action == 'shutdown':
-                    if seconds is not None:
-                        os.system(f'shutdown -h +{seconds // 60}')  # Convert seconds to minutes for Linux
-                    else:
-                        os.system('shutdown -h now')
+                    os.system('shutdown -h now')
                 elif action == 'restart':
                     os.system('shutdown -r now')
                 elif action == 'lock':
                     os.system('loginctl lock-session')
                 elif action == 'cancel_scheduled':
                     os.system('shutdown -c')
+                    self.cancel_power_tasks()
 
             return {
                 'status': 'success',
@@ -566,36 +2500,209 @@ class MCCServer:
                 'message': f'Failed to execute power action: {str(e)}'
             }
 
-    def handle_command_execution(self, data):
-        """Execute system commands"""
+    def handle_process_list(self, data):
+        """List processes, optionally only the top `limit` by cpu, memory or io.
+
+        With `since` set to a generation from an earlier reply, only the
+        started, exited and changed processes of that view are returned.
+        """
+        sort_key = data.get('sort', 'cpu')
+        if sort_key not in ProcessMonitor.SORT_KEYS:
+            return {'status': 'error', 'message': f'Cannot sort by {sort_key}'}
+        try:
+            limit = data.get('limit')
+            limit = None if limit is None else max(int(limit), 1)
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid limit'}
+
+        return {
+            'status': 'success',
+            'data': self.processes.listing(sort_key, limit, data.get('since'))
+        }
+
+    def handle_process_kill(self, data):
+        """Terminate a process, or kill it outright with force"""
+        try:
+            pid = int(data.get('pid'))
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid pid'}
+
+        if pid == os.getpid():
+            return {'status': 'error', 'message': 'Refusing to stop the agent itself'}
+
+        try:
+            process = psutil.Process(pid)
+            name = process.name()
+            if data.get('force'):
+                process.kill()
+            else:
+                process.terminate()
+            process.wait(timeout=3)
+
+            logging.info(f"Stopped process {pid} ({name})")
+            return {'status': 'success', 'message': f'Process {name} ({pid}) stopped'}
+
+        except psutil.NoSuchProcess:
+            return {'status': 'error', 'message': f'No process with pid {pid}'}
+        except psutil.AccessDenied:
+            return {'status': 'error', 'message': f'Access denied stopping process {pid}'}
+        except psutil.TimeoutExpired:
+            return {'status': 'error', 'message': f'Process {pid} did not exit, try force'}
+
+    def handle_command_execution(self, data, session=None, on_exit=None):
+        """Start a command in the background and return its job id right away.
+
+        Output is streamed to the sending connection as job_output events,
+        followed by a job_exit event, unless `stream` is false. `on_exit` is
+        called with the job once it has finished.
+        """
         command = data.get('command')
+        if not command:
+            return {'status': 'error', 'message': 'No command given'}
         try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            job = self.jobs.start(command, session if data.get('stream', True) else None,
+                                  session.address if session else None, on_exit)
+            logging.info(f"Job {job.job_id} {job.status}: {command}")
             return {
                 'status': 'success',
-                'data': {
-                    'stdout': result.stdout,
-                    'stderr': result.stderr,
-                    'return_code': result.returncode
-                }
+                'data': job.summary()
             }
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
+    def handle_job_poll(self, data):
+        """Status of one job, or of every job without a job id"""
+        if data.get('job') is None:
+            return {'status': 'success', 'data': self.jobs.list()}
+
+        job = self.jobs.get(data.get('job'))
+        if job is None:
+            return {'status': 'error', 'message': 'Unknown job'}
+        return {'status': 'success', 'data': job.summary()}
+
+    def handle_job_cancel(self, data):
+        job = self.jobs.cancel(data.get('job'))
+        if job is None:
+            return {'status': 'error', 'message': 'Unknown job'}
+        return {'status': 'success', 'data': job.summary()}
+
+    def handle_job_tail(self, data, session=None):
+        """Kept output of a job from `offset` on; with `follow`, stream the rest to this connection"""
+        try:
+            offset = max(int(data.get('offset', 0)), 0)
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid offset'}
+
+        result = self.jobs.tail(data.get('job'), offset, session if data.get('follow') else None)
+        if result is None:
+            return {'status': 'error', 'message': 'Unknown job'}
+        return {'status': 'success', 'data': result}
+
     def handle_network_monitor(self, data):
-        """Monitor network statistics"""
+        """Monitor network connections, filtered and paged or aggregated on the agent.
+
+        Filters: `state`, `pid`, `local_port` and `remote_port` (a value or a
+        list), `family` ('ipv4'/'ipv6') and `protocol` ('tcp'/'udp'). Rows are
+        returned a page at a time through `offset`/`limit`; with `aggregate`
+        only the counts by state, process and remote address are sent.
+        """
+        family = data.get('family')
+        protocol = data.get('protocol')
+        if family not in (None, 'ipv4', 'ipv6') or protocol not in (None, 'tcp', 'udp'):
+            return {'status': 'error', 'message': 'Unknown family or protocol'}
+        # psutil only has to walk the socket tables that can match
+        kind = (protocol or 'inet') + {'ipv4': '4', 'ipv6': '6', None: ''}[family]
+
+        try:
+            filters = [(field, self._filter_values(data.get(field), str.upper if field == 'state' else int))
+                       for field in ('state', 'pid', 'local_port', 'remote_port') if data.get(field) is not None]
+            offset = max(int(data.get('offset', 0)), 0)
+            limit = min(max(int(data.get('limit', self.NETWORK_PAGE_SIZE)), 0), self.MAX_NETWORK_PAGE_SIZE)
+            top = max(int(data.get('top', 20)), 0)
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid filter, offset or limit'}
+
+        def matches(conn):
+            values = {
+                'state': conn.status,
+                'pid': conn.pid,
+                'local_port': conn.laddr.port if conn.laddr else None,
+                'remote_port': conn.raddr.port if conn.raddr else None
+            }
+            return all(values[field] in allowed for field, allowed in filters)
+
+        try:
+            connections = [conn for conn in psutil.net_connections(kind=kind) if matches(conn)]
+        except psutil.AccessDenied:
+            return {'status': 'error', 'message': 'Access denied listing connections'}
+
+        result = {
+            'total': len(connections),
+            'io_counters': dict(psutil.net_io_counters()._asdict())
+        }
+        if data.get('aggregate'):
+            result.update(self._aggregate_connections(connections, top))
+        else:
+            result['offset'] = offset
+            result['connections'] = [self._connection_row(conn) for conn in connections[offset:offset + limit]]
+
         return {
             'status': 'success',
-            'data': {
-                'connections': [conn._asdict() for conn in psutil.net_connections()],
-                'io_counters': dict(psutil.net_io_counters()._asdict())
-            }
+            'data': result
+        }
+
+    def handle_network_rates(self, data):
+        """Live bytes/s and packets/s per interface, and per process where the platform allows"""
+        # Runs on the event loop in asyncio mode, like hardware_monitor
+        rates = self.sampler.latest_rates(wait=False)
+        if rates is None:
+            return {'status': 'error', 'message': 'No network sample available yet'}
+        return {
+            'status': 'success',
+            'data': rates
+        }
+
+    @staticmethod
+    def _filter_values(value, convert):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        return {convert(item) for item in values}
+
+    @staticmethod
+    def _connection_row(conn):
+        """Flat, serialiser-friendly form of a psutil connection"""
+        return {
+            'family': 'ipv6' if conn.family == socket.AF_INET6 else 'ipv4',
+            'protocol': 'udp' if conn.type == socket.SOCK_DGRAM else 'tcp',
+            'local_address': conn.laddr.ip if conn.laddr else None,
+            'local_port': conn.laddr.port if conn.laddr else None,
+            'remote_address': conn.raddr.ip if conn.raddr else None,
+            'remote_port': conn.raddr.port if conn.raddr else None,
+            'state': conn.status,
+            'pid': conn.pid
+        }
+
+    @staticmethod
+    def _aggregate_connections(connections, top):
+        """Connection counts by state, and the top processes and remote addresses"""
+        by_state = Counter(conn.status for conn in connections)
+        by_pid = Counter(conn.pid for conn in connections)
+        by_remote = Counter(conn.raddr.ip for conn in connections if conn.raddr)
+
+        processes = []
+        for pid, count in by_pid.most_common(top):
+            name = None
+            if pid is not None:
+                try:
+                    name = psutil.Process(pid).name()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+            processes.append({'pid': pid, 'name': name, 'count': count})
+
+        return {
+            'by_state': dict(by_state),
+            'by_process': processes,
+            'by_remote_address': [{'address': address, 'count': count}
+                                  for address, count in by_remote.most_common(top)]
         }
 
     def handle_start_rdp(self, data):
@@ -622,8 +2729,8 @@ class MCCServer:
             rdp_host = socket.gethostbyname(socket.gethostname())
             rdp_port = 5900  # Default RDP port
 
-            # Create and start RDP server
-            self.rdp_server = RDPServer(host='0.0.0.0', port=rdp_port)
+            # Create and start RDP server, the stream key only travels over the encrypted command channel
+            self.rdp_server = RDPServer(host='0.0.0.0', port=rdp_port, cipher=self.cipher)
             self.rdp_thread = threading.Thread(target=self.rdp_server.start)
             self.rdp_thread.daemon = True
             self.rdp_thread.start()
@@ -635,7 +2742,9 @@ class MCCServer:
                 'status': 'success',
                 'data': {
                     'ip': rdp_host,
-                    'port': rdp_port
+                    'port': rdp_port,
+                    'key': self.rdp_server.session_key.hex(),
+                    'cipher': self.cipher
                 }
             }
 
@@ -683,9 +2792,18 @@ class MCCServer:
         self.running = False
 
         for client in list(self.clients.values()):
+            client['session'].close()
+
+        self.publisher.stop()
+        self.sampler.stop()
+        self.tasks.stop()
+        self.scheduler.shutdown()
+
+        if self.loop is not None and self.stop_event is not None:
             try:
-                client['socket'].close()
-            except:
+                self.loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                # Loop already closed
                 pass
 
         try:
@@ -699,7 +2817,10 @@ class MCCServer:
 if __name__ == "__main__":
     server = MCCServer()
     try:
-        server.start()
+        if '--async' in sys.argv:
+            server.start_async()
+        else:
+            server.start()
     except KeyboardInterrupt:
         logging.info("Received shutdown signal")
         server.stop()
@@ -0,0 +1,227 @@
+import os
+import socket
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+import protocol
+from protocol import (CIPHER_IDS, COMPRESS_THRESHOLD, COMPRESSION_MASK, COMPRESSIONS, ENCODINGS, FLAG_MORE,
+                      FLAG_TELEMETRY, FRAME_HEADER, MAX_FRAME_SIZE, TAG_SIZE, TELEMETRY_HEADER, MessageChannel,
+                      ProtocolError, compress, decompress, new_stream_key, stream_cipher)
+
+
+class PlainCipher:
+    """Identity cipher, so frames can be checked without keys"""
+
+    overhead = 0
+
+    def encrypt(self, data, associated_data=None):
+        return bytes(data)
+
+    def decrypt(self, data, associated_data=None):
+        return data
+
+
+@pytest.fixture
+def sockets():
+    left, right = socket.socketpair()
+    right.settimeout(5)
+    yield left, right
+    left.close()
+    right.close()
+
+
+def test_message_is_split_into_chunk_sized_frames():
+    channel = MessageChannel(PlainCipher(), chunk_size=16)
+    frames = channel.pack_message({'id': 1, 'data': 'x' * 100})
+
+    assert len(frames) > 1
+    for index, frame in enumerate(frames):
+        flags, length = FRAME_HEADER.unpack_from(frame)
+        assert length == len(frame) - FRAME_HEADER.size <= 16
+        assert bool(flags & FLAG_MORE) == (index < len(frames) - 1)
+
+
+def test_frames_are_reassembled_in_order(sockets):
+    sender, receiver = sockets
+    channel = MessageChannel(PlainCipher(), chunk_size=16)
+    messages = [{'id': 1, 'data': 'x' * 100}, {'id': 2, 'data': []}, {'id': 3, 'data': 'y' * 16}]
+    for message in messages:
+        channel.send_message(sender, message)
+
+    assert [channel.recv_message(receiver) for _ in messages] == messages
+
+
+def test_reassembly_stops_at_message_size_limit(sockets, monkeypatch):
+    monkeypatch.setattr(protocol, 'MAX_MESSAGE_SIZE', 64)
+    sender, receiver = sockets
+    channel = MessageChannel(PlainCipher(), chunk_size=16)
+    channel.send_message(sender, {'id': 1, 'data': 'x' * 200})
+
+    with pytest.raises(ProtocolError):
+        channel.recv_message(receiver)
+
+
+def test_oversized_frame_is_rejected(sockets):
+    sender, receiver = sockets
+    sender.sendall(FRAME_HEADER.pack(0, MAX_FRAME_SIZE + 1))
+
+    with pytest.raises(ProtocolError):
+        MessageChannel(PlainCipher()).recv_message(receiver)
+
+
+def channel_pair(**agreed):
+    sender, receiver = MessageChannel(PlainCipher()), MessageChannel(PlainCipher())
+    for channel in (sender, receiver):
+        channel.configure(agreed)
+    return sender, receiver
+
+
+def hardware_sample(cpu_percent=12.5, used=6 * 1024 ** 3):
+    return {'event': 'telemetry', 'status': 'success', 'data': {
+        'cpu_percent': cpu_percent,
+        'memory_usage': {'total': 16 * 1024 ** 3, 'used': used, 'percent': 37.5},
+        'disk_usage': {'/': {'total': 512 * 1024 ** 3, 'percent': 41.0}}
+    }}
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_telemetry_layout_is_sent_once(encoding):
+    sender, receiver = channel_pair(encoding=encoding, telemetry=True)
+    first, second = hardware_sample(), hardware_sample(cpu_percent=80.0, used=7 * 1024 ** 3)
+
+    flags, payload = sender.encode(first, telemetry=True)
+    assert flags & FLAG_TELEMETRY
+    assert TELEMETRY_HEADER.unpack_from(payload)[1] > 0
+    assert receiver.decode(flags, payload) == first
+
+    flags, payload = sender.encode(second, telemetry=True)
+    assert TELEMETRY_HEADER.unpack_from(payload)[1] == 0
+    decoded = receiver.decode(flags, payload)
+    assert decoded == second
+    # Values keep their type, ints are not turned into floats
+    assert type(decoded['data']['memory_usage']['used']) is int
+
+
+def test_telemetry_sample_with_a_new_shape_is_still_decoded():
+    sender, receiver = channel_pair(telemetry=True)
+    receiver.decode(*sender.encode(hardware_sample(), telemetry=True))
+
+    # Same keys as the cached plan, one value changed type
+    changed = hardware_sample(cpu_percent=50)
+    decoded = receiver.decode(*sender.encode(changed, telemetry=True))
+    assert decoded == changed
+    assert type(decoded['data']['cpu_percent']) is int
+
+
+def test_telemetry_with_non_numbers_falls_back_to_plain_encoding():
+    sender, receiver = channel_pair(telemetry=True)
+    message = hardware_sample()
+    message['data']['hostname'] = 'agent-1'
+
+    flags, payload = sender.encode(message, telemetry=True)
+    assert not flags & FLAG_TELEMETRY
+    assert receiver.decode(flags, payload) == message
+
+
+def test_telemetry_is_plain_unless_negotiated():
+    sender, receiver = channel_pair()
+    flags, payload = sender.encode(hardware_sample(), telemetry=True)
+    assert not flags & FLAG_TELEMETRY
+    assert receiver.decode(flags, payload) == hardware_sample()
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_large_message_round_trips_compressed(encoding, compression):
+    sender, receiver = channel_pair(encoding=encoding, compression=compression)
+    message = {'id': 1, 'status': 'success', 'data': {'output': 'line of output\n' * COMPRESS_THRESHOLD}}
+
+    flags, payload = sender.encode(message)
+    assert flags & COMPRESSION_MASK
+    assert sender.stats['compressed_bytes'] < sender.stats['raw_bytes']
+    assert receiver.decode(flags, payload) == message
+
+
+def test_small_messages_are_not_compressed():
+    sender, _ = channel_pair(compression='zlib')
+    flags, _ = sender.encode({'id': 1, 'data': 'short'})
+    assert not flags & COMPRESSION_MASK
+
+
+@pytest.mark.parametrize('codec', COMPRESSIONS)
+def test_decompression_stops_at_message_size_limit(codec, monkeypatch):
+    monkeypatch.setattr(protocol, 'MAX_MESSAGE_SIZE', 4096)
+    assert decompress(codec, compress(codec, bytes(4096))) == bytes(4096)
+    with pytest.raises(ProtocolError):
+        decompress(codec, compress(codec, bytes(8192)))
+
+
+# zstd reports a truncated frame itself
+@pytest.mark.parametrize('codec', [codec for codec in COMPRESSIONS if codec != 'zstd'])
+def test_truncated_compressed_message_is_rejected(codec):
+    payload = compress(codec, os.urandom(2048))
+    with pytest.raises(ProtocolError):
+        decompress(codec, payload[:len(payload) // 2])
+
+
+def cipher_pair(cipher):
+    key, salt = new_stream_key(), os.urandom(16)
+    return (stream_cipher(key, salt, is_server=True, cipher=cipher),
+            stream_cipher(key, salt, is_server=False, cipher=cipher))
+
+
+@pytest.mark.parametrize('cipher', CIPHER_IDS)
+def test_frames_decrypt_in_order_with_only_a_tag_added(cipher):
+    server, client = cipher_pair(cipher)
+    tokens = [server.encrypt(b'same frame', b'header') for _ in range(3)]
+
+    # The counter nonce makes every token of the same frame different
+    assert len(set(tokens)) == 3
+    assert all(len(token) == len(b'same frame') + TAG_SIZE for token in tokens)
+    assert [client.decrypt(token, b'header') for token in tokens] == [b'same frame'] * 3
+
+    # Each direction has its own key and counter
+    assert server.decrypt(client.encrypt(b'reply')) == b'reply'
+
+
+@pytest.mark.parametrize('cipher', CIPHER_IDS)
+def test_replayed_frame_is_rejected(cipher):
+    server, client = cipher_pair(cipher)
+    token = server.encrypt(b'frame')
+    client.decrypt(token)
+    with pytest.raises(InvalidTag):
+        client.decrypt(token)
+
+
+@pytest.mark.parametrize('cipher', CIPHER_IDS)
+def test_reordered_frames_are_rejected(cipher):
+    server, client = cipher_pair(cipher)
+    server.encrypt(b'first')
+    with pytest.raises(InvalidTag):
+        client.decrypt(server.encrypt(b'second'))
+
+
+@pytest.mark.parametrize('cipher', CIPHER_IDS)
+def test_frame_header_is_authenticated(cipher):
+    server, client = cipher_pair(cipher)
+    token = server.encrypt(b'frame', FRAME_HEADER.pack(0, 5 + TAG_SIZE))
+    with pytest.raises(InvalidTag):
+        client.decrypt(token, FRAME_HEADER.pack(FLAG_MORE, 5 + TAG_SIZE))
+
+
+def test_message_channels_over_a_session_cipher(sockets):
+    server, client = cipher_pair('aes-gcm')
+    sender, receiver = sockets
+    message = {'id': 1, 'data': 'x' * 100}
+    MessageChannel(server, chunk_size=16).send_message(sender, message)
+    assert MessageChannel(client, chunk_size=16).recv_message(receiver) == message
+
+
+def test_compression_can_be_skipped_per_message():
+    sender, receiver = channel_pair(compression='zlib')
+    message = {'id': 1, 'data': 'x' * COMPRESS_THRESHOLD * 2}
+
+    flags, payload = sender.encode(message, allow_compression=False)
+    assert not flags & COMPRESSION_MASK
+    assert receiver.decode(flags, payload) == message
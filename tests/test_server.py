@@ -0,0 +1,268 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+
+# The agent needs its Windows-only dependencies to import at all
+server = pytest.importorskip('server')
+
+
+def inventory_cache(monkeypatch, *scans):
+    """A SoftwareInventoryCache whose registry scans return the given program lists in turn"""
+    cache = server.SoftwareInventoryCache()
+    scans = iter(scans)
+    monkeypatch.setattr(cache, '_refresh_hive', lambda reg_root, key_path, revalidate: True)
+    monkeypatch.setattr(cache, '_build_list', lambda: [{'name': name, 'version': version}
+                                                       for name, version in next(scans)])
+    return cache
+
+
+def test_inventory_delta_between_tokens(monkeypatch):
+    cache = inventory_cache(monkeypatch,
+                            [('7-Zip', '23.01'), ('Firefox', '120.0'), ('VLC', '3.0.18')],
+                            [('7-Zip', '23.01'), ('Firefox', '121.0'), ('Notepad++', '8.6')])
+    old_token, _ = cache.inventory()
+    new_token, software_list = cache.inventory()
+
+    assert old_token != new_token
+    assert [software['name'] for software in software_list] == ['7-Zip', 'Firefox', 'Notepad++']
+    assert cache.changes_since(old_token, new_token) == {
+        'added': [{'name': 'Notepad++', 'version': '8.6'}],
+        'removed': ['VLC'],
+        'updated': [{'name': 'Firefox', 'version': '121.0'}]
+    }
+
+
+def test_inventory_token_depends_only_on_content(monkeypatch):
+    programs = [('7-Zip', '23.01'), ('Firefox', '120.0')]
+    cache = inventory_cache(monkeypatch, programs, list(programs))
+    assert cache.inventory()[0] == cache.inventory()[0]
+    assert cache.changes_since(cache.token, cache.token) == {'added': [], 'removed': [], 'updated': []}
+
+
+def test_inventory_delta_needs_known_tokens(monkeypatch):
+    scans = [[('Program', str(version))] for version in range(server.SoftwareInventoryCache.MAX_GENERATIONS + 1)]
+    cache = inventory_cache(monkeypatch, *scans)
+    first_token, _ = cache.inventory()
+    for _ in scans[1:]:
+        cache.inventory()
+
+    # The oldest generation was dropped
+    assert cache.changes_since(first_token, cache.token) is None
+    assert cache.changes_since('unknown', cache.token) is None
+
+
+def test_fair_queue_serves_higher_priority_first():
+    queue = server.FairQueue(('high', 'normal', 'low'))
+    queue.push('low', 'a', 1)
+    queue.push('normal', 'a', 2)
+    queue.push('high', 'b', 3)
+
+    assert [queue.pop()[2] for _ in range(3)] == [3, 2, 1]
+    assert queue.pop() is None
+
+
+def test_fair_queue_rotates_between_clients():
+    queue = server.FairQueue(('normal',))
+    for item in range(3):
+        queue.push('normal', 'busy', item)
+    queue.push('normal', 'quiet', 'q')
+
+    assert queue.client_depth() == {'busy': 3, 'quiet': 1}
+    # The quiet client's command goes second, not after all of the busy client's
+    assert [queue.pop()[1:] for _ in range(4)] == [('busy', 0), ('quiet', 'q'), ('busy', 1), ('busy', 2)]
+    assert len(queue) == 0
+
+
+def test_fair_queue_pop_limited_to_priorities():
+    queue = server.FairQueue(('high', 'normal'))
+    queue.push('normal', 'a', 1)
+
+    assert queue.pop(('high',)) is None
+    assert queue.depth() == {'high': 0, 'normal': 1}
+    assert queue.pop() == ('normal', 'a', 1)
+
+
+def test_scheduler_reserves_a_worker_for_high_priority():
+    scheduler = server.CommandScheduler(workers=2, reserved=1)
+    release = threading.Event()
+    try:
+        blocked = scheduler.submit('a', 'normal', release.wait, 5)
+        queued = scheduler.submit('a', 'normal', lambda: 'normal')
+        urgent = scheduler.submit('b', 'high', lambda: 'high')
+
+        assert urgent.result(timeout=5) == 'high'
+        assert not queued.done()
+        release.set()
+        assert blocked.result(timeout=5) and queued.result(timeout=5) == 'normal'
+    finally:
+        release.set()
+        scheduler.shutdown()
+
+
+def next_run(expression, after):
+    return datetime.fromtimestamp(server.CronSchedule(expression).next_after(after.timestamp()))
+
+
+def test_cron_next_after_steps_and_ranges():
+    # 2026-01-09 is a Friday
+    assert next_run('*/15 * * * *', datetime(2026, 1, 9, 10, 7, 30)) == datetime(2026, 1, 9, 10, 15)
+    assert next_run('*/15 * * * *', datetime(2026, 1, 9, 10, 15)) == datetime(2026, 1, 9, 10, 30)
+    assert next_run('0 8-18/2 * * *', datetime(2026, 1, 9, 18, 0)) == datetime(2026, 1, 10, 8, 0)
+    assert next_run('0 9 * * 1-5', datetime(2026, 1, 9, 18, 0)) == datetime(2026, 1, 12, 9, 0)
+    assert next_run('30 2 1 * *', datetime(2026, 12, 15)) == datetime(2027, 1, 1, 2, 30)
+
+
+def test_cron_day_fields_match_either_when_both_are_set():
+    # The 13th, or any Friday
+    assert next_run('0 0 13 * 5', datetime(2026, 1, 10)) == datetime(2026, 1, 13)
+    assert next_run('0 0 13 * 5', datetime(2026, 1, 13, 1)) == datetime(2026, 1, 16)
+    # 7 is Sunday as well as 0
+    assert next_run('0 0 * * 7', datetime(2026, 1, 9)) == datetime(2026, 1, 11)
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '5-1 * * * *', '*/0 * * * *',
+                                        'a * * * *', '0 0 30 2 *'])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        server.CronSchedule(expression).next_after(datetime(2026, 1, 1).timestamp())
+
+
+def finished(response):
+    future = Future()
+    future.set_result(response)
+    return future
+
+
+def test_scheduled_tasks_survive_a_restart(tmp_path):
+    journal = str(tmp_path / 'tasks.jsonl')
+    tasks = server.TaskScheduler(journal, lambda command: finished({'status': 'success'}))
+    kept = tasks.schedule({'type': 'system_info', 'data': {}}, cron='0 3 * * *', name='nightly')
+    cancelled = tasks.schedule({'type': 'system_info', 'data': {}}, at=time.time() + 3600)
+    tasks.cancel(cancelled['id'])
+    tasks.stop()
+
+    restarted = server.TaskScheduler(journal, lambda command: finished({'status': 'success'}))
+    try:
+        assert restarted.list() == [kept]
+    finally:
+        restarted.stop()
+
+
+def test_due_task_runs_once(tmp_path):
+    commands = []
+    ran = threading.Event()
+
+    def runner(command):
+        commands.append(command)
+        ran.set()
+        return finished({'status': 'success'})
+
+    journal = tmp_path / 'tasks.jsonl'
+    tasks = server.TaskScheduler(str(journal), runner)
+    try:
+        task = tasks.schedule({'type': 'system_info', 'data': {}}, at=time.time())
+        assert ran.wait(5)
+        assert commands == [{'type': 'system_info', 'data': {}}]
+        assert tasks.list() == []
+        assert json.loads(journal.read_text().splitlines()[-1]) == {'op': 'done', 'id': task['id']}
+    finally:
+        tasks.stop()
+
+
+def test_task_journal_is_compacted(tmp_path):
+    journal = tmp_path / 'tasks.jsonl'
+    tasks = server.TaskScheduler(str(journal), lambda command: finished({'status': 'success'}))
+    try:
+        # Held throughout, so the timer thread only looks at the journal once it has all the records
+        with tasks.condition:
+            for _ in range(server.TaskScheduler.MIN_COMPACT_RECORDS):
+                tasks.cancel(tasks.schedule({'type': 'system_info'}, at=time.time() + 3600)['id'])
+            live = tasks.schedule({'type': 'system_info'}, at=time.time() + 3600)
+            tasks.condition.notify()
+        deadline = time.time() + 5
+        while len(journal.read_text().splitlines()) > 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert [json.loads(line) for line in journal.read_text().splitlines()] == [{'op': 'add', 'task': live}]
+    finally:
+        tasks.stop()
+
+
+def put_chunk(agent, path, data, offset):
+    return agent.handle_file_put({'path': path, 'chunk': data, 'offset': offset,
+                                  'sha256': hashlib.sha256(data).hexdigest()})
+
+
+@pytest.fixture
+def agent():
+    # The file handlers need none of the agent's sockets or threads
+    return object.__new__(server.MCCServer)
+
+
+def test_file_put_chunks_out_of_order_then_commit(agent, tmp_path):
+    path = str(tmp_path / 'upload' / 'file.bin')
+    content = os.urandom(2500)
+    for offset in (2000, 0, 1000):
+        assert put_chunk(agent, path, content[offset:offset + 1000], offset)['status'] == 'success'
+
+    response = agent.handle_file_put({'path': path, 'commit': True, 'size': len(content),
+                                      'sha256': hashlib.sha256(content).hexdigest()})
+    assert response['status'] == 'success'
+    assert open(path, 'rb').read() == content
+    assert not os.path.exists(path + '.part')
+
+
+def test_file_put_rejects_a_corrupted_chunk(agent, tmp_path):
+    path = str(tmp_path / 'file.bin')
+    response = agent.handle_file_put({'path': path, 'chunk': b'data', 'offset': 0,
+                                      'sha256': hashlib.sha256(b'other').hexdigest()})
+    assert response['status'] == 'error'
+    assert not os.path.exists(path + '.part')
+
+
+def test_file_put_discards_a_part_with_the_wrong_checksum(agent, tmp_path):
+    path = str(tmp_path / 'file.bin')
+    put_chunk(agent, path, b'data', 0)
+
+    response = agent.handle_file_put({'path': path, 'commit': True, 'size': 4,
+                                      'sha256': hashlib.sha256(b'other').hexdigest()})
+    assert response['status'] == 'error'
+    assert not os.path.exists(path) and not os.path.exists(path + '.part')
+
+
+def test_file_put_reports_the_part_to_resume_from(agent, tmp_path):
+    path = str(tmp_path / 'file.bin')
+    assert agent.handle_file_put({'path': path})['data'] == {'received': 0}
+    put_chunk(agent, path, b'first chunk', 0)
+
+    assert agent.handle_file_put({'path': path})['data'] == {'received': 11}
+    assert agent.handle_file_put({'path': path, 'restart': True})['data'] == {'received': 0}
+
+
+def test_file_put_needs_an_absolute_path(agent):
+    assert put_chunk(agent, 'relative.bin', b'data', 0)['status'] == 'error'
+
+
+def test_file_get_reads_chunks_and_checksum(agent, tmp_path):
+    path = tmp_path / 'file.bin'
+    content = os.urandom(3000)
+    path.write_bytes(content)
+
+    response = agent.handle_file_get({'path': str(path), 'offset': 1000, 'length': 1500})
+    assert response['status'] == 'success'
+    assert base64.b64decode(response['data']['chunk']) == content[1000:2500]
+    assert response['data']['sha256'] == hashlib.sha256(content[1000:2500]).hexdigest()
+    assert response['data']['size'] == 3000
+
+    response = agent.handle_file_get({'path': str(path), 'offset': 2500, 'binary': True})
+    assert response['data']['chunk'] == content[2500:]
+
+    response = agent.handle_file_get({'path': str(path), 'checksum': True})
+    assert response['data']['sha256'] == hashlib.sha256(content).hexdigest()
+    assert 'chunk' not in response['data']